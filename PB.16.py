@@ -11,14 +11,20 @@ import numpy as np
 import uuid
 import csv
 import zipfile
+import zlib
+import json
+import pickle
+import tempfile
+import struct
 from io import BytesIO, StringIO
 import matplotlib.font_manager as font_manager
 import string
 import time
 import tkinter.simpledialog as simpledialog
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageColor, ImageDraw, ImageFont, ImageTk
 import networkx as nx
 from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 import webbrowser
 import platform
 import getpass
@@ -45,7 +51,1170 @@ class ArcState:
                 self.map_type == other.map_type and
                 self.arc_data == other.arc_data and
                 self.confirm_msg == other.confirm_msg)
-class MapMaker:
+class GlyphAtlas:
+    # Pre-rasterized map symbols, so a redraw pastes cached glyphs instead of laying out text per cell.
+    # Tiles are keyed by (symbol, color, cell_size) and hold the RGBA ink plus the glyph's coverage mask,
+    # which is what Pillow composites text with. Masks are shared between colors of the same glyph.
+    def __init__(self, symbols):
+        self.symbols = [sym for sym, desc in symbols]
+        self.fonts = {} # (family, size) -> FreeTypeFont
+        self.masks = {} # (symbol, cell_size) -> (mask, dx, dy) or None for blank glyphs
+        self.tiles = {} # (symbol, color, cell_size) -> (ink, mask, dx, dy) or None
+        self.built = set() # cell sizes with every palette symbol rasterized
+        self.measure = ImageDraw.Draw(Image.new('RGBA', (1, 1))) # for text bboxes outside a render
+    def clear(self):
+        self.masks = {}
+        self.tiles = {}
+        self.built = set()
+    def get_font(self, family, size):
+        key = (family, size)
+        if key not in self.fonts:
+            self.fonts[key] = ImageFont.truetype(font_manager.findfont(font_manager.FontProperties(family=family)), size)
+        return self.fonts[key]
+    def text_bbox(self, text, font):
+        return self.measure.textbbox((0, 0), text, font=font)
+    def symbol_font_size(self, cell_size):
+        base_size = 12
+        if 11 <= cell_size <= 25:
+            return base_size
+        return int(base_size * (cell_size / 20.0))
+    def build(self, cell_size):
+        for sym in self.symbols:
+            if (sym, cell_size) not in self.masks:
+                self.rasterize(sym, cell_size)
+        self.built.add(cell_size)
+    def rasterize(self, symbol, cell_size):
+        # Glyphs are centred on the cell like draw.text(anchor="mm") did and may overhang it at small
+        # zooms, so they are drawn on a canvas one cell wider on every side and cropped to their ink.
+        # (dx, dy) is the crop's offset from the cell's top-left pixel.
+        font = self.get_font('monospace', self.symbol_font_size(cell_size))
+        size = cell_size * 3
+        mask = Image.new('L', (size, size), 0)
+        ImageDraw.Draw(mask).text((cell_size + cell_size / 2, cell_size + cell_size / 2), symbol, fill=255, font=font, anchor="mm")
+        bbox = mask.getbbox()
+        entry = (mask.crop(bbox), bbox[0] - cell_size, bbox[1] - cell_size) if bbox else None
+        self.masks[(symbol, cell_size)] = entry
+        return entry
+    def get_tile(self, symbol, color, cell_size):
+        key = (symbol, color, cell_size)
+        if key not in self.tiles:
+            if cell_size not in self.built:
+                self.build(cell_size)
+            mask_key = (symbol, cell_size)
+            entry = self.masks[mask_key] if mask_key in self.masks else self.rasterize(symbol, cell_size)
+            self.tiles[key] = (ImageColor.getcolor(color, 'RGBA'),) + entry if entry else None
+        return self.tiles[key]
+class StringTable:
+    # Interned values of one text field. Ids are only ever appended, so grids copied from each other
+    # can keep sharing a table and cells still decode to the strings they were written with.
+    def __init__(self, length):
+        self.length = length # characters kept, like the 'U<length>' field it replaces
+        self.strings = []
+        self.ids = {}
+        self.decoded = None # strings as an array, rebuilt when the table grows
+    @classmethod
+    def from_strings(cls, length, strings):
+        table = cls(length)
+        for value in strings:
+            table.intern(value)
+        return table
+    def intern(self, value):
+        value = str(value)[:self.length]
+        if value not in self.ids:
+            self.ids[value] = len(self.strings)
+            self.strings.append(value)
+        return self.ids[value]
+    def intern_array(self, values):
+        values = np.asarray(values)
+        uniques, inverse = np.unique(values, return_inverse=True)
+        lookup = np.array([self.intern(value) for value in uniques.tolist()], dtype=np.int32)
+        return lookup[inverse].reshape(values.shape)
+    def translate(self, other, ids):
+        # ids of another table re-interned into this one
+        if other is self:
+            return ids
+        lookup = np.array([self.intern(value) for value in other.strings], dtype=np.int32)
+        return ids.translated(lookup) if isinstance(ids, ChunkedColumn) else lookup[ids]
+    def decode(self, ids):
+        if self.decoded is None or len(self.decoded) != len(self.strings):
+            self.decoded = np.array(self.strings, dtype=f'U{self.length}')
+        return self.decoded[ids]
+class MapCell:
+    # One cell of a MapGrid, read and written in place like a record of a structured array
+    __slots__ = ('grid', 'y', 'x')
+    def __init__(self, grid, y, x):
+        self.grid = grid
+        self.y = y
+        self.x = x
+    def __getitem__(self, name):
+        value = self.grid.columns[name][self.y, self.x]
+        table = self.grid.tables.get(name)
+        return table.strings[value] if table else value
+    def __setitem__(self, name, value):
+        table = self.grid.tables.get(name)
+        self.grid.columns[name][self.y, self.x] = table.intern(value) if table else value
+    def copy(self):
+        return {name: self[name] for name in self.grid.columns}
+class ChunkedColumn:
+    # One field of a huge MapGrid kept as SIZE x SIZE chunks in a dict. A chunk is allocated by the
+    # first write of anything but the fill value and dropped again once a block write leaves it all
+    # fill; a missing chunk reads as fill. Cells and fancy (ys, xs) indices are read and written chunk
+    # by chunk and a block of slices is a view sharing the chunks, like the 2-D array it stands in
+    # for. Anything else (masks, comparisons, NumPy functions) works on a dense copy of the view, so
+    # it is only meant for viewport-sized views.
+    SIZE = 64
+    ndim = 2
+    def __init__(self, dtype, fill, shape, chunks=None, origin=(0, 0), base=None):
+        self.dtype = np.dtype(dtype)
+        self.fill = self.dtype.type(fill)
+        self.shape = shape
+        self.chunks = {} if chunks is None else chunks # (cy, cx) -> SIZE x SIZE array
+        self.origin = origin # cell of the chunks at the view's top left
+        self.base = base # column a view was taken from, None for the column itself
+    @property
+    def nbytes(self):
+        return sum(block.nbytes for block in self.chunks.values())
+    def split(self, key):
+        # key as (rows, columns)
+        if key is Ellipsis:
+            key = ()
+        elif not isinstance(key, tuple):
+            key = (key,)
+        return tuple(key) + (slice(None),) * (2 - len(key))
+    def span(self, index, axis):
+        start, stop, step = index.indices(self.shape[axis])
+        if step != 1:
+            raise IndexError('ChunkedColumn slices take no step')
+        return start, max(start, stop)
+    def locate(self, y, x):
+        h, w = self.shape
+        if not (-h <= y < h and -w <= x < w):
+            raise IndexError(f'cell ({y}, {x}) is outside a column of shape {self.shape}')
+        y = self.origin[0] + int(y) % h
+        x = self.origin[1] + int(x) % w
+        return (y // self.SIZE, x // self.SIZE), y % self.SIZE, x % self.SIZE
+    def groups(self, ys, xs):
+        # chunk key and positions into ys, xs (in order) of every chunk the cells fall in
+        ys = np.asarray(ys, dtype=np.int64) + self.origin[0]
+        xs = np.asarray(xs, dtype=np.int64) + self.origin[1]
+        codes = ((ys // self.SIZE) << 32) | (xs // self.SIZE)
+        order = np.argsort(codes, kind='stable')
+        uniques, starts = np.unique(codes[order], return_index=True)
+        for code, start, stop in zip(uniques.tolist(), starts.tolist(), starts[1:].tolist() + [len(order)]):
+            yield (code >> 32, code & 0xffffffff), order[start:stop], ys[order[start:stop]] % self.SIZE, xs[order[start:stop]] % self.SIZE
+    def pieces(self):
+        # (view rows, view columns, chunk rows, chunk columns, key) of every stored chunk in the view
+        h, w = self.shape
+        if h <= 0 or w <= 0:
+            return
+        size = self.SIZE
+        oy, ox = self.origin
+        cy0, cy1, cx0, cx1 = oy // size, (oy + h - 1) // size + 1, ox // size, (ox + w - 1) // size + 1
+        if (cy1 - cy0) * (cx1 - cx0) < len(self.chunks):
+            keys = [(cy, cx) for cy in range(cy0, cy1) for cx in range(cx0, cx1) if (cy, cx) in self.chunks]
+        else:
+            keys = [(cy, cx) for cy, cx in self.chunks if cy0 <= cy < cy1 and cx0 <= cx < cx1]
+        for cy, cx in keys:
+            y0, y1 = max(oy, cy * size), min(oy + h, (cy + 1) * size)
+            x0, x1 = max(ox, cx * size), min(ox + w, (cx + 1) * size)
+            yield slice(y0 - oy, y1 - oy), slice(x0 - ox, x1 - ox), slice(y0 - cy * size, y1 - cy * size), slice(x0 - cx * size, x1 - cx * size), (cy, cx)
+    def allocate(self, key):
+        self.chunks[key] = np.full((self.SIZE, self.SIZE), self.fill, dtype=self.dtype)
+        return self.chunks[key]
+    def is_cell(self, rows, cols):
+        return isinstance(rows, (int, np.integer)) and isinstance(cols, (int, np.integer))
+    def is_fancy(self, rows, cols):
+        return all(not isinstance(i, (slice, int, np.integer)) and np.asarray(i).dtype.kind in 'iu' for i in (rows, cols))
+    def __getitem__(self, key):
+        rows, cols = self.split(key)
+        if self.is_cell(rows, cols):
+            key, y, x = self.locate(rows, cols)
+            block = self.chunks.get(key)
+            return self.fill if block is None else block[y, x]
+        if isinstance(rows, slice) and isinstance(cols, slice):
+            (y0, y1), (x0, x1) = self.span(rows, 0), self.span(cols, 1)
+            return ChunkedColumn(self.dtype, self.fill, (y1 - y0, x1 - x0), self.chunks, (self.origin[0] + y0, self.origin[1] + x0), self.base or self)
+        if self.is_fancy(rows, cols):
+            ys, xs = np.broadcast_arrays(rows, cols)
+            values = np.full(ys.shape, self.fill, dtype=self.dtype)
+            for key, at, y, x in self.groups(ys.ravel(), xs.ravel()):
+                if key in self.chunks:
+                    values.flat[at] = self.chunks[key][y, x]
+            return values
+        return np.asarray(self)[key]
+    def __setitem__(self, key, value):
+        rows, cols = self.split(key)
+        if self.is_cell(rows, cols):
+            key, y, x = self.locate(rows, cols)
+            block = self.chunks.get(key)
+            if block is None:
+                if value == self.fill:
+                    return
+                block = self.allocate(key)
+            block[y, x] = value
+        elif isinstance(rows, slice) and isinstance(cols, slice):
+            (y0, y1), (x0, x1) = self.span(rows, 0), self.span(cols, 1)
+            if not isinstance(value, ChunkedColumn):
+                value = np.broadcast_to(np.asarray(value, dtype=self.dtype), (y1 - y0, x1 - x0))
+            size = self.SIZE
+            oy, ox = self.origin[0] + y0, self.origin[1] + x0
+            for cy in range(oy // size, (oy + y1 - y0 - 1) // size + 1):
+                for cx in range(ox // size, (ox + x1 - x0 - 1) // size + 1):
+                    ay0, ay1 = max(oy, cy * size), min(oy + y1 - y0, (cy + 1) * size)
+                    ax0, ax1 = max(ox, cx * size), min(ox + x1 - x0, (cx + 1) * size)
+                    part = np.asarray(value[ay0 - oy:ay1 - oy, ax0 - ox:ax1 - ox])
+                    block = self.chunks.get((cy, cx))
+                    if block is None:
+                        if (part == self.fill).all():
+                            continue
+                        block = self.allocate((cy, cx))
+                    block[ay0 - cy * size:ay1 - cy * size, ax0 - cx * size:ax1 - cx * size] = part
+                    if (block == self.fill).all():
+                        del self.chunks[(cy, cx)]
+        elif self.is_fancy(rows, cols):
+            ys, xs = np.broadcast_arrays(rows, cols)
+            values = np.broadcast_to(np.asarray(value, dtype=self.dtype), ys.shape).ravel()
+            for key, at, y, x in self.groups(ys.ravel(), xs.ravel()):
+                block = self.chunks.get(key)
+                if block is None:
+                    if (values[at] == self.fill).all():
+                        continue
+                    block = self.allocate(key)
+                block[y, x] = values[at]
+        else:
+            dense = np.asarray(self)
+            dense[key] = value
+            self[...] = dense
+    def __array__(self, dtype=None, copy=None):
+        dense = np.full(self.shape, self.fill, dtype=self.dtype)
+        for rows, cols, block_rows, block_cols, key in self.pieces():
+            dense[rows, cols] = self.chunks[key][block_rows, block_cols]
+        return dense if dtype is None else dense.astype(dtype, copy=False)
+    def __eq__(self, other):
+        return np.asarray(self) == other
+    def __ne__(self, other):
+        return np.asarray(self) != other
+    def tolist(self):
+        return np.asarray(self).tolist()
+    def copy(self):
+        if self.base is None:
+            return ChunkedColumn(self.dtype, self.fill, self.shape, {key: block.copy() for key, block in self.chunks.items()})
+        column = ChunkedColumn(self.dtype, self.fill, self.shape)
+        column[...] = self
+        return column
+    def translated(self, lookup):
+        # copy with every value v replaced by lookup[v]
+        column = self if self.base is None else self.copy()
+        return ChunkedColumn(lookup.dtype, lookup[column.fill], column.shape, {key: lookup[block] for key, block in column.chunks.items()})
+    def edge_boxes(self):
+        # (x0, y0, x1, y1) boxes of the cells that can differ from their right or bottom neighbour:
+        # the stored chunks, and the last column and row of each blank chunk left of or above one
+        h, w = self.shape
+        size = self.SIZE
+        blank = set()
+        boxes = []
+        for cy, cx in self.chunks:
+            boxes.append((cx * size, cy * size, (cx + 1) * size, (cy + 1) * size))
+            blank.update(key for key in ((cy, cx - 1), (cy - 1, cx)) if min(key) >= 0 and key not in self.chunks)
+        for cy, cx in blank:
+            boxes.append(((cx + 1) * size - 1, cy * size, (cx + 1) * size, (cy + 1) * size))
+            boxes.append((cx * size, (cy + 1) * size - 1, (cx + 1) * size - 1, (cy + 1) * size))
+        for x0, y0, x1, y1 in boxes:
+            if x0 < w and y0 < h:
+                yield x0, y0, min(x1, w), min(y1, h)
+class MapGrid:
+    # Cell storage as one 2-D array per field instead of one wide structured record per cell. Numeric
+    # fields keep their dtype; text fields hold int32 ids into per-field StringTables, so a map of
+    # mostly blank cells costs a few bytes per field rather than the full width of every string.
+    # Indexing follows the structured array it replaces: grid[y, x]['field'] reads and writes a cell,
+    # grid['field'] is a whole field (text decoded to a string array) and grid[y0:y1, x0:x1] is a view.
+    # Huge maps keep each field as a ChunkedColumn instead, so blank regions take no memory at all.
+    def __init__(self, columns, tables):
+        self.columns = columns
+        self.tables = tables
+    @classmethod
+    def blank(cls, dtype, defaults, height, width, chunked=False):
+        columns = {}
+        tables = {}
+        for name in dtype.names:
+            field = dtype.fields[name][0]
+            if field.kind == 'U':
+                tables[name] = StringTable(field.itemsize // 4)
+                field, fill = np.dtype(np.int32), tables[name].intern(defaults[name])
+            else:
+                fill = defaults[name]
+            columns[name] = ChunkedColumn(field, fill, (height, width)) if chunked else np.full((height, width), fill, dtype=field)
+        return cls(columns, tables)
+    @property
+    def shape(self):
+        return next(iter(self.columns.values())).shape
+    @property
+    def nbytes(self):
+        return sum(column.nbytes for column in self.columns.values()) + sum(4 * sum(map(len, table.strings)) for table in self.tables.values())
+    @property
+    def chunked(self):
+        return isinstance(next(iter(self.columns.values())), ChunkedColumn)
+    def is_cell(self, key):
+        return isinstance(key, tuple) and all(isinstance(i, (int, np.integer)) for i in key)
+    def stored(self, name, value):
+        # value as it is stored in the field's column: the id of a text, -1 if it was never interned
+        table = self.tables.get(name)
+        return table.ids.get(str(value)[:table.length], -1) if table else value
+    def equals(self, name, value):
+        # mask of the cells whose field is value, compared by id so text fields aren't decoded
+        return self.columns[name] == self.stored(name, value)
+    def stored_cells(self, names, test):
+        # row-major (ys, xs) of the cells in the stored chunks of the named fields where test, given
+        # each field's chunk (or its fill where it has none), is True
+        size = ChunkedColumn.SIZE
+        h, w = self.shape
+        columns = [self.columns[name] for name in names]
+        found = []
+        for cy, cx in set().union(*(column.chunks for column in columns)):
+            mask = np.broadcast_to(test([column.chunks.get((cy, cx), column.fill) for column in columns]), (size, size))
+            ys, xs = np.nonzero(mask[:h - cy * size, :w - cx * size])
+            found.append((ys + cy * size) * w + xs + cx * size)
+        return np.divmod(np.sort(np.concatenate(found)) if found else np.zeros(0, dtype=np.int64), w)
+    def where(self, name, value):
+        # row-major (ys, xs) of the cells whose field is value
+        column, value = self.columns[name], self.stored(name, value)
+        if isinstance(column, ChunkedColumn) and column.base is None and value != column.fill:
+            return self.stored_cells((name,), lambda blocks: blocks[0] == value)
+        return np.nonzero(column == value)
+    def differing(self, values):
+        # row-major (ys, xs) of the cells where any field differs from its value in values
+        names = list(values)
+        stored = [self.stored(name, values[name]) for name in names]
+        if self.chunked and all(self.columns[name].base is None and self.columns[name].fill == value for name, value in zip(names, stored)):
+            # cells of missing chunks hold every fill, so only stored chunks can differ
+            return self.stored_cells(names, lambda blocks: np.any(np.broadcast_arrays(*(block != value for block, value in zip(blocks, stored))), axis=0))
+        mask = np.zeros(self.shape, dtype=bool)
+        for name, value in zip(names, stored):
+            mask |= self.columns[name] != value
+        return np.nonzero(mask)
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            table = self.tables.get(key)
+            return table.decode(self.columns[key]) if table else self.columns[key]
+        if self.is_cell(key):
+            return MapCell(self, *key)
+        return MapGrid({name: column[key] for name, column in self.columns.items()}, self.tables)
+    def __setitem__(self, key, value):
+        if isinstance(key, str):
+            table = self.tables.get(key)
+            if table:
+                value = table.intern(value) if isinstance(value, str) else table.intern_array(value)
+            self.columns[key][...] = value
+        elif self.is_cell(key):
+            cell = MapCell(self, *key)
+            for name in self.columns:
+                cell[name] = value[name]
+        else:
+            for name, column in self.columns.items():
+                table = self.tables.get(name)
+                column[key] = table.translate(value.tables[name], value.columns[name]) if table else value.columns[name]
+    def fill(self, key, values):
+        # sets each field of values ({field: value}) on every cell of key, a block of slices or a
+        # (ys, xs) pair of index arrays, with one column write per field
+        for name, value in values.items():
+            table = self.tables.get(name)
+            self.columns[name][key] = table.intern(value) if table else value
+    def copy(self):
+        return MapGrid({name: column.copy() for name, column in self.columns.items()}, self.tables)
+    def paste(self, ys, xs, other, oys, oxs):
+        # copies the cells (oys, oxs) of another grid into the cells (ys, xs) of this one
+        for name, column in self.columns.items():
+            table = self.tables.get(name)
+            values = other.columns[name][oys, oxs]
+            column[ys, xs] = table.translate(other.tables[name], values) if table else values
+class Selection:
+    # The selected cells of a map as a boolean mask over their bounding box, whose top-left cell is
+    # (x0, y0), so a selection costs a byte per cell of its extent rather than of the whole map and
+    # has no limit on how many rectangles make it up. combine adds, takes away or intersects one.
+    def __init__(self):
+        self.x0 = 0
+        self.y0 = 0
+        self.mask = np.zeros((0, 0), dtype=bool)
+    def __bool__(self):
+        return self.mask.size > 0
+    def count(self):
+        return int(np.count_nonzero(self.mask))
+    def bounds(self):
+        # (minx, miny, maxx, maxy) of the selected cells, None when there are none
+        if not self:
+            return None
+        h, w = self.mask.shape
+        return (self.x0, self.y0, self.x0 + w, self.y0 + h)
+    def combine(self, box, op='union'):
+        # op is 'replace', 'union', 'subtract' or 'intersect' with box, a (minx, miny, maxx, maxy) rectangle
+        minx, miny, maxx, maxy = box
+        if op == 'replace' or (op == 'union' and not self):
+            self.x0, self.y0 = minx, miny
+            self.mask = np.ones((maxy - miny, maxx - minx), dtype=bool)
+        elif op == 'union':
+            x0, y0 = min(self.x0, minx), min(self.y0, miny)
+            x1, y1 = max(self.x0 + self.mask.shape[1], maxx), max(self.y0 + self.mask.shape[0], maxy)
+            mask = np.zeros((y1 - y0, x1 - x0), dtype=bool)
+            mask[self.y0 - y0:self.y0 - y0 + self.mask.shape[0], self.x0 - x0:self.x0 - x0 + self.mask.shape[1]] = self.mask
+            mask[miny - y0:maxy - y0, minx - x0:maxx - x0] = True
+            self.x0, self.y0, self.mask = x0, y0, mask
+        else:
+            # box clipped to the mask
+            h, w = self.mask.shape
+            inside = (slice(min(max(miny - self.y0, 0), h), min(max(maxy - self.y0, 0), h)), slice(min(max(minx - self.x0, 0), w), min(max(maxx - self.x0, 0), w)))
+            if op == 'subtract':
+                self.mask[inside] = False
+            else:
+                kept = self.mask[inside].copy()
+                self.mask[...] = False
+                self.mask[inside] = kept
+        self.trim()
+    def trim(self):
+        # shrinks the mask to the bounding box of its selected cells
+        rows = np.flatnonzero(self.mask.any(axis=1))
+        if not len(rows):
+            self.x0, self.y0, self.mask = 0, 0, np.zeros((0, 0), dtype=bool)
+            return
+        cols = np.flatnonzero(self.mask.any(axis=0))
+        self.mask = self.mask[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1]
+        self.x0 += int(cols[0])
+        self.y0 += int(rows[0])
+    def cells(self):
+        # row-major (ys, xs) of the selected cells, as int32
+        rows, cols = np.nonzero(self.mask)
+        return rows.astype(np.int32) + self.y0, cols.astype(np.int32) + self.x0
+    def edges(self):
+        # (x0, y0, x1, y1) cell-corner segments of the selection's outline, one per straight run of
+        # border between a selected and an unselected cell
+        padded = np.pad(self.mask, 1)
+        segments = []
+        for axis, across in ((0, padded[1:, 1:-1] != padded[:-1, 1:-1]), (1, (padded[1:-1, 1:] != padded[1:-1, :-1]).T)):
+            # across[i, j]: border along line i at cell j, runs found as the rises and falls along j
+            runs = np.diff(np.pad(across, ((0, 0), (1, 1))).astype(np.int8), axis=1)
+            lines, starts = np.nonzero(runs == 1)
+            stops = np.nonzero(runs == -1)[1]
+            for line, start, stop in zip(lines.tolist(), starts.tolist(), stops.tolist()):
+                if axis == 0:
+                    segments.append((self.x0 + start, self.y0 + line, self.x0 + stop, self.y0 + line))
+                else:
+                    segments.append((self.x0 + line, self.y0 + start, self.x0 + line, self.y0 + stop))
+        return segments
+class TmapFooterReader:
+    # Single pass over the footer of a .tmap file, i.e. everything after the map rows: the type; name;
+    # maker; system fields followed by the mapc[!], arcs:: and section_colors: sections. The file is read
+    # in chunks and every record is matched where the previous one ended, so the footer is never joined
+    # into one string. Quoted fields are matched up to their closing quote, which lets names, textures
+    # and colours contain ';'. Cell properties and tints are collected into NumPy column buffers and
+    # written to the grid in bulk.
+    SECTION = re.compile(r'mapc\[!\]|;?arcs::|section_colors:')
+    PROP = re.compile(r' *?(.)\["([^"]*)";"([^"]*)";"([^"]*)";([A-Z]{2})?\((\d+),(-?\d+),(\d+),(-?\d+),(-?\d+),?(-?\d*\.?\d*(?:[eE][-+]?\d+)?)\)'
+                      r'(?:\+t\(\d+,\d+\))?(?:\+o\(\d+,\d+\))?(-?\d+)?(?:;earmark=([^;\]&]*))?(&?)\]')
+    ARC = re.compile(r';?([^|]*)\|\|([^|]*)\|\|([^|]*)\|\|([^|]*)\|\|([^|]*)\|\|([^|]*)\|\|(.*?) *(?=;|section_colors:|$)')
+    BLANK = re.compile(r'[ ;]*')
+    TINT = re.compile(r'[; ]*([^,;\[]+),([0-9.eE+-]+)\[(\d+),(\d+)\]')
+    # id and integer columns of a property record; range is kept in its own float buffer
+    PROP_FIELDS = ('symbol', 'color', 'name', 'texture', 'sun', '3d', 'depth', 'height', 'value', 'earmark', 'title_card')
+    class FieldIds(dict):
+        # field text as written in the file -> id in the grid's StringTable, interned on first sight
+        def __init__(self, table):
+            self.table = table
+        def __missing__(self, value):
+            self[value] = self.table.intern(value)
+            return self[value]
+    def __init__(self, f, chunk_size=1 << 16):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+    def ensure(self, n):
+        # at least n unread characters buffered, unless the file ends first
+        while not self.eof and len(self.buf) - self.pos < n:
+            chunk = self.f.read(self.chunk_size)
+            if not chunk:
+                self.eof = True
+            # footer lines were always joined with spaces
+            self.buf = self.buf[self.pos:] + chunk.replace('\n', ' ')
+            self.pos = 0
+        return len(self.buf) - self.pos
+    def at_section_end(self):
+        # only separators left before the next section or the end of the file
+        while True:
+            self.ensure(1024)
+            end = self.BLANK.match(self.buf, self.pos).end()
+            if end < len(self.buf) or self.eof:
+                return end == len(self.buf) or self.SECTION.match(self.buf, end) is not None
+            self.pos = end
+    def skip_to(self, delimiter):
+        # drop a record that didn't parse, stopping early at a section marker
+        self.ensure(1024)
+        end = self.buf.find(delimiter, self.pos)
+        end = end + 1 if end != -1 else len(self.buf)
+        section = self.SECTION.search(self.buf, self.pos + 1, end)
+        self.pos = section.start() if section else end
+    def read_header(self):
+        self.ensure(4096)
+        section = self.SECTION.search(self.buf, self.pos)
+        end = section.start() if section else len(self.buf)
+        header = self.buf[self.pos:end]
+        self.pos = end
+        return header.split(';')
+    def read_sections(self, map_data, grid):
+        arcs = []
+        while self.ensure(16):
+            self.pos = self.BLANK.match(self.buf, self.pos).end()
+            if self.pos == len(self.buf):
+                continue
+            section = self.SECTION.match(self.buf, self.pos)
+            if not section:
+                self.skip_to(';')
+            elif section.group().startswith('mapc'):
+                self.pos = section.end()
+                self.read_props(map_data, grid)
+            elif section.group().endswith('arcs::'):
+                self.pos = section.end()
+                arcs.extend(self.read_arcs())
+            else:
+                self.pos = section.end()
+                self.read_tints(map_data, grid)
+        return arcs
+    def read_props(self, map_data, grid):
+        width, height = map_data['width'], map_data['height']
+        symbols, colors, names, textures, suns, earmarks, titles = (self.FieldIds(grid.tables[name]) for name in ('symbol', 'color', 'name', 'texture', 'sun', 'earmark', 'title_card'))
+        # empty or missing groups stand for the field defaults
+        colors[''] = colors['#000000']
+        suns[None] = suns['NA']
+        earmarks[None] = earmarks[''] = earmarks['Normal']
+        titles[''], titles['&'] = titles['OFF'], titles['ON']
+        capacity = max(1, min(width * height, 4096))
+        cells = np.empty((capacity, 2 + len(self.PROP_FIELDS)), dtype=np.int32) # y, x, then PROP_FIELDS
+        ranges = np.empty(capacity, dtype=np.float32)
+        n = 0
+        match = self.PROP.match
+        while True:
+            if len(self.buf) - self.pos < 1024:
+                self.ensure(1024)
+            m = match(self.buf, self.pos)
+            if not m:
+                if self.at_section_end():
+                    break
+                self.skip_to(']')
+                continue
+            self.pos = m.end()
+            sym, color, name, texture, sun, x, threed, y, d, h, r, val, earmark, title = m.groups()
+            x, y = int(x), int(y)
+            if x >= width or y >= height:
+                continue
+            if n == capacity:
+                capacity *= 2
+                cells = np.resize(cells, (capacity, cells.shape[1]))
+                ranges = np.resize(ranges, capacity)
+            cells[n] = (y, x, symbols[sym], colors[color], names[name], textures[texture], suns[sun],
+                        int(threed), int(d), int(h), int(val) if val else 0, earmarks[earmark], titles[title])
+            ranges[n] = float(r) if r.strip('.') else 0.0
+            n += 1
+        ys, xs = cells[:n, 0], cells[:n, 1]
+        for i, name in enumerate(self.PROP_FIELDS):
+            grid.columns[name][ys, xs] = cells[:n, i + 2]
+        grid.columns['range'][ys, xs] = ranges[:n]
+    def read_arcs(self):
+        arcs = []
+        while self.ensure(1 << 16):
+            if self.at_section_end():
+                break
+            m = self.ARC.match(self.buf, self.pos)
+            if m:
+                self.pos = m.end()
+                arcs.append(m.groups())
+            else:
+                self.skip_to(';')
+        return arcs
+    def read_tints(self, map_data, grid):
+        width, height = map_data['width'], map_data['height']
+        tint_ids = self.FieldIds(grid.tables['tint_color'])
+        capacity = max(1, min(width * height, 4096))
+        positions = np.empty((capacity, 2), dtype=np.int64)
+        tints = np.empty(capacity, dtype=np.int32)
+        opacities = np.empty(capacity, dtype=np.float32)
+        n = 0
+        while True:
+            self.ensure(1024)
+            m = self.TINT.match(self.buf, self.pos)
+            if not m:
+                end = self.BLANK.match(self.buf, self.pos).end()
+                if self.buf.startswith('[end-section]', end):
+                    self.pos = end + 13
+                    break
+                if self.at_section_end():
+                    break
+                self.skip_to(';')
+                continue
+            self.pos = m.end()
+            item, opacity, x, y = m.groups()
+            x, y = int(x), int(y)
+            if x >= width or y >= height:
+                continue
+            opacity = float(opacity)
+            if item.startswith('#'):
+                tint_color = item
+            elif item in map_data['named_colors']:
+                tint_color, _ = map_data['named_colors'][item]
+                map_data['cell_tints'][(x, y)] = item
+            else:
+                tint_color = '#000000'
+                opacity = 0.0
+            if n == capacity:
+                capacity *= 2
+                positions = np.resize(positions, (capacity, 2))
+                tints = np.resize(tints, capacity)
+                opacities = np.resize(opacities, capacity)
+            positions[n] = (y, x)
+            tints[n] = tint_ids[tint_color]
+            opacities[n] = opacity
+            n += 1
+        ys, xs = positions[:n, 0], positions[:n, 1]
+        grid.columns['tint_color'][ys, xs] = tints[:n]
+        grid.columns['tint_opacity'][ys, xs] = opacities[:n]
+class TmapParser:
+    # Reads a .tmap file into the values of a map (grid, size, header and footer fields, cell tints
+    # and arcs) without touching Tk, so dictionary loads can parse their maps in worker processes.
+    # Instances are picklable and are called with the file's path; an empty file gives None.
+    def __init__(self, dtype, defaults, chunked_cells, named_colors):
+        self.dtype = dtype
+        self.defaults = defaults
+        self.chunked_cells = chunked_cells
+        self.named_colors = named_colors
+    def __call__(self, file):
+        with open(file, 'r') as f:
+            first_line = f.readline()
+            if not first_line:
+                return None
+            map_data = {'view': 'Z=Z', 'sunrise': None, 'sunset': None, 'pin_at': None, 'pin_to': None, 'named_colors': self.named_colors.copy(), 'cell_tints': {}}
+            header = first_line.strip()
+            view_match = re.search(r' view (Y=Z|Z=Z|XY=Z|XYZ=Z)', header)
+            if view_match:
+                map_data['view'] = view_match.group(1)
+                header = header[:view_match.start()].strip() + header[view_match.end():].strip()
+            sunrise_match = re.search(r'sunrise xy\((\d+),(\d+)\); sunset xy\((\d+),(\d+)\)', header)
+            if sunrise_match:
+                map_data['sunrise'] = (int(sunrise_match.group(1)), int(sunrise_match.group(2)))
+                map_data['sunset'] = (int(sunrise_match.group(3)), int(sunrise_match.group(4)))
+                header = header[:sunrise_match.start()].strip()
+            pin_at_match = re.search(r'Pin At\((\d+),(\d+)\)', header)
+            if pin_at_match:
+                map_data['pin_at'] = (int(pin_at_match.group(1)), int(pin_at_match.group(2)))
+                header = header[:pin_at_match.start()].strip()
+            pin_to_match = re.search(r'Pin To\((\d+),(\d+)\)', header)
+            if pin_to_match:
+                map_data['pin_to'] = (int(pin_to_match.group(1)), int(pin_to_match.group(2)))
+                header = header[:pin_to_match.start()].strip()
+            parts = header.split()
+            openings = parts[0]
+            if len(openings) < 7: openings = openings.ljust(7, '0')
+            map_data['openings'] = openings
+            size = parts[1]
+            width, height = map(int, size.split('x'))
+            map_data['width'] = width
+            map_data['height'] = height
+            grid = MapGrid.blank(self.dtype, self.defaults, height, width, height * width > self.chunked_cells)
+            # the map rows are padded or cut to the width and decoded as UTF-32 blocks of up to 1024 rows
+            for y0 in range(0, height, 1024):
+                y1 = min(y0 + 1024, height)
+                rows = ''.join(f.readline().rstrip()[:width].ljust(width) for y in range(y0, y1))
+                grid[y0:y1]['symbol'] = np.frombuffer(rows.encode('utf-32-le'), dtype='<U1').reshape(y1 - y0, width)
+            map_data['grid'] = grid
+            # the footer is streamed from the rest of the file
+            reader = TmapFooterReader(f)
+            footer_parts = reader.read_header()
+            map_data['type'] = footer_parts[0].strip() if len(footer_parts) > 0 else 'Safe'
+            map_data['name'] = footer_parts[1].strip() if len(footer_parts) > 1 else 'Loaded Map'
+            map_data['maker'] = footer_parts[2].strip() if len(footer_parts) > 2 else 'User'
+            map_data['arcs'] = []
+            for parts in reader.read_sections(map_data, grid):
+                start_msg = parts[3].strip("***") if parts[3] != "" else "Start Message"
+                confirm_msg = parts[6].strip("***") if parts[6] != "" else "Confirm Message"
+                map_data['arcs'].append({
+                    'name': parts[0],
+                    'estimated': parts[1],
+                    'zone_type': parts[2],
+                    'start_msg': start_msg,
+                    'map': parts[4],
+                    'arc_data': parts[5],
+                    'confirm_msg': confirm_msg
+                })
+            if map_data['sunrise']:
+                sx, sy = map_data['sunrise']
+                grid[sy, sx]['sun'] = 'SR'
+            if map_data['sunset']:
+                sx, sy = map_data['sunset']
+                grid[sy, sx]['sun'] = 'SS'
+        return map_data
+class UndoEntry:
+    # One undo or redo step as UndoHistory keeps it: the ('full', grid) or ('delta', ...) item itself,
+    # its zlib-compressed pickle, or the (offset, length) of that pickle in the spill file
+    __slots__ = ('stack', 'item', 'packed', 'span', 'nbytes')
+    def __init__(self, stack, item, nbytes):
+        self.stack = stack # the stack holding the step, None once it has left it
+        self.item = item
+        self.packed = None
+        self.span = None
+        self.nbytes = nbytes # bytes the step takes in its current form
+class UndoHistory:
+    # Undo and redo steps of every map under one memory budget instead of a count per stack. The
+    # newest steps stay as they are while they fit in recent_bytes and older ones are kept compressed;
+    # once the two together pass budget_bytes the oldest go to a temporary spill file, and the oldest
+    # of those are dropped when it holds more than spill_bytes. Stacks hold the UndoEntry objects
+    # add() makes; steps leave them through pop() and clear(), so the history keeps running totals
+    # and every step changes form at most three times. Steps only move to an older form oldest first,
+    # so the live, packed and spilled queues each stay in age order and whatever is dropped sits at
+    # the bottom of its stack.
+    def __init__(self, budget_bytes, recent_bytes, spill_bytes):
+        self.budget_bytes = budget_bytes
+        self.recent_bytes = recent_bytes
+        self.spill_bytes = spill_bytes
+        self.live = deque()
+        self.packed = deque()
+        self.spilled = deque()
+        self.live_bytes = 0
+        self.packed_bytes = 0
+        self.spilled_bytes = 0
+        self.gone = 0 # entries that left their stack but still sit in a queue
+        self.spill = None
+    def item_bytes(self, item):
+        if item[0] == 'full':
+            return item[1].nbytes
+        return item[1].nbytes + item[2].nbytes + sum(values.nbytes for values in item[3].values())
+    def add(self, stack, item):
+        entry = UndoEntry(stack, item, self.item_bytes(item))
+        stack.append(entry)
+        self.live.append(entry)
+        self.live_bytes += entry.nbytes
+        self.trim()
+    def load(self, entry):
+        if entry.item is not None:
+            return entry.item
+        packed = entry.packed
+        if packed is None:
+            offset, length = entry.span
+            self.spill.seek(offset)
+            packed = self.spill.read(length)
+        return pickle.loads(zlib.decompress(packed))
+    def pop(self, stack):
+        # the item of the step on top of stack, taken off it
+        entry = stack.pop()
+        item = self.load(entry)
+        self.forget(entry)
+        return item
+    def clear(self, stack):
+        for entry in stack:
+            self.forget(entry)
+        stack.clear()
+    def forget(self, entry):
+        # takes a step that left its stack out of the totals; its queue drops it when it gets there
+        if entry.item is not None:
+            self.live_bytes -= entry.nbytes
+        elif entry.packed is not None:
+            self.packed_bytes -= entry.nbytes
+        elif entry.span is not None:
+            self.spilled_bytes -= entry.span[1]
+        entry.stack = entry.item = entry.packed = entry.span = None
+        self.gone += 1
+        if self.gone > len(self.live) + len(self.packed) + len(self.spilled) - self.gone:
+            for queue in (self.live, self.packed, self.spilled):
+                kept = [entry for entry in queue if entry.stack is not None]
+                queue.clear()
+                queue.extend(kept)
+            self.gone = 0
+    def oldest(self, queue):
+        # oldest entry of queue still on a stack, None if there is none
+        while queue and queue[0].stack is None:
+            queue.popleft()
+            self.gone -= 1
+        return queue[0] if queue else None
+    def trim(self):
+        while self.live_bytes > self.recent_bytes:
+            entry = self.oldest(self.live)
+            self.live.popleft()
+            self.live_bytes -= entry.nbytes
+            entry.packed = zlib.compress(pickle.dumps(entry.item, pickle.HIGHEST_PROTOCOL), 1)
+            entry.item = None
+            entry.nbytes = len(entry.packed)
+            self.packed.append(entry)
+            self.packed_bytes += entry.nbytes
+        while self.live_bytes + self.packed_bytes > self.budget_bytes and self.oldest(self.packed):
+            entry = self.packed.popleft()
+            self.packed_bytes -= entry.nbytes
+            if self.spill is None:
+                self.spill = tempfile.TemporaryFile()
+            self.spill.seek(0, os.SEEK_END)
+            entry.span = (self.spill.tell(), len(entry.packed))
+            self.spill.write(entry.packed)
+            entry.packed = None
+            self.spilled.append(entry)
+            self.spilled_bytes += entry.span[1]
+        while self.spilled_bytes > self.spill_bytes:
+            entry = self.oldest(self.spilled)
+            # older steps of its stack were dropped before it, so it is the bottom one
+            entry.stack.pop(0)
+            self.forget(entry)
+        # steps that were undone or dropped leave holes in the spill file, so it is rewritten with
+        # just the spilled steps still held once the holes make up half of it
+        if self.spill is not None and self.spill.seek(0, os.SEEK_END) > 2 * self.spilled_bytes:
+            compacted = tempfile.TemporaryFile()
+            for entry in self.spilled:
+                if entry.stack is not None:
+                    self.spill.seek(entry.span[0])
+                    packed = self.spill.read(entry.span[1])
+                    entry.span = (compacted.tell(), len(packed))
+                    compacted.write(packed)
+            self.spill.close()
+            self.spill = compacted
+class MapRenderer:
+    # Draws map images from map_data alone (grid, tints, symbols, sun and pin marks, title cards and
+    # height borders) at cell_size pixels per cell. MapMaker draws its canvases through it, and the
+    # PNG exports hand a copy to worker processes, which rebuild the glyph atlas rather than unpickle it.
+    def __init__(self, symbols, cell_size, title_cards_hidden=False):
+        self.symbols = symbols
+        self.cell_size = cell_size
+        self.title_cards_hidden = title_cards_hidden
+        self.glyph_atlas = GlyphAtlas(symbols)
+        self.border_styles = [self.get_border_style(diff) for diff in range(101)]
+    def __getstate__(self):
+        return (self.symbols, self.cell_size, self.title_cards_hidden)
+    def __setstate__(self, state):
+        self.__init__(*state)
+    def composite_grid_and_tints(self, map_data, bounds, origin, size):
+        # Returns the grid lines and cell tints for the cells in bounds as an RGBA uint8 array.
+        # Every cell block is uniform apart from the grid lines on its top and left edge, so each
+        # cell is blended twice (over the background and over a line) and then broadcast into place.
+        # The blend is the same integer math Image.paste uses with an alpha mask.
+        cs = self.cell_size
+        bx0, by0, bx1, by1 = bounds
+        ox, oy = origin
+        width, height = size
+        background = np.array((255, 255, 255, 0), dtype=np.uint32)
+        gray = np.array((128, 128, 128, 255), dtype=np.uint32)
+        window = map_data['grid'][by0:by1, bx0:bx1]
+        tint_colors = window['tint_color']
+        tinted = (tint_colors != '') & (tint_colors != '#000000')
+        src = np.zeros(window.shape + (4,), dtype=np.uint32)
+        alpha = np.zeros(window.shape + (1,), dtype=np.uint32)
+        if tinted.any():
+            names, inverse = np.unique(tint_colors[tinted], return_inverse=True)
+            table = np.array([ImageColor.getrgb(name)[:3] for name in names], dtype=np.uint32)
+            src[tinted, :3] = table[inverse.ravel()]
+            opacity = window['tint_opacity'][tinted].astype(np.float64)
+            alpha[tinted, 0] = np.clip((opacity * 255).astype(np.int64), 0, 255)
+            src[..., 3:] = alpha
+        # pixels are handled as packed uint32 values so fills and broadcasts move whole pixels
+        def pack(rgba):
+            return np.ascontiguousarray(rgba, dtype=np.uint8).view(np.uint32)[..., 0]
+        def blend(dst):
+            mixed = dst * (255 - alpha) + src * alpha + 128
+            return pack(((mixed >> 8) + mixed) >> 8)
+        over_background = blend(background)
+        over_line = blend(gray)
+        background, gray = pack(background), pack(gray)
+        rows, cols = window.shape
+        block = np.empty((rows * cs, cols * cs), dtype=np.uint32)
+        cells = block.reshape(rows, cs, cols, cs)
+        cells[...] = over_background[:, None, :, None]
+        cells[:, 0] = over_line[:, :, None]
+        cells[:, :, :, 0] = over_line[:, None, :]
+        arr = np.empty((height, width), dtype=np.uint32)
+        arr[...] = background
+        # place the blocks, clipped to the region, then close the grid on the right and bottom
+        top, left = by0 * cs + 1 - oy, bx0 * cs + 1 - ox
+        bottom, right = top + rows * cs, left + cols * cs
+        r0, r1 = max(0, top), min(height, bottom)
+        c0, c1 = max(0, left), min(width, right)
+        arr[r0:r1, c0:c1] = block[r0 - top:r1 - top, c0 - left:c1 - left]
+        if right < width:
+            arr[r0:min(height, bottom + 1), right] = gray
+        if bottom < height:
+            arr[bottom, c0:min(width, right + 1)] = gray
+        return arr.view(np.uint8).reshape(height, width, 4)
+    def render_map_region(self, map_data, x0, y0, x1, y1, diff_edges=None):
+        # Renders cells [x0, x1) x [y0, y1) exactly as they appear in the full map image, which is
+        # the region (0, 0, width, height). Neighbouring cells are drawn too since their glyphs,
+        # outlines and height borders bleed a few pixels into the region.
+        w = map_data['width']
+        h = map_data['height']
+        cs = self.cell_size
+        origin = (x0 * cs, y0 * cs)
+        ox, oy = origin
+        size = ((x1 - x0) * cs + 2, (y1 - y0) * cs + 2)
+        bounds = (max(0, x0 - 1), max(0, y0 - 1), min(w, x1 + 1), min(h, y1 + 1))
+        bx0, by0, bx1, by1 = bounds
+        # grid lines and tints are composited as one array, so painted cells cost no more than empty ones
+        img = Image.fromarray(self.composite_grid_and_tints(map_data, bounds, origin, size))
+        draw = ImageDraw.Draw(img)
+        window = map_data['grid'][by0:by1, bx0:bx1]
+        # draw symbols from the glyph atlas, skipping blank cells
+        symbols = window['symbol']
+        colors = window['color']
+        for wy, wx in zip(*np.nonzero(symbols != ' ')):
+            color = colors[wy, wx] or '#000000'
+            tile = self.glyph_atlas.get_tile(symbols[wy, wx], color, cs)
+            if tile:
+                ink, mask, dx, dy = tile
+                img.paste(ink, ((bx0 + wx) * cs + 1 + dx - ox, (by0 + wy) * cs + 1 + dy - oy), mask)
+        # sun and pin rects
+        for key, outline in (('sunrise', 'orange'), ('sunset', 'red'), ('pin_at', 'blue'), ('pin_to', 'brown')):
+            if map_data[key]:
+                px, py = map_data[key]
+                draw.rectangle((px * cs + 1 - ox, py * cs + 1 - oy, (px + 1) * cs + 1 - ox, (py + 1) * cs + 1 - oy), outline=outline, width=2)
+        # title cards
+        if (x0, y0, x1, y1) == (0, 0, w, h):
+            self.draw_title_cards(draw, map_data)
+        else:
+            self.draw_title_cards(draw, map_data, bounds, origin)
+        # Height visualization and dither
+        if diff_edges is None:
+            diff_edges = self.count_height_edges(map_data['grid']['height'])
+        self.draw_height_borders_and_dither(draw, map_data, self.get_overcrowd_factor(w, h, diff_edges), bounds, origin)
+        return img
+    def height_steps(self, heights, x0=0, y0=0, x1=None, y1=None):
+        # Absolute height change to the right [..., 0] and bottom [..., 1] neighbour of every cell
+        # in [x0, x1) x [y0, y1); 0 where the neighbour is level or off the map
+        h, w = heights.shape
+        x1 = w if x1 is None else x1
+        y1 = h if y1 is None else y1
+        block = np.asarray(heights[y0:min(h, y1 + 1), x0:min(w, x1 + 1)], dtype=np.int64)
+        steps = np.zeros((y1 - y0, x1 - x0, 2), dtype=np.int64)
+        right = np.abs(np.diff(block[:y1 - y0], axis=1))
+        bottom = np.abs(np.diff(block[:, :x1 - x0], axis=0))
+        steps[:, :right.shape[1], 0] = right
+        steps[:bottom.shape[0], :, 1] = bottom
+        return steps
+    def count_height_edges(self, heights, x0=0, y0=0, x1=None, y1=None):
+        # Counts height changes to the right/bottom neighbour of every cell in [x0, x1) x [y0, y1),
+        # a band of about a million cells at a time
+        if isinstance(heights, ChunkedColumn) and heights.base is None and (x0, y0, x1, y1) == (0, 0, None, None):
+            return sum(self.count_height_edges(heights, *box) for box in heights.edge_boxes())
+        h, w = heights.shape
+        x1 = w if x1 is None else x1
+        y1 = h if y1 is None else y1
+        band = max(1, (1 << 20) // max(x1 - x0, 1))
+        return sum(int(np.count_nonzero(self.height_steps(heights, x0, y, x1, min(y + band, y1)))) for y in range(y0, y1, band))
+    def tile_height_edges(self, heights, tile):
+        # count_height_edges of every tile x tile block of cells, as a (rows, columns) array. Counted a
+        # band of tiles at a time and, for a chunked column, only in the tiles its edge_boxes reach
+        h, w = heights.shape
+        counts = np.zeros((-(-h // tile), -(-w // tile)), dtype=np.int64)
+        boxes = [(0, 0, w, h)]
+        if isinstance(heights, ChunkedColumn) and heights.base is None:
+            boxes = set()
+            for x0, y0, x1, y1 in heights.edge_boxes():
+                x0, y0, x1, y1 = x0 // tile * tile, y0 // tile * tile, min(-(-x1 // tile) * tile, w), min(-(-y1 // tile) * tile, h)
+                if x1 - x0 > tile and y1 - y0 > tile:
+                    boxes.add((x0, y0, x1, y1))
+                else:
+                    # a strip of a blank chunk, split into tiles so strips sharing a corner tile count it once
+                    boxes.update((tx, ty, min(tx + tile, w), min(ty + tile, h)) for ty in range(y0, y1, tile) for tx in range(x0, x1, tile))
+        for x0, y0, x1, y1 in boxes:
+            band = max(1, (1 << 20) // (x1 - x0) // tile) * tile
+            for b0 in range(y0, y1, band):
+                b1 = min(b0 + band, y1)
+                cells = np.count_nonzero(self.height_steps(heights, x0, b0, x1, b1), axis=2)
+                cells = np.pad(cells, ((0, -(b1 - b0) % tile), (0, -(x1 - x0) % tile)))
+                counts[b0 // tile:-(-b1 // tile), x0 // tile:-(-x1 // tile)] += cells.reshape(cells.shape[0] // tile, tile, cells.shape[1] // tile, tile).sum(axis=(1, 3))
+        return counts
+    def get_overcrowd_factor(self, w, h, num_diff_edges):
+        default_size = 48 * 24
+        default_limit = 9
+        limit = max(1, int((w * h / default_size) * default_limit))
+        if num_diff_edges > limit:
+            return limit / num_diff_edges * 0.8 # Reduce to 80% at max overcrowd
+        return 1.0
+    def draw_height_borders_and_dither(self, draw, map_data, overcrowd_factor, bounds=None, origin=(0, 0)):
+        h = map_data['height']
+        w = map_data['width']
+        cell_size = self.cell_size
+        x0, y0, x1, y1 = bounds if bounds else (0, 0, w, h)
+        ox, oy = origin
+        steps = self.height_steps(map_data['grid']['height'], x0, y0, x1, y1)
+        ys, xs, sides = np.nonzero(steps)
+        if not len(ys):
+            return
+        # get_border_style is flat past a difference of 100, so styles come from a table of 101 bins
+        styles = [(int(thickness * overcrowd_factor), color) for thickness, color in self.border_styles]
+        diffs = np.minimum(steps[ys, xs, sides], len(styles) - 1)
+        # every border ends at the bottom-right corner of its cell; right borders start at the
+        # top-right corner and bottom borders at the bottom-left one
+        left = (xs + x0) * cell_size + 1 - ox
+        top = (ys + y0) * cell_size + 1 - oy
+        start_x = left + cell_size * (1 - sides)
+        start_y = top + cell_size * sides
+        # Draw lines between different heights, still in cell order since overlapping corners
+        # take the colour of whichever border was drawn last
+        for diff, sx, sy, ex, ey in zip(diffs.tolist(), start_x.tolist(), start_y.tolist(), (left + cell_size).tolist(), (top + cell_size).tolist()):
+            thickness, color = styles[diff]
+            draw.line(((sx, sy), (ex, ey)), fill=color, width=thickness)
+    def get_border_style(self, diff):
+        # Adjusted based on user description
+        # Thinner for larger diff, thicker for smaller
+        # Base thickness from 1.6 for small diff, down to 1.1 for large
+        base_thick = 6 # max pixel thickness
+        min_thick_factor = 1.1
+        max_thick_factor = 1.6
+        # Normalize diff, assume max reasonable diff is 100 or something
+        norm_diff = min(diff / 100, 1.0)
+        # Thicker for small diff (low norm_diff), thinner for large
+        thick_factor = max_thick_factor - (max_thick_factor - min_thick_factor) * norm_diff
+        thickness = int(base_thick * thick_factor)
+        thickness = max(1, min(thickness, base_thick))
+        # Colors as per
+        if diff < 5:
+            color = 'purple' # jumpable
+        elif diff < 10:
+            color = 'blue' # double jump
+        elif diff < 20:
+            color = 'darkblue' # not jumpable
+        elif diff < 33:
+            color = 'orange' # injury possible
+        elif diff < 50:
+            color = 'brown' # death may happen
+        else:
+            color = 'red' # death will happen
+        return thickness, color
+    def get_title_layout(self, map_data):
+        # Where every title card goes, as ('outline', x, y) for unnamed or hidden cards and
+        # ('title', name, title_x, title_y, text_w, text_h) in full-map pixels for named ones.
+        # Cached in map_data until a title card changes or invalidate_title_layout sees an edit
+        # in a column one of the titles was checked against.
+        h = map_data['height']
+        w = map_data['width']
+        grid = map_data['grid']
+        cell_size = self.cell_size
+        ys, xs = grid.where('title_card', 'ON')
+        # Sort by x (left to right)
+        order = np.argsort(xs, kind='stable')
+        title_positions = [(int(xs[i]), int(ys[i]), str(grid[ys[i], xs[i]]['name'])) for i in order]
+        key = (cell_size, self.title_cards_hidden, w, h, title_positions)
+        cache = map_data.get('title_layout')
+        if cache and cache['key'] == key:
+            return cache['titles']
+        titles = []
+        columns = np.zeros(w, dtype=bool)
+        named = [p for p in title_positions if p[2]] if not self.title_cards_hidden else []
+        if named:
+            # summed-area table of cells holding a symbol, so any block of cells is checked in O(1);
+            # chunked grids are too big for one and check the block itself
+            occupied = None
+            if not grid.chunked:
+                occupied = np.zeros((h + 1, w + 1), dtype=np.int64)
+                occupied[1:, 1:] = (~grid.equals('symbol', ' ')).cumsum(axis=0).cumsum(axis=1)
+            title_font = self.glyph_atlas.get_font('serif', int(cell_size * 0.6))
+        def cell_span(lo, hi, n):
+            # first and last cell whose [i * cell_size + 1, (i + 1) * cell_size + 1] touches [lo, hi]
+            first = int((lo - 1) // cell_size) - 2
+            while (first + 1) * cell_size + 1 < lo:
+                first += 1
+            last = int((hi - 1) // cell_size) + 2
+            while last * cell_size + 1 > hi:
+                last -= 1
+            return max(first, 0), min(last, n - 1)
+        # Track bboxes, bucketed by bucket_size-pixel squares
+        bucket_size = cell_size * 4
+        title_buckets = {}
+        def bucket_keys(bbox):
+            for bx in range(int(bbox[0] // bucket_size), int(bbox[2] // bucket_size) + 1):
+                for by in range(int(bbox[1] // bucket_size), int(bbox[3] // bucket_size) + 1):
+                    yield bx, by
+        margin = 2
+        for x, y, name in title_positions:
+            if not name or self.title_cards_hidden:
+                titles.append(('outline', x, y))
+                continue
+            # Calculate initial position above cell
+            text_bbox = self.glyph_atlas.text_bbox(name, title_font)
+            text_w = text_bbox[2] - text_bbox[0]
+            text_h = text_bbox[3] - text_bbox[1]
+            # whole pixels, so every tile that draws the box rasterizes the same edges
+            title_x = round(x * cell_size + cell_size / 2 - text_w / 2 + 1)
+            title_y = y * cell_size - text_h - margin + 1
+            sx0, sx1 = cell_span(title_x, title_x + text_w, w)
+            columns[sx0:sx1 + 1] = True
+            # Check overlaps with previous titles and symbols
+            while True:
+                proposed_bbox = (title_x, title_y, title_x + text_w, title_y + text_h)
+                sy0, sy1 = cell_span(title_y, title_y + text_h, h)
+                if occupied is None:
+                    hits_symbol = sx0 <= sx1 and sy0 <= sy1 and not grid[sy0:sy1 + 1, sx0:sx1 + 1].equals('symbol', ' ').all()
+                else:
+                    hits_symbol = sx0 <= sx1 and sy0 <= sy1 and (occupied[sy1 + 1, sx1 + 1] - occupied[sy0, sx1 + 1] - occupied[sy1 + 1, sx0] + occupied[sy0, sx0]) > 0
+                if not hits_symbol and not any(self.bboxes_overlap(proposed_bbox, prev_bbox) for k in bucket_keys(proposed_bbox) for prev_bbox in title_buckets.get(k, ())):
+                    break
+                title_y -= text_h + margin
+            for k in bucket_keys(proposed_bbox):
+                title_buckets.setdefault(k, []).append(proposed_bbox)
+            titles.append(('title', name, title_x, title_y, text_w, text_h))
+        map_data['title_layout'] = {'key': key, 'titles': titles, 'columns': columns}
+        return titles
+    def invalidate_title_layout(self, map_data, affected=None):
+        # affected: set of (y, x) cells that changed; None when anything may have
+        cache = map_data.get('title_layout')
+        if not cache:
+            return
+        if affected is None or any(0 <= x < len(cache['columns']) and cache['columns'][x] for y, x in affected):
+            map_data.pop('title_layout', None)
+    def draw_title_cards(self, draw, map_data, bounds=None, origin=(0, 0)):
+        # bounds limits drawing to the titles that reach a window of cells
+        h = map_data['height']
+        w = map_data['width']
+        cell_size = self.cell_size
+        x0, y0, x1, y1 = bounds if bounds else (0, 0, w, h)
+        ox, oy = origin
+        titles = self.get_title_layout(map_data)
+        if not titles:
+            return
+        title_font = self.glyph_atlas.get_font('serif', int(cell_size * 0.6))
+        box_padding = 2
+        region = (x0 * cell_size, y0 * cell_size, x1 * cell_size + 2, y1 * cell_size + 2)
+        for entry in titles:
+            if entry[0] == 'outline':
+                x, y = entry[1:]
+                if x0 <= x < x1 and y0 <= y < y1:
+                    # Purple outline
+                    draw.rectangle((x * cell_size + 1 - ox, y * cell_size + 1 - oy, (x + 1) * cell_size + 1 - ox, (y + 1) * cell_size + 1 - oy), outline='purple', width=2)
+                continue
+            name, title_x, title_y, text_w, text_h = entry[1:]
+            box = (title_x - box_padding, title_y - box_padding, title_x + text_w + box_padding, title_y + text_h + box_padding)
+            if bounds and not self.bboxes_overlap(box, region):
+                continue
+            # Draw background box for pop-out
+            draw.rectangle((box[0] - ox, box[1] - oy, box[2] - ox, box[3] - oy), fill='white', outline='black')
+            # Draw text
+            draw.text((title_x - ox, title_y - oy), name, fill='black', font=title_font)
+    def bboxes_overlap(self, bbox1, bbox2):
+        return not (bbox1[2] < bbox2[0] or bbox1[0] > bbox2[2] or bbox1[3] < bbox2[1] or bbox1[1] > bbox2[3])
+    def render_png(self, map_data, date_code):
+        # The exported PNG of a map as bytes: the full map image over a footer with the map's name,
+        # date_code and the number of connected arcs
+        img = self.render_map_region(map_data, 0, 0, map_data['width'], map_data['height'])
+        # Add footer
+        footer_height = 30
+        new_img = Image.new('RGBA', (img.width, img.height + footer_height), (255,255,255,255))
+        new_img.paste(img, (0,0))
+        draw = ImageDraw.Draw(new_img)
+        font = self.glyph_atlas.get_font('serif', 12)
+        title = map_data['name']
+        arcs_count = len(map_data['attached_arcs'])
+        arcs_text = f"Connected Arcs: {arcs_count}" if arcs_count > 0 else ""
+        # Bottom-left: Title
+        draw.text((10, img.height + 5), title, fill='black', font=font)
+        # Center: Date Code
+        text_width = draw.textbbox((0,0), date_code, font=font)[2]
+        draw.text(( (new_img.width - text_width) / 2, img.height + 5), date_code, fill='black', font=font)
+        # Bottom-right: Arcs
+        if arcs_text:
+            text_width = draw.textbbox((0,0), arcs_text, font=font)[2]
+            draw.text((new_img.width - text_width - 10, img.height + 5), arcs_text, fill='black', font=font)
+        buf = BytesIO()
+        new_img.save(buf, 'PNG')
+        return buf.getvalue()
+class MapMaker(MapRenderer):
     def __init__(self, root):
         self.root = root
         self.current_size = (0, 0)
@@ -67,6 +1236,20 @@ class MapMaker:
             ('tint_color', 'U20'),
             ('tint_opacity', 'f4'),
         ])
+        # First bytes of a binary .pbm map, which is repeated after the offset of its header at the end
+        self.pbm_magic = b'PBM\x01'
+        # Maps with at least this many cells are saved to .pbm uncompressed, so loading maps the file instead of reading it
+        self.pbm_raw_cells = 1 << 20
+        # Value of each field in an untouched cell
+        self.cell_defaults = {'symbol': ' ', 'color': '#000000', 'texture': '', 'name': '', 'value': 0, 'depth': 1, 'height': 0, '3d': 0,
+                              'range': 0.0, 'sun': 'NA', 'earmark': 'Normal', 'title_card': 'OFF', 'tint_color': '', 'tint_opacity': 0.0}
+        # Largest width or height of a map; maps of more cells than chunked_cells keep their grid in chunks
+        # and are too big for the views that render a whole map as one image (PNG export, blending and
+        # the dictionary preview), which leave them out
+        self.max_map_size = 10000
+        self.chunked_cells = 1080 * 1080
+        # Fields that show up in the map image
+        self.render_fields = {'symbol', 'color', 'name', 'height', 'title_card', 'tint_color', 'tint_opacity'}
         # Symbols with descriptions
         self.symbols = [
             (' ', 'Walk Space'),
@@ -122,7 +1305,7 @@ class MapMaker:
         self.paint_mode = False
         self.presymbol = None
         # Cell size
-        self.cell_size = 20
+        MapRenderer.__init__(self, self.symbols, 20)
         self.padding = self.cell_size * 10
         # Maps data
         self.maps = []
@@ -133,6 +1316,9 @@ class MapMaker:
         self.redo_stacks = []
         self.deleted_maps = []
         self.current_index = 0
+        # Tabs other than the current one that stay hidden this long lose their widgets until shown again
+        self.tab_idle_seconds = 300
+        self.tab_idle_check_ms = 30000
         # Selected cell for properties
         self.selected_x = None
         self.selected_y = None
@@ -157,6 +1343,13 @@ class MapMaker:
         self.user_tag = self.settings.get('utag', None)
         self.user_uuid = self.settings.get('uuid', None)
         self.canned = int(self.settings.get('canned', '0').replace('-', ''))
+        # Undo history of every map, open or closed, in at most undo_mb MB of RAM (PB:undo_mb= in the
+        # udata file); the newest eighth stays uncompressed and up to 8x as much is spilled to disk
+        try:
+            undo_mb = max(1, int(self.settings.get('undo_mb', '256')))
+        except ValueError:
+            undo_mb = 256
+        self.undo_history = UndoHistory(undo_mb << 20, undo_mb << 17, undo_mb << 23)
         if not self.user_uuid:
             self.user_uuid = str(uuid.uuid4())
             self.settings['uuid'] = self.user_uuid
@@ -191,8 +1384,8 @@ class MapMaker:
         self.select_start = None
         self.select_end = None
         self.select_rect = None
-        self.selected_regions = [] # list of (minx, miny, maxx, maxy)
-        self.selected_rects = []
+        self.selection = Selection() # selected cells of the current map
+        self.selected_rects = [] # outline lines of the selection
         self.clipboard = None
         self.clipboard_width = 0
         self.clipboard_height = 0
@@ -276,9 +1469,15 @@ class MapMaker:
         self.blend_vars = [] # Added to store blend values
         self.blending_sliders = []
         self.blending_frame = None
-        self.tk_imgs = []
-        self.redraw_timer = None
-        self.pending_redraw = False
+        self.tk_imgs = [] # per-map {(tx, ty): (PhotoImage, canvas item)} of the view tiles created so far
+        self.render_states = [] # per-map snapshot of what the canvas image was rendered from
+        self.view_tile_size = 32 # cells per side of a canvas view tile
+        self.dirty_tile_size = 16 # cells per side of a dirty-redraw tile
+        self.bulk_redraw_cells = 1 << 16 # selection edits touching more cells redraw the whole map
+        self.version_serial = 0 # source of map_data['version'] stamps, unique across maps
+        self.journal_length = 64 # changes kept in each map_data['journal']
+        self.layer_cache = {} # id(map_data) -> full-opacity map image and what it was rendered from
+        self.blend_cache = {} # map version -> (stack key, blended image of the maps up to it)
         # Title cards hidden state
         self.title_cards_hidden = False
         # Data Check
@@ -316,7 +1515,11 @@ class MapMaker:
             'dict_load': os.path.join(base_dir, 'dict')
         }
         self.update_time()
+        self.root.after(self.tab_idle_check_ms, self.release_idle_tabs)
         self.root.bind("<Escape>", lambda e: self.deselect())
+        # Drag strokes (placing or right-click removing) are one undo step, redrawn once a frame
+        self.stroke = None
+        self.stroke_frame_ms = 16
         # Right-click drag remove
         self.remove_mode = False
         self.root.bind("<Button-3>", self.start_remove_mode)
@@ -470,9 +1673,11 @@ class MapMaker:
         self.apply_fg()
     def start_remove_mode(self, event):
         self.remove_mode = True
+        self.begin_stroke()
         self.remove_symbol(event)
     def end_remove_mode(self, event):
         self.remove_mode = False
+        self.end_stroke()
     def remove_symbol(self, event):
         if self.remove_mode:
             canvas = self.canvases[self.current_index]
@@ -481,10 +1686,7 @@ class MapMaker:
                 y = int(canvas.canvasy(event.y - canvas.winfo_rooty()) // self.cell_size)
                 map_data = self.maps[self.current_index]
                 if 0 <= x < map_data['width'] and 0 <= y < map_data['height']:
-                    affected = {(y, x)}
-                    self.push_undo(False, affected)
-                    map_data['grid'][y, x]['symbol'] = ' '
-                    self.redraw_canvas(self.current_index)
+                    self.write_cell(y, x, {'symbol': ' '})
                     self.set_dirty()
                     map_data['dirty'] = True
                     if self.paint_open:
@@ -600,9 +1802,8 @@ class MapMaker:
                 value = f"{r},{g},{b},{o}"
                 f.write(f"PB:color:{name}={value}\n")
     def on_close(self):
-        for i in range(len(self.undo_stacks)):
-            self.undo_stacks[i] = []
-            self.redo_stacks[i] = []
+        for stack in self.undo_stacks + self.redo_stacks + [stack for deleted in self.deleted_maps for stack in deleted[3:]]:
+            self.undo_history.clear(stack)
         self.arc_undo_stack = []
         self.arc_redo_stack = []
         self.deleted_arcs = []
@@ -633,7 +1834,7 @@ class MapMaker:
                 set_colors(child)
         set_colors(self.root)
         for i in range(len(self.canvases)):
-            self.redraw_canvas(i)
+            self.redraw_canvas(i, changed=False)
         self.set_select_colors()
     def set_fg(self, color):
         self.fg = color
@@ -920,7 +2121,7 @@ class MapMaker:
         self.arcmenu.entryconfig(self.show_arc_index, state='disabled' if not self.arc_hidden else 'normal')
         self.arcmenu.entryconfig(self.deselect_arc_arc_index, state='normal' if self.current_arc_index is not None else 'disabled')
     def update_edit_menu_states(self):
-        has_selection = len(self.selected_regions) > 0
+        has_selection = bool(self.selection)
         state = 'normal' if has_selection else 'disabled'
         self.editmenu.entryconfig(self.copy_index, state=state)
         self.editmenu.entryconfig(self.cut_index, state=state)
@@ -1196,7 +2397,7 @@ class MapMaker:
                     self.hover_obj_color = hex_col
                     self.settings['multi_selected_color'] = hex_col
                     for r in self.selected_rects:
-                        self.canvases[self.current_index].itemconfig(r, outline=hex_col)
+                        self.canvases[self.current_index].itemconfig(r, fill=hex_col)
                 if self.color_save_timer:
                     self.root.after_cancel(self.color_save_timer)
                 self.color_save_timer = self.root.after(500, self.save_udata)
@@ -1482,8 +2683,8 @@ class MapMaker:
         self.undo_stacks[idx1], self.undo_stacks[idx2] = self.undo_stacks[idx2], self.undo_stacks[idx1]
         self.redo_stacks[idx1], self.redo_stacks[idx2] = self.redo_stacks[idx2], self.redo_stacks[idx1]
         self.tk_imgs[idx1], self.tk_imgs[idx2] = self.tk_imgs[idx2], self.tk_imgs[idx1]
+        self.render_states[idx1], self.render_states[idx2] = self.render_states[idx2], self.render_states[idx1]
         self.blend_vars[idx1], self.blend_vars[idx2] = self.blend_vars[idx2], self.blend_vars[idx1]
-        self.focusable_sections[2 + idx1], self.focusable_sections[2 + idx2] = self.focusable_sections[2 + idx2], self.focusable_sections[2 + idx1]
     def toggle_view(self):
         view = self.maps[self.current_index].get('view', 'Z=Z')
         if view == 'Z=Z':
@@ -1944,25 +3145,39 @@ class MapMaker:
                 new_left_y = max(0, min(1 - new_view_frac_y, new_left_y))
                 canvas.xview_moveto(new_left_x)
                 canvas.yview_moveto(new_left_y)
-    def add_map_tab(self, name):
+    def new_grid(self, height, width):
+        return MapGrid.blank(self.dtype, self.cell_defaults, height, width, height * width > self.chunked_cells)
+    def set_grid(self, index, grid):
+        # Swaps in a grid of any size, keeping the map's size and its size fields in step
+        map_data = self.maps[index]
+        map_data['grid'] = grid
+        map_data['height'], map_data['width'] = grid.shape
+        self.var_dicts[index]['width_var'].set(map_data['width'])
+        self.var_dicts[index]['height_var'].set(map_data['height'])
+    def apply_size(self, index):
+        var_dict = self.var_dicts[index]
+        new_width = var_dict['width_var'].get()
+        new_height = var_dict['height_var'].get()
+        map_data = self.maps[index]
+        if new_width != map_data['width'] or new_height != map_data['height']:
+            self.push_undo(True)
+            grid = self.new_grid(new_height, new_width)
+            min_h = min(map_data['height'], new_height)
+            min_w = min(map_data['width'], new_width)
+            grid[0:min_h, 0:min_w] = map_data['grid'][0:min_h, 0:min_w]
+            self.set_grid(index, grid)
+            self.record_change(map_data)
+            self.redraw_canvas(index)
+            self.center_canvas(index)
+            self.set_dirty()
+            map_data['dirty'] = True
+    def add_map_tab(self, name, lazy=False):
+        # lazy: only the tab, the map and its variables are made now; build_tab makes the widgets
+        # when the tab is first selected
         map_index = len(self.maps)
         width = 48
         height = 24
-        grid = np.zeros((height, width), dtype=self.dtype)
-        grid['symbol'] = ' '
-        grid['color'] = '#000000'
-        grid['texture'] = ''
-        grid['name'] = ''
-        grid['value'] = 0
-        grid['depth'] = 1
-        grid['height'] = 0
-        grid['3d'] = 0
-        grid['range'] = 0.0
-        grid['sun'] = 'NA'
-        grid['earmark'] = 'Normal'
-        grid['title_card'] = 'OFF'
-        grid['tint_color'] = ''
-        grid['tint_opacity'] = 0.0
+        grid = self.new_grid(height, width)
         map_data = {
             'width': width,
             'height': height,
@@ -1989,15 +3204,42 @@ class MapMaker:
         }
         self.maps.append(map_data)
         frame = tk.Frame(self.notebook)
-        tab_id = self.notebook.add(frame, text=name)
+        self.notebook.add(frame, text=name)
+        self.canvases.append(None)
+        self.tk_imgs.append(None)
+        self.render_states.append(None)
+        self.zoom_sliders.append(None)
+        self.var_dicts.append({
+            'openings_var': tk.StringVar(value=map_data['openings']),
+            'width_var': tk.IntVar(value=map_data['width']),
+            'height_var': tk.IntVar(value=map_data['height']),
+            'type_var': tk.StringVar(value=map_data['type']),
+            'name_var': tk.StringVar(value=map_data['name']),
+            'maker_var': tk.StringVar(value=map_data['maker'])
+        })
+        self.undo_stacks.append([])
+        self.redo_stacks.append([])
+        self.blend_vars.append(tk.IntVar(value=0)) # Add new blend var for the new map
+        if lazy:
+            return
+        self.update_blending_sliders()
+        self.build_tab(map_index)
+        if self.minimap_open:
+            self.generate_minimap()
+        self.update_arc_list()
+    def build_tab(self, index):
+        # Header, canvas, scrollbars and zoom slider of a tab, bound to the map's variables, then the
+        # map drawn and centred. release_tab takes them down again.
+        map_data = self.maps[index]
+        var_dict = self.var_dicts[index]
+        frame = self.notebook.nametowidget(self.notebook.tabs()[index])
         header_frame = tk.Frame(frame)
         header_frame.pack(fill=tk.X)
         close_btn = tk.Button(header_frame, text='X', command=lambda f=frame: self.close_tab(self.notebook.index(f)))
         close_btn.pack(side=tk.RIGHT)
-        openings_var = tk.StringVar(value=map_data['openings'])
         openings_label = tk.Label(header_frame, text="Openings:")
         openings_label.pack(side=tk.LEFT)
-        openings_entry = tk.Entry(header_frame, textvariable=openings_var, width=10)
+        openings_entry = tk.Entry(header_frame, textvariable=var_dict['openings_var'], width=10)
         openings_entry.pack(side=tk.LEFT)
         openings_entry.bind("<FocusIn>", self.handle_entry_focus)
         def show_openings_info():
@@ -2009,45 +3251,40 @@ class MapMaker:
         vcmd_open = self.root.register(validate_openings)
         openings_entry.config(validate='key', validatecommand=(vcmd_open, '%P'))
         openings_entry.bind("<FocusIn>", lambda e: self.select_all(e))
-        openings_entry.bind("<FocusOut>", lambda e: self.on_openings_change(map_index))
-        width_var = tk.IntVar(value=map_data['width'])
+        openings_entry.bind("<FocusOut>", lambda e: self.on_openings_change(e))
         tk.Label(header_frame, text="Width:").pack(side=tk.LEFT)
-        width_entry = tk.Entry(header_frame, textvariable=width_var, width=5)
+        width_entry = tk.Entry(header_frame, textvariable=var_dict['width_var'], width=5)
         width_entry.pack(side=tk.LEFT)
         def validate_size(P):
             if P == '':
                 return True
             try:
                 v = int(P)
-                return 0 <= v <= 1080
+                return 0 <= v <= self.max_map_size
             except:
                 return False
         vcmd_size = self.root.register(validate_size)
         width_entry.config(validate='key', validatecommand=(vcmd_size, '%P'))
         width_entry.bind("<FocusIn>", self.handle_entry_focus)
-        height_var = tk.IntVar(value=map_data['height'])
         tk.Label(header_frame, text="Height:").pack(side=tk.LEFT)
-        height_entry = tk.Entry(header_frame, textvariable=height_var, width=5)
+        height_entry = tk.Entry(header_frame, textvariable=var_dict['height_var'], width=5)
         height_entry.pack(side=tk.LEFT)
         height_entry.config(validate='key', validatecommand=(vcmd_size, '%P'))
         height_entry.bind("<FocusIn>", self.handle_entry_focus)
-        tk.Button(header_frame, text="Apply Size", command=lambda i=map_index: self.apply_size(i)).pack(side=tk.LEFT)
-        type_var = tk.StringVar(value=map_data['type'])
+        tk.Button(header_frame, text="Apply Size", command=lambda f=frame: self.apply_size(self.notebook.index(f))).pack(side=tk.LEFT)
         tk.Label(header_frame, text="Type:").pack(side=tk.LEFT)
-        type_combo = ttk.Combobox(header_frame, textvariable=type_var, values=['Safe (S)', 'Crawl (C)', 'Fight (F)', 'Mix0 (C+C)', 'Mix1 (C+F)', 'Mix2 (S+F)', 'Mix3 (C+S)', 'Mixed (ANY)'], state='readonly', width=10)
+        type_combo = ttk.Combobox(header_frame, textvariable=var_dict['type_var'], values=['Safe (S)', 'Crawl (C)', 'Fight (F)', 'Mix0 (C+C)', 'Mix1 (C+F)', 'Mix2 (S+F)', 'Mix3 (C+S)', 'Mixed (ANY)'], state='readonly', width=10)
         type_combo.pack(side=tk.LEFT)
-        name_var = tk.StringVar(value=map_data['name'])
         tk.Label(header_frame, text="Name:").pack(side=tk.LEFT)
-        name_entry = tk.Entry(header_frame, textvariable=name_var, width=15)
+        name_entry = tk.Entry(header_frame, textvariable=var_dict['name_var'], width=15)
         name_entry.pack(side=tk.LEFT)
         def validate_len_28(P): return len(P) <= 28 or P == ''
         vcmd_28 = self.root.register(validate_len_28)
         name_entry.config(validate='key', validatecommand=(vcmd_28, '%P'))
         name_entry.bind("<FocusIn>", self.handle_entry_focus)
-        name_entry.bind("<FocusOut>", lambda e: self.update_map_name(map_index))
-        maker_var = tk.StringVar(value=map_data['maker'])
+        name_entry.bind("<FocusOut>", lambda e, f=frame: self.update_map_name(self.notebook.index(f)))
         tk.Label(header_frame, text="Maker:").pack(side=tk.LEFT)
-        maker_entry = tk.Entry(header_frame, textvariable=maker_var, width=15)
+        maker_entry = tk.Entry(header_frame, textvariable=var_dict['maker_var'], width=15)
         maker_entry.pack(side=tk.LEFT)
         def validate_len_21(P): return len(P) <= 21 or P == ''
         vcmd_21 = self.root.register(validate_len_21)
@@ -2065,20 +3302,9 @@ class MapMaker:
         zoom_slider.set(self.cell_size)
         zoom_slider.pack(side=tk.RIGHT, fill=tk.Y)
         canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        canvas.config(xscrollcommand=hbar.set, yscrollcommand=vbar.set)
-        self.canvases.append(canvas)
-        self.tk_imgs.append(None)
-        self.zoom_sliders.append(zoom_slider)
-        self.var_dicts.append({
-            'openings_var': openings_var,
-            'width_var': width_var,
-            'height_var': height_var,
-            'type_var': type_var,
-            'name_var': name_var,
-            'maker_var': maker_var
-        })
-        self.undo_stacks.append([])
-        self.redo_stacks.append([])
+        canvas.config(xscrollcommand=lambda *args: self.on_canvas_view(canvas, hbar, *args), yscrollcommand=lambda *args: self.on_canvas_view(canvas, vbar, *args))
+        self.canvases[index] = canvas
+        self.zoom_sliders[index] = zoom_slider
         canvas.bind("<Button-1>", self.on_canvas_click)
         canvas.bind("<B1-Motion>", self.on_canvas_motion)
         canvas.bind("<ButtonRelease-1>", self.on_canvas_release)
@@ -2088,21 +3314,46 @@ class MapMaker:
         canvas.bind("<Motion>", self.on_canvas_motion_hover)
         self.bind_scrolls(canvas)
         self.focusable_sections.append(canvas)
-        self.blend_vars.append(tk.IntVar(value=0)) # Add new blend var for the new map
-        self.update_blending_sliders()
-        self.redraw_canvas(map_index)
-        self.draw_attached_dots(map_index)
-        self.center_canvas(map_index)
+        map_data['last_shown'] = time.time()
+        self.redraw_canvas(index, changed=False)
+        self.draw_attached_dots(index)
+        self.center_canvas(index)
         self.apply_fg_to_widget(header_frame)
         self.apply_fg_to_widget(canvas_frame)
         self.apply_fg_to_widget(zoom_slider)
-        if self.minimap_open:
-            self.generate_minimap()
-        self.update_arc_list()
+    def release_tab(self, index):
+        # Destroys the widgets and view tiles of a built tab, keeping its map and variables
+        canvas = self.canvases[index]
+        if canvas is None:
+            return
+        if canvas in self.focusable_sections:
+            self.focusable_sections.remove(canvas)
+        for child in self.notebook.nametowidget(self.notebook.tabs()[index]).winfo_children():
+            child.destroy()
+        self.canvases[index] = None
+        self.zoom_sliders[index] = None
+        self.tk_imgs[index] = None
+        self.render_states[index] = None
+        # canvas item ids mean nothing on the next canvas
+        map_data = self.maps[index]
+        map_data['dot_ids'] = []
+        for key in ('sunrise_rect', 'sunset_rect', 'pin_at_rect', 'pin_to_rect'):
+            map_data[key] = None
+    def release_idle_tabs(self):
+        # Tabs not shown for tab_idle_seconds give up their widgets and images
+        now = time.time()
+        for index, map_data in enumerate(self.maps):
+            if index == self.current_index:
+                map_data['last_shown'] = now
+            elif self.canvases[index] is not None and now - map_data.get('last_shown', now) > self.tab_idle_seconds:
+                self.release_tab(index)
+        self.root.after(self.tab_idle_check_ms, self.release_idle_tabs)
     def on_zoom(self, val):
+        if int(val) != self.cell_size:
+            self.glyph_atlas.clear()
         self.cell_size = int(val)
         self.padding = self.cell_size * 10
-        self.redraw_canvas(self.current_index)
+        self.redraw_canvas(self.current_index, changed=False)
         self.center_canvas(self.current_index)
     def on_canvas_motion_hover(self, event):
         canvas = self.canvases[self.current_index]
@@ -2116,6 +3367,8 @@ class MapMaker:
             self.hover_rect = canvas.create_rectangle(x * self.cell_size, y * self.cell_size, (x + 1) * self.cell_size, (y + 1) * self.cell_size, outline=color, width=2)
     def draw_attached_dots(self, index):
         canvas = self.canvases[index]
+        if canvas is None:
+            return
         map_data = self.maps[index]
         h = map_data['height']
         bottom_y = h * self.cell_size + 10
@@ -2144,8 +3397,13 @@ class MapMaker:
                     self.arc_list.itemconfig(j, bg='')
                 break
     def on_tab_change(self, event):
+        self.end_stroke()
         if self.notebook.tabs():
             self.current_index = self.notebook.index("current")
+            # build_tab draws the tab it builds, so only tabs that were already built redraw below
+            needs_build = self.canvases[self.current_index] is None
+            if needs_build:
+                self.build_tab(self.current_index)
             self.deselect()
             self.update_edit_menu_states()
             self.draw_attached_dots(self.current_index)
@@ -2159,7 +3417,8 @@ class MapMaker:
                 self.mapmenu.entryconfig(self.view_index, label="Set Heli-View")
             elif view == 'XYZ=Z':
                 self.mapmenu.entryconfig(self.view_index, label="Set Top-View")
-            self.redraw_canvas(self.current_index)
+            if not needs_build:
+                self.redraw_canvas(self.current_index, changed=False)
     def update_arc_list(self):
         self.arc_list.delete(0, tk.END)
         attached_names = {a['name'] for a in self.maps[self.current_index]['attached_arcs']}
@@ -2234,8 +3493,8 @@ class MapMaker:
                 self.redraw_canvas(self.current_index)
             return
         if self.ongoing_action == 'paste':
-            if self.selected_regions:
-                self.paste_pos = (self.selected_regions[0][0], self.selected_regions[0][1])
+            if self.selection:
+                self.paste_pos = self.selection.bounds()[:2]
             else:
                 self.paste_pos = (x, y)
             self.paste_selected()
@@ -2263,39 +3522,32 @@ class MapMaker:
                 return
         if 0 <= x < map_data['width'] and 0 <= y < map_data['height']:
             if self.paint_mode or self.select_mode:
-                if event.state & 0x0001: # Shift pressed
-                    if self.select_start:
-                        minx = min(self.select_start[0], x, self.select_end[0])
-                        miny = min(self.select_start[1], y, self.select_end[1])
-                        maxx = max(self.select_start[0], x, self.select_end[0]) + 1
-                        maxy = max(self.select_start[1], y, self.select_end[1]) + 1
-                        new_region = (minx, miny, maxx, maxy)
-                        if len(self.selected_regions) >= 9:
-                            messagebox.showwarning("Selection Limit", "Maximum of 9 selection sections reached.")
-                            return
-                        if new_region not in self.selected_regions:
-                            self.selected_regions.append(new_region)
-                        self.select_start = None
-                        if self.select_rect:
-                            canvas.delete(self.select_rect)
-                        self.select_rect = None
-                        # draw all regions
-                        self.selected_rects = []
-                        for minx, miny, maxx, maxy in self.selected_regions:
-                            for yy in range(miny, maxy):
-                                for xx in range(minx, maxx):
-                                    rect_id = canvas.create_rectangle(xx * self.cell_size, yy * self.cell_size, (xx + 1) * self.cell_size, (yy + 1) * self.cell_size, outline=self.multi_selected_color, width=3, stipple='gray25')
-                                    self.selected_rects.append(rect_id)
-                        if self.paint_mode:
-                            self.update_paint_preview()
+                if event.state & 0x0005 and self.select_start: # Shift or Control pressed
+                    # select_end follows the pointer off the map, so the box is clamped to it
+                    minx = max(min(self.select_start[0], x, self.select_end[0]), 0)
+                    miny = max(min(self.select_start[1], y, self.select_end[1]), 0)
+                    maxx = min(max(self.select_start[0], x, self.select_end[0]) + 1, map_data['width'])
+                    maxy = min(max(self.select_start[1], y, self.select_end[1]) + 1, map_data['height'])
+                    self.selection.combine((minx, miny, maxx, maxy), self.selection_op(event))
+                    self.select_start = None
+                    if self.select_rect:
+                        canvas.delete(self.select_rect)
+                    self.select_rect = None
+                    self.draw_selection(canvas)
+                    self.update_edit_menu_states()
+                    if self.paint_mode:
+                        self.update_paint_preview()
                 else:
-                    self.deselect_multi()
+                    if not event.state & 0x0005:
+                        # Shift or Control keep the selection for the new rectangle to combine with
+                        self.deselect_multi()
                     self.select_start = (x, y)
                     self.select_end = (x, y)
                     self.update_select_rect()
                     if self.paint_mode:
                         self.update_paint_preview()
             else:
+                self.begin_stroke()
                 self.place_symbol(event)
                 self.paste_pos = (x, y)
                 if self.paint_open:
@@ -2326,17 +3578,8 @@ class MapMaker:
         elif not self.select_mode:
             self.place_temp_symbol(x, y)
             self.place_symbol(event)
-            self.pending_redraw = True
-            if self.redraw_timer:
-                self.root.after_cancel(self.redraw_timer)
-                self.redraw_timer = None
-            self.redraw_timer = self.root.after(20, self._do_redraw)
-    def _do_redraw(self):
-        self.redraw_timer = None
-        if self.pending_redraw:
-            self.redraw_canvas(self.current_index)
-            self.pending_redraw = False
     def on_canvas_release(self, event):
+        self.end_stroke()
         canvas = self.canvases[self.current_index]
         x = int(canvas.canvasx(event.x) // self.cell_size)
         y = int(canvas.canvasy(event.y) // self.cell_size)
@@ -2348,29 +3591,14 @@ class MapMaker:
             maxy = max(self.select_start[1], self.select_end[1], y) + 1
             if minx < 0 or miny < 0 or maxx > map_data['width'] or maxy > map_data['height']:
                 return
-            new_region = (minx, miny, maxx, maxy)
-            if event.state & 0x0001: # Shift pressed
-                if len(self.selected_regions) >= 9:
-                    messagebox.showwarning("Selection Limit", "Maximum of 9 selection sections reached.")
-                    return
-                if new_region not in self.selected_regions:
-                    self.selected_regions.append(new_region)
-            else:
-                self.selected_regions = [new_region]
+            self.selection.combine((minx, miny, maxx, maxy), self.selection_op(event))
             self.select_start = None
             if self.select_rect:
                 canvas.delete(self.select_rect)
             self.select_rect = None
-            # draw all regions
-            self.selected_rects = []
-            for minx, miny, maxx, maxy in self.selected_regions:
-                for yy in range(miny, maxy):
-                    for xx in range(minx, maxx):
-                        rect_id = canvas.create_rectangle(xx * self.cell_size, yy * self.cell_size, (xx + 1) * self.cell_size, (yy + 1) * self.cell_size, outline=self.multi_selected_color, width=3, stipple='gray25')
-                        self.selected_rects.append(rect_id)
-            has_multi = len(self.selected_regions) > 1 or any(maxx - minx > 1 or maxy - miny > 1 for minx, miny, maxx, maxy in self.selected_regions)
-            if not has_multi and len(self.selected_regions) == 1:
-                minx, miny, maxx, maxy = self.selected_regions[0]
+            self.draw_selection(canvas)
+            if self.selection.count() == 1:
+                minx, miny, maxx, maxy = self.selection.bounds()
                 self.selected_x = minx
                 self.selected_y = miny
                 cell = map_data['grid'][miny, minx]
@@ -2435,56 +3663,36 @@ class MapMaker:
             maxx = max(self.select_start[0], self.select_end[0]) + 1
             maxy = max(self.select_start[1], self.select_end[1]) + 1
             self.select_rect = canvas.create_rectangle(minx * self.cell_size, miny * self.cell_size, maxx * self.cell_size, maxy * self.cell_size, outline=self.multi_active_color, width=3, dash=True, stipple='gray25')
+    def selection_op(self, event):
+        # Shift adds a rectangle to the selection, Control takes it away and both keep only the overlap
+        shift, control = event.state & 0x0001, event.state & 0x0004
+        return 'intersect' if shift and control else 'union' if shift else 'subtract' if control else 'replace'
+    def draw_selection(self, canvas):
+        # outlines the selection with a line per straight run of its border, so the canvas holds as
+        # many items as the outline has sides rather than one per selected cell
+        for r in self.selected_rects:
+            canvas.delete(r)
+        cs = self.cell_size
+        self.selected_rects = [canvas.create_line(x0 * cs, y0 * cs, x1 * cs, y1 * cs, fill=self.multi_selected_color, width=3) for x0, y0, x1, y1 in self.selection.edges()]
     def deselect_multi(self):
         if self.selected_rects:
             canvas = self.canvases[self.current_index]
             for r in self.selected_rects:
                 canvas.delete(r)
             self.selected_rects = []
-        self.selected_regions = []
+        self.selection = Selection()
         self.update_edit_menu_states()
     def get_shared_props(self):
-        if not self.selected_regions:
+        if not self.selection:
             return None
-        names = set()
-        colors = set()
-        textures = set()
-        heights = set()
-        depths = set()
-        values = set()
-        threed = set()
-        ranges = set()
-        suns = set()
-        earmarks = set()
-        title_cards = set()
-        map_data = self.maps[self.current_index]
-        for minx, miny, maxx, maxy in self.selected_regions:
-            for yy in range(miny, maxy):
-                for xx in range(minx, maxx):
-                    cell = map_data['grid'][yy, xx]
-                    names.add(cell['name'])
-                    colors.add(cell['color'])
-                    textures.add(cell['texture'])
-                    heights.add(cell['height'])
-                    depths.add(cell['depth'])
-                    values.add(cell['value'])
-                    threed.add(cell['3d'])
-                    ranges.add(cell['range'])
-                    suns.add(cell['sun'])
-                    earmarks.add(cell['earmark'])
-                    title_cards.add(cell['title_card'])
+        grid = self.maps[self.current_index]['grid']
+        ys, xs = self.selection.cells()
         shared = {}
-        shared['name'] = list(names)[0] if len(names) == 1 else ''
-        shared['color'] = list(colors)[0] if len(colors) == 1 else ''
-        shared['texture'] = list(textures)[0] if len(textures) == 1 else ''
-        shared['height'] = list(heights)[0] if len(heights) == 1 else ''
-        shared['depth'] = list(depths)[0] if len(depths) == 1 else ''
-        shared['value'] = list(values)[0] if len(values) == 1 else ''
-        shared['3d'] = list(threed)[0] if len(threed) == 1 else 0
-        shared['range'] = list(ranges)[0] if len(ranges) == 1 else 0.0
-        shared['sun'] = list(suns)[0] if len(suns) == 1 else 'NA'
-        shared['earmark'] = list(earmarks)[0] if len(earmarks) == 1 else 'Normal'
-        shared['title_card'] = list(title_cards)[0] if len(title_cards) == 1 else 'OFF'
+        # a field's value where every selected cell has the same one, else what mixed cells show
+        for name, mixed in (('name', ''), ('color', ''), ('texture', ''), ('height', ''), ('depth', ''), ('value', ''), ('3d', 0), ('range', 0.0), ('sun', 'NA'), ('earmark', 'Normal'), ('title_card', 'OFF')):
+            found = np.unique(grid.columns[name][ys, xs])
+            table = grid.tables.get(name)
+            shared[name] = mixed if len(found) != 1 else table.strings[found[0]] if table else found[0]
         return shared
     def show_multi_properties(self):
         shared = self.get_shared_props()
@@ -2524,12 +3732,11 @@ class MapMaker:
                 self.right_frame.update_idletasks()
             self.apply_fg_to_widget(self.property_canvas)
     def copy_selected(self):
-        if self.selected_regions:
+        if self.selection:
             map_data = self.maps[self.current_index]
-            self.clipboard = []
-            for minx, miny, maxx, maxy in self.selected_regions:
-                clip = np.copy(map_data['grid'][miny:maxy, minx:maxx])
-                self.clipboard.append(clip)
+            minx, miny, maxx, maxy = self.selection.bounds()
+            # the selection's bounding box and which of its cells are selected
+            self.clipboard = (map_data['grid'][miny:maxy, minx:maxx].copy(), self.selection.mask.copy())
             self.deselect()
             self.update_edit_menu_states()
     def cut_selected(self):
@@ -2538,72 +3745,71 @@ class MapMaker:
         self.deselect()
     def paste_selected(self):
         if self.clipboard:
-            if not self.paste_pos and not self.selected_regions:
+            if not self.paste_pos and not self.selection:
                 self.ongoing_action = 'paste'
                 return
-            if self.selected_regions:
-                x, y = self.selected_regions[0][0], self.selected_regions[0][1]
+            if self.selection:
+                x, y = self.selection.bounds()[:2]
             else:
                 x, y = self.paste_pos
             map_data = self.maps[self.current_index]
-            height = map_data['height']
-            width = map_data['width']
-            affected = set()
-            for clip in self.clipboard:
-                clip_h, clip_w = clip.shape
-                end_y = min(y + clip_h, height)
-                end_x = min(x + clip_w, width)
-                affected.update({(yy, xx) for yy in range(y, end_y) for xx in range(x, end_x)})
-            self.push_undo(False, affected)
-            for clip in self.clipboard:
-                clip_h, clip_w = clip.shape
-                end_y = min(y + clip_h, height)
-                end_x = min(x + clip_w, width)
-                map_data['grid'][y:end_y, x:end_x] = clip[0:end_y-y, 0:end_x-x]
-            self.redraw_canvas(self.current_index)
+            clip, mask = self.clipboard
+            # only the copied cells, kept where they land inside the map
+            oys, oxs = np.nonzero(mask)
+            inside = (oys + y < map_data['height']) & (oxs + x < map_data['width'])
+            oys, oxs = oys[inside].astype(np.int32), oxs[inside].astype(np.int32)
+            ys, xs = oys + y, oxs + x
+            affected = self.affected_cells(ys, xs)
+            self.push_undo(False, (ys, xs))
+            map_data['grid'].paste(ys, xs, clip, oys, oxs)
+            self.record_change(map_data, affected)
+            self.redraw_canvas(self.current_index, affected)
             self.deselect()
             self.update_edit_menu_states()
             self.set_dirty()
             map_data['dirty'] = True
+    def affected_cells(self, ys, xs):
+        # the cells (ys, xs) as the set of (y, x) record_change and redraw_canvas take; that is None, a
+        # change to the whole map, past bulk_redraw_cells, where building it costs more than it saves
+        return set(zip(ys.tolist(), xs.tolist())) if len(ys) <= self.bulk_redraw_cells else None
+    def selection_cells(self):
+        # (ys, xs) of the selected cells of the current map and the same cells as affected_cells
+        ys, xs = self.selection.cells()
+        return ys, xs, self.affected_cells(ys, xs)
     def replace_selected(self):
-        if self.selected_regions:
+        if self.selection:
             map_data = self.maps[self.current_index]
             sym = self.current_symbol.get()
             if sym == '--' or sym == '':
                 sym = self.presymbol if self.presymbol else ' '
                 if sym == '--':
                     sym = ' '
-            affected = set()
-            for minx, miny, maxx, maxy in self.selected_regions:
-                affected.update({(yy, xx) for yy in range(miny, maxy) for xx in range(minx, maxx)})
-            self.push_undo(False, affected)
-            for minx, miny, maxx, maxy in self.selected_regions:
-                for yy in range(miny, maxy):
-                    for xx in range(minx, maxx):
-                        map_data['grid'][yy, xx]['symbol'] = sym
-                        if self.lock_var.get() and self.locked_properties:
-                            for k, v in self.locked_properties.items():
-                                map_data['grid'][yy, xx][k] = v
-            self.redraw_canvas(self.current_index)
+            values = {'symbol': sym}
+            if self.lock_var.get() and self.locked_properties:
+                values.update(self.locked_properties)
+            ys, xs, affected = self.selection_cells()
+            self.push_undo(False, (ys, xs), tuple(values))
+            map_data['grid'].fill((ys, xs), values)
+            self.record_change(map_data, affected, tuple(values))
+            self.redraw_canvas(self.current_index, affected)
             self.deselect()
             self.update_edit_menu_states()
             self.set_dirty()
             map_data['dirty'] = True
     def make_new_map(self):
-        if self.selected_regions:
-            new_width = max(maxx - minx for minx, miny, maxx, maxy in self.selected_regions)
-            new_height = max(maxy - miny for minx, miny, maxx, maxy in self.selected_regions)
+        if self.selection:
+            minx, miny, maxx, maxy = self.selection.bounds()
+            new_width = maxx - minx
+            new_height = maxy - miny
             self.add_map_tab("New Map")
             new_index = len(self.maps) - 1
             new_map = self.maps[new_index]
             new_map['width'] = new_width
             new_map['height'] = new_height
             old_map = self.maps[self.current_index]
-            new_map['grid'] = np.zeros((new_height, new_width), dtype=self.dtype)
-            for minx, miny, maxx, maxy in self.selected_regions:
-                clip_h = maxy - miny
-                clip_w = maxx - minx
-                new_map['grid'][0:clip_h, 0:clip_w] = old_map['grid'][miny:maxy, minx:maxx]
+            new_map['grid'] = self.new_grid(new_height, new_width)
+            ys, xs = np.nonzero(self.selection.mask)
+            new_map['grid'].paste(ys, xs, old_map['grid'], ys + miny, xs + minx)
             self.var_dicts[new_index]['width_var'].set(new_width)
             self.var_dicts[new_index]['height_var'].set(new_height)
             self.redraw_canvas(new_index)
@@ -2613,7 +3819,7 @@ class MapMaker:
             self.set_dirty()
             new_map['dirty'] = True
     def clear_selected_properties(self):
-        if self.selected_regions:
+        if self.selection:
             focus = self.root.focus_get()
             prop_map = {
                 self.prop_name_entry: ('name', ''),
@@ -2624,68 +3830,92 @@ class MapMaker:
                 self.prop_3d_entry: ('3d', 0),
                 self.prop_range_entry: ('range', 0.0),
             }
-            affected = set()
             map_data = self.maps[self.current_index]
-            for minx, miny, maxx, maxy in self.selected_regions:
-                affected.update({(yy, xx) for yy in range(miny, maxy) for xx in range(minx, maxx)})
-            self.push_undo(False, affected)
             if focus in prop_map:
                 key, default = prop_map[focus]
-                for minx, miny, maxx, maxy in self.selected_regions:
-                    for yy in range(miny, maxy):
-                        for xx in range(minx, maxx):
-                            map_data['grid'][yy, xx][key] = default
+                values = {key: default}
             elif focus in [self.prop_red_slider, self.prop_green_slider, self.prop_blue_slider]:
-                for minx, miny, maxx, maxy in self.selected_regions:
-                    for yy in range(miny, maxy):
-                        for xx in range(minx, maxx):
-                            map_data['grid'][yy, xx]['color'] = '#000000'
+                values = {'color': '#000000'}
             else:
-                for minx, miny, maxx, maxy in self.selected_regions:
-                    for yy in range(miny, maxy):
-                        for xx in range(minx, maxx):
-                            map_data['grid'][yy, xx]['name'] = ''
-                            map_data['grid'][yy, xx]['color'] = '#000000'
-                            map_data['grid'][yy, xx]['texture'] = ''
-                            map_data['grid'][yy, xx]['height'] = 0
-                            map_data['grid'][yy, xx]['depth'] = 1
-                            map_data['grid'][yy, xx]['value'] = 0
-                            map_data['grid'][yy, xx]['3d'] = 0
-                            map_data['grid'][yy, xx]['range'] = 0.0
-                            map_data['grid'][yy, xx]['earmark'] = 'Normal'
-                            map_data['grid'][yy, xx]['title_card'] = 'OFF'
-            self.redraw_canvas(self.current_index)
+                values = {key: self.cell_defaults[key] for key in ('name', 'color', 'texture', 'height', 'depth', 'value', '3d', 'range', 'earmark', 'title_card')}
+            ys, xs, affected = self.selection_cells()
+            self.push_undo(False, (ys, xs), tuple(values))
+            map_data['grid'].fill((ys, xs), values)
+            self.record_change(map_data, affected, tuple(values))
+            self.redraw_canvas(self.current_index, affected)
             self.update_edit_menu_states()
             self.set_dirty()
             map_data['dirty'] = True
     def remove_selected(self):
-        if self.selected_regions:
+        if self.selection:
             map_data = self.maps[self.current_index]
-            affected = set()
-            for minx, miny, maxx, maxy in self.selected_regions:
-                affected.update({(yy, xx) for yy in range(miny, maxy) for xx in range(minx, maxx)})
-            self.push_undo(False, affected)
-            for minx, miny, maxx, maxy in self.selected_regions:
-                for yy in range(miny, maxy):
-                    for xx in range(minx, maxx):
-                        map_data['grid'][yy, xx]['symbol'] = ' '
-                        map_data['grid'][yy, xx]['name'] = ''
-                        map_data['grid'][yy, xx]['color'] = '#000000'
-                        map_data['grid'][yy, xx]['texture'] = ''
-                        map_data['grid'][yy, xx]['height'] = 0
-                        map_data['grid'][yy, xx]['depth'] = 1
-                        map_data['grid'][yy, xx]['value'] = 0
-                        map_data['grid'][yy, xx]['3d'] = 0
-                        map_data['grid'][yy, xx]['range'] = 0.0
-                        map_data['grid'][yy, xx]['sun'] = 'NA'
-                        map_data['grid'][yy, xx]['earmark'] = 'Normal'
-                        map_data['grid'][yy, xx]['title_card'] = 'OFF'
-                        map_data['grid'][yy, xx]['tint_color'] = ''
-                        map_data['grid'][yy, xx]['tint_opacity'] = 0.0
-            self.redraw_canvas(self.current_index)
+            ys, xs, affected = self.selection_cells()
+            self.push_undo(False, (ys, xs))
+            map_data['grid'].fill((ys, xs), self.cell_defaults)
+            self.record_change(map_data, affected)
+            self.redraw_canvas(self.current_index, affected)
             self.update_edit_menu_states()
             self.set_dirty()
             map_data['dirty'] = True
+    def write_cell(self, y, x, values):
+        # Sets fields of a cell of the current map from values ({field: value}). Inside a stroke the
+        # cell's first values are kept for the stroke's undo step and the redraw waits for the next
+        # frame; otherwise the write is an undo step and redrawn on its own.
+        map_data = self.maps[self.current_index]
+        grid = map_data['grid']
+        stroke = self.stroke
+        if stroke is None or stroke['index'] != self.current_index:
+            affected = {(y, x)}
+            self.push_undo(False, affected, tuple(values))
+            for k, v in values.items():
+                grid[y, x][k] = v
+            self.record_change(map_data, affected, tuple(values))
+            self.redraw_canvas(self.current_index, affected)
+            return
+        if (y, x) not in stroke['cells']:
+            stroke['cells'][(y, x)] = {name: column[y, x] for name, column in grid.columns.items()}
+        for k, v in values.items():
+            grid[y, x][k] = v
+        stroke['fields'].update(values)
+        stroke['pending'].add((y, x))
+        if stroke['flush'] is None:
+            stroke['flush'] = self.root.after(self.stroke_frame_ms, self.flush_stroke)
+    def begin_stroke(self):
+        # Opens a stroke on the current map: cells written through write_cell until end_stroke
+        # become a single undo step
+        self.end_stroke()
+        self.stroke = {'index': self.current_index, 'cells': {}, 'fields': set(), 'pending': set(), 'flush': None}
+    def flush_stroke(self):
+        # Journals and redraws the cells the stroke wrote since the last frame
+        stroke = self.stroke
+        stroke['flush'] = None
+        if stroke['pending']:
+            self.record_change(self.maps[stroke['index']], stroke['pending'], tuple(stroke['fields']))
+            self.redraw_canvas(stroke['index'], stroke['pending'])
+            stroke['pending'] = set()
+    def end_stroke(self):
+        stroke = self.stroke
+        if stroke is None:
+            return
+        if stroke['flush'] is not None:
+            self.root.after_cancel(stroke['flush'])
+        self.flush_stroke()
+        self.stroke = None
+        if not stroke['cells']:
+            return
+        index = stroke['index']
+        grid = self.maps[index]['grid']
+        fields = tuple(stroke['fields'])
+        ys, xs = np.array(list(stroke['cells']), dtype=np.int32).reshape(-1, 2).T
+        old = {name: np.array([cell[name] for cell in stroke['cells'].values()], dtype=grid.columns[name].dtype) for name in fields}
+        # cells the stroke left as they were (painted over with the same values) are not undone
+        changed = np.zeros(len(ys), dtype=bool)
+        for name in fields:
+            changed |= grid.columns[name][ys, xs] != old[name]
+        if changed.any():
+            self.undo_history.clear(self.redo_stacks[index])
+            self.undo_history.add(self.undo_stacks[index], ('delta', ys[changed], xs[changed], {name: values[changed] for name, values in old.items()}))
+            self.update_edit_menu_states()
     def place_symbol(self, event):
         if self.select_mode or self.paint_mode:
             return
@@ -2695,14 +3925,11 @@ class MapMaker:
         map_data = self.maps[self.current_index]
         if 0 <= x < map_data['width'] and 0 <= y < map_data['height']:
             sym = self.current_symbol.get()
-            affected = {(y, x)}
-            self.push_undo(False, affected)
-            map_data['grid'][y, x]['symbol'] = sym
+            values = {'symbol': sym}
             if self.lock_var.get() and sym == self.locked_symbol and self.locked_properties:
-                for k, v in self.locked_properties.items():
-                    map_data['grid'][y, x][k] = v
+                values.update(self.locked_properties)
             canvas.delete('temp')
-            self.redraw_canvas(self.current_index)
+            self.write_cell(y, x, values)
             # Auto-select after place
             self.selected_x = x
             self.selected_y = y
@@ -2774,9 +4001,10 @@ class MapMaker:
                     self.update_paint_preview()
                 return
             affected = {(y, x)}
-            self.push_undo(False, affected)
+            self.push_undo(False, affected, ('symbol',))
             map_data['grid'][y, x]['symbol'] = ' '
-            self.redraw_canvas(self.current_index)
+            self.record_change(map_data, affected, ('symbol',))
+            self.redraw_canvas(self.current_index, affected)
             self.set_dirty()
             map_data['dirty'] = True
             if self.select_mode or self.current_symbol.get() == '--':
@@ -2886,7 +4114,7 @@ class MapMaker:
             self.save_udata()
             self.drawers_frame.update_idletasks()
             self.right_frame.update_idletasks()
-            if self.selected_x is not None or self.selected_regions:
+            if self.selected_x is not None or self.selection:
                 self.minimap_hscroll.pack_forget()
                 self.minimap_vscroll.pack_forget()
                 self.minimap_canvas.pack_forget()
@@ -2930,7 +4158,7 @@ class MapMaker:
             self.minimap_footer_frame.pack_forget()
             self.drawers_frame.update_idletasks()
             self.right_frame.update_idletasks()
-            if self.selected_x is not None or self.selected_regions:
+            if self.selected_x is not None or self.selection:
                 self.color_vscroll.pack_forget()
                 self.color_canvas.pack_forget()
                 self.property_vscroll.pack(side=tk.LEFT, fill=tk.Y)
@@ -3213,62 +4441,37 @@ class MapMaker:
         title_card = self.prop_title_var.get()
         map_data = self.maps[self.current_index]
         grid = map_data['grid']
-        is_multi = len(self.selected_regions) > 0
+        is_multi = bool(self.selection)
         if is_multi:
             if not messagebox.askyesno("Confirm", f"Attaching Mass Selected Properties will change the properties for all selected objects. Do you wish to continue, {self.user_name or 'User'}?", parent=self.root):
                 return
-            affected = set()
-            for minx, miny, maxx, maxy in self.selected_regions:
-                affected.update({(y, x) for y in range(miny, maxy) for x in range(minx, maxx)})
-            self.push_undo(False, affected)
-            for minx, miny, maxx, maxy in self.selected_regions:
-                for y in range(miny, maxy):
-                    for x in range(minx, maxx):
-                        if name: grid[y, x]['name'] = name
-                        grid[y, x]['color'] = color
-                        if texture: grid[y, x]['texture'] = texture
-                        if height_str:
-                            try:
-                                height = int(height_str)
-                                height = max(min(height, 2147483647), -2147483648)
-                                grid[y, x]['height'] = height
-                            except ValueError:
-                                pass
-                        if depth_str:
-                            try:
-                                depth = int(depth_str)
-                                depth = max(min(depth, 2147483647), -2147483648)
-                                grid[y, x]['depth'] = depth
-                            except ValueError:
-                                pass
-                        if value_str:
-                            try:
-                                value = int(value_str)
-                                value = max(min(value, 2147483647), -2147483648)
-                                grid[y, x]['value'] = value
-                            except ValueError:
-                                pass
-                        if threed_str:
-                            try:
-                                threed = int(threed_str)
-                                threed = max(min(threed, 2147483647), -2147483648)
-                                grid[y, x]['3d'] = threed
-                            except ValueError:
-                                pass
-                        if range_str: grid[y, x]['range'] = float(range_str)
-                        grid[y, x]['earmark'] = earmark
-                        grid[y, x]['title_card'] = title_card
-            self.redraw_canvas(self.current_index)
+            values = {'color': color, 'earmark': earmark, 'title_card': title_card}
+            if name: values['name'] = name
+            if texture: values['texture'] = texture
+            for key, text in (('height', height_str), ('depth', depth_str), ('value', value_str), ('3d', threed_str)):
+                if text:
+                    try:
+                        values[key] = max(min(int(text), 2147483647), -2147483648)
+                    except ValueError:
+                        pass
+            if range_str: values['range'] = float(range_str)
+            ys, xs, affected = self.selection_cells()
+            self.push_undo(False, (ys, xs), tuple(values))
+            grid.fill((ys, xs), values)
+            self.record_change(map_data, affected, tuple(values))
+            self.redraw_canvas(self.current_index, affected)
         else:
             if self.selected_x is not None and self.selected_y is not None:
                 affected = {(self.selected_y, self.selected_x)}
                 if self.lock_var.get():
                     self.locked_symbol = grid[self.selected_y, self.selected_x]['symbol']
-                    for yy in range(map_data['height']):
-                        for xx in range(map_data['width']):
-                            if grid[yy, xx]['symbol'] == self.locked_symbol:
-                                affected.add((yy, xx))
-                self.push_undo(False, affected)
+                    # every cell of the locked symbol, the selected one among them, gets the locked
+                    # properties below; the selected cell its title card and sun too
+                    ys, xs = (a.astype(np.int32) for a in grid.where('symbol', self.locked_symbol))
+                    self.push_undo(False, (ys, xs), ('name', 'color', 'texture', 'height', 'depth', 'value', '3d', 'range', 'earmark', 'title_card', 'sun'))
+                    affected = self.affected_cells(ys, xs)
+                else:
+                    self.push_undo(False, affected)
                 height = int(height_str) if height_str else 0
                 height = max(min(height, 2147483647), -2147483648)
                 depth = int(depth_str) if depth_str else 1
@@ -3323,6 +4526,11 @@ class MapMaker:
                         map_data['pin_at'] = None
                     if (self.selected_x, self.selected_y) == old_pin_to:
                         map_data['pin_to'] = None
+                # the sun and pin markers that moved away are redrawn too
+                for marker in (old_sunrise, old_sunset, old_pin_at, old_pin_to):
+                    if marker and affected is not None:
+                        affected.add((marker[1], marker[0]))
+                self.record_change(map_data, affected)
                 self.redraw_canvas(self.current_index) # to update rects
                 if self.lock_var.get():
                     self.locked_properties = {
@@ -3336,18 +4544,8 @@ class MapMaker:
                         'range': range_val,
                         'earmark': earmark
                     }
-                    for y in range(map_data['height']):
-                        for x in range(map_data['width']):
-                            if grid[y, x]['symbol'] == self.locked_symbol and (y, x) != (self.selected_y, self.selected_x):
-                                grid[y, x]['name'] = name
-                                grid[y, x]['color'] = color
-                                grid[y, x]['texture'] = texture
-                                grid[y, x]['height'] = height
-                                grid[y, x]['depth'] = depth
-                                grid[y, x]['value'] = value
-                                grid[y, x]['3d'] = threed
-                                grid[y, x]['range'] = range_val
-                                grid[y, x]['earmark'] = earmark
+                    grid.fill(grid.where('symbol', self.locked_symbol), self.locked_properties)
+                    self.record_change(map_data, affected, tuple(self.locked_properties))
                     self.redraw_canvas(self.current_index)
             self.update_edit_menu_states()
             self.set_dirty()
@@ -3736,15 +4934,25 @@ class MapMaker:
             self.user_active = 1
             return True
         return False
-    def _save_map_content(self, map_data, var_dict):
+    def encode_map(self, index):
+        # Text encoding of a map shared by .tmap saves and the txt and dictionary exports, cached on the
+        # map until its grid version, its tint names or a header, footer or arc value changes. 'size', 'view' and
+        # 'position' are header pieces; 'rows' and 'footer' are lists of chunks that join to the map rows
+        # and to the footer with its mapc[!], arcs:: and section_colors: sections.
+        map_data = self.maps[index]
+        var_dict = self.var_dicts[index]
+        arc_keys = ['name', 'estimated', 'zone_type', 'start_msg', 'map', 'arc_data', 'confirm_msg']
+        arcs = tuple(tuple(a[k] for k in arc_keys) for a in map_data['attached_arcs'])
+        key = (self.map_version(map_data), map_data.get('cell_tints_version', 0), var_dict['openings_var'].get(), var_dict['type_var'].get(), var_dict['name_var'].get(), var_dict['maker_var'].get(),
+               map_data['system'], map_data.get('view', 'Z=Z'), map_data['sunrise'], map_data['sunset'], map_data['pin_at'], map_data['pin_to'], arcs)
+        cached = map_data.get('encoding')
+        if cached and cached['key'] == key:
+            return cached
         openings = var_dict['openings_var'].get().ljust(7, '0')
         map_type = var_dict['type_var'].get()
         name = var_dict['name_var'].get()
         maker = var_dict['maker_var'].get()
         system = map_data['system']
-        header = f"{openings} {map_data['width']}x{map_data['height']}"
-        view_str = f" view {map_data.get('view', 'Z=Z')}"
-        header += view_str
         sunrise_str = ''
         if map_data['sunrise'] and map_data['sunset']:
             sunrise_str = f" sunrise xy({map_data['sunrise'][0]},{map_data['sunrise'][1]}); sunset xy({map_data['sunset'][0]},{map_data['sunset'][1]})"
@@ -3753,48 +4961,95 @@ class MapMaker:
             pin_str += f" Pin At({map_data['pin_at'][0]},{map_data['pin_at'][1]})"
         if map_data['pin_to']:
             pin_str += f" Pin To({map_data['pin_to'][0]},{map_data['pin_to'][1]})"
-        header += sunrise_str + pin_str
-        map_str = '\n'.join(''.join(cell['symbol'] for cell in row) for row in map_data['grid'])
-        footer = f"{map_type}; {name}; {maker}; {system}"
-        props = [
-            f'{cell["symbol"]}[\"{cell["color"]}\";\"{cell["name"]}\";\"{cell["texture"]}\";{cell["sun"] if cell["sun"] != "NA" else ""}({x},{cell["3d"]},{y},{cell["depth"]},{cell["height"]},{cell["range"]}){t_str}{o_str}{cell["value"]}{ear_str}{title_str}]'
-            for y in range(map_data['height'])
-            for x in range(map_data['width'])
-            for cell in [map_data['grid'][y, x]]
-            for t_str in [ '+t({},{})'.format(x, y) if (x, y) == map_data['pin_at'] else '' ]
-            for o_str in [ '+o({},{})'.format(x, y) if (x, y) == map_data['pin_to'] else '' ]
-            for ear_str in [ f';earmark={cell["earmark"]}' if cell["earmark"] != "Normal" else '' ]
-            for title_str in [ '&' if cell["title_card"] == "ON" else '' ]
-            if not (cell['symbol'] == ' ' and cell['color'] == '#000000' and cell['texture'] == '' and cell['name'] == '' and cell['value'] == 0 and cell['depth'] == 1 and cell['height'] == 0 and cell['3d'] == 0 and cell['range'] == 0.0 and cell['sun'] == 'NA' and cell['earmark'] == 'Normal' and cell['title_card'] == 'OFF' and t_str == '' and o_str == '')
-        ]
-        props_str = ' mapc[!] ' + ' '.join(props) if props else ''
-        arcs_str = ''
-        if map_data['attached_arcs']:
-            for a in map_data['attached_arcs']:
+        grid = map_data['grid']
+        height = grid.shape[0]
+        row_chunks = ['\n'.join(''.join(row) for row in grid[start:start + 256]['symbol'].tolist()) + ('\n' if start + 256 < height else '') for start in range(0, height, 256)]
+        footer = [f"{map_type}; {name}; {maker}; {system}"]
+        footer.extend(self.chunked(' mapc[!] ', ' ', self.map_prop_records(map_data), ''))
+        if arcs:
+            # messages are starred in the file only, the map's own arcs keep theirs
+            arc_lines = []
+            for arc in arcs:
+                a = dict(zip(arc_keys, arc))
                 a['start_msg'] = "***" + a['start_msg'] + "***" if a['start_msg'] != "Start Message" else ""
                 a['confirm_msg'] = "***" + a['confirm_msg'] + "***" if a['confirm_msg'] != "Confirm Message" else ""
-            arc_lines = ['||'.join([a[k] for k in ['name', 'estimated', 'zone_type', 'start_msg', 'map', 'arc_data', 'confirm_msg']]) for a in map_data['attached_arcs']]
-            arcs_str = ';arcs::' + ';'.join(arc_lines)
-        # section_colors
-        section_colors = []
-        for y in range(map_data['height']):
-            for x in range(map_data['width']):
-                cell = map_data['grid'][y, x]
-                if cell['tint_color']:
-                    tint_str = map_data['cell_tints'][(x, y)] if (x, y) in map_data['cell_tints'] else cell['tint_color']
-                    section_colors.append(f"{tint_str},{cell['tint_opacity']}[{x},{y}]")
-        section_colors_str = 'section_colors:' + '; '.join(section_colors) + ' [end-section]' if section_colors else ''
-        return header + '\n' + map_str + '\n' + footer + props_str + arcs_str + section_colors_str
+                arc_lines.append('||'.join(a[k] for k in arc_keys))
+            footer.append(';arcs::' + ';'.join(arc_lines))
+        footer.extend(self.chunked('section_colors:', '; ', self.map_section_colors(map_data), ' [end-section]'))
+        map_data['encoding'] = {
+            'key': key,
+            'size': f"{openings} {map_data['width']}x{map_data['height']}",
+            'view': f" view {map_data.get('view', 'Z=Z')}",
+            'position': sunrise_str + pin_str,
+            'rows': row_chunks,
+            'footer': footer,
+        }
+        return map_data['encoding']
+    def write_map_content(self, f, index):
+        encoding = self.encode_map(index)
+        f.write(encoding['size'] + encoding['view'] + encoding['position'] + '\n')
+        f.writelines(encoding['rows'])
+        f.write('\n')
+        f.writelines(encoding['footer'])
+    def chunked(self, prefix, sep, records, suffix, chunk=4096):
+        # prefix + sep.join(records) + suffix as chunks of up to chunk records; nothing if there are no records
+        batch = []
+        started = False
+        for record in records:
+            batch.append(record)
+            if len(batch) == chunk:
+                yield (sep if started else prefix) + sep.join(batch)
+                batch = []
+                started = True
+        if batch:
+            yield (sep if started else prefix) + sep.join(batch)
+            started = True
+        if started:
+            yield suffix
+    def map_prop_records(self, map_data):
+        # mapc[!] records of the cells that differ from a blank cell (or hold a pin), in row order.
+        # The cells are found column by column, so only those cells are ever formatted.
+        grid = map_data['grid']
+        ys, xs = grid.differing({field: default for field, default in self.cell_defaults.items() if field not in ('tint_color', 'tint_opacity')})
+        pins = [pin[1] * grid.shape[1] + pin[0] for pin in (map_data['pin_at'], map_data['pin_to']) if pin and pin[0] < map_data['width'] and pin[1] < map_data['height']]
+        if pins:
+            ys, xs = np.divmod(np.union1d(ys * grid.shape[1] + xs, pins), grid.shape[1])
+        def column(field):
+            values = grid.columns[field][ys, xs]
+            table = grid.tables.get(field)
+            if table:
+                return [table.strings[i] for i in values.tolist()]
+            # numbers are formatted once per distinct value, as the numpy scalars they are
+            uniques, inverse = np.unique(values, return_inverse=True)
+            text = [f'{value}' for value in uniques]
+            return [text[i] for i in inverse.ravel().tolist()]
+        pin_at, pin_to = map_data['pin_at'], map_data['pin_to']
+        for x, y, symbol, color, name, texture, sun, threed, depth, height, range_, value, earmark, title_card in zip(
+                xs.tolist(), ys.tolist(), *map(column, ('symbol', 'color', 'name', 'texture', 'sun', '3d', 'depth', 'height', 'range', 'value', 'earmark', 'title_card'))):
+            t_str = '+t({},{})'.format(x, y) if (x, y) == pin_at else ''
+            o_str = '+o({},{})'.format(x, y) if (x, y) == pin_to else ''
+            ear_str = f';earmark={earmark}' if earmark != "Normal" else ''
+            title_str = '&' if title_card == "ON" else ''
+            yield f'{symbol}[\"{color}\";\"{name}\";\"{texture}\";{sun if sun != "NA" else ""}({x},{threed},{y},{depth},{height},{range_}){t_str}{o_str}{value}{ear_str}{title_str}]'
+    def map_section_colors(self, map_data):
+        # section_colors: records of the tinted cells, giving the tint's name where it has one
+        grid = map_data['grid']
+        ys, xs = grid.differing({'tint_color': ''})
+        tints = grid.tables['tint_color'].strings
+        for x, y, tint, opacity in zip(xs.tolist(), ys.tolist(), grid.columns['tint_color'][ys, xs].tolist(), grid.columns['tint_opacity'][ys, xs]):
+            tint_str = map_data['cell_tints'][(x, y)] if (x, y) in map_data['cell_tints'] else tints[tint]
+            yield f"{tint_str},{opacity}[{x},{y}]"
     def save_file_as(self, file_type):
         if file_type == 'tmap':
-            file = filedialog.asksaveasfilename(defaultextension=".tmap", filetypes=[("TMap files", "*.tmap")])
+            file = filedialog.asksaveasfilename(defaultextension=".tmap", filetypes=[("TMap files", "*.tmap"), ("Binary map files", "*.pbm")])
             if file:
                 map_data = self.maps[self.current_index]
-                var_dict = self.var_dicts[self.current_index]
-                content = self._save_map_content(map_data, var_dict)
                 path = self.get_next_path(file)
-                with open(path, 'w') as f:
-                    f.write(content)
+                if path.endswith('.pbm'):
+                    self.save_pbm(path, self.current_index)
+                else:
+                    with open(path, 'w') as f:
+                        self.write_map_content(f, self.current_index)
                 self.dirty = False
                 map_data['dirty'] = False
                 self.user_active = 1
@@ -3804,14 +5059,12 @@ class MapMaker:
                 dir_path = os.path.dirname(file)
                 map_names = []
                 for i, map_data in enumerate(self.maps):
-                    var_dict = self.var_dicts[i]
                     base_name = map_data['name']
                     ext = '.tmap'
                     tmap_file = os.path.join(dir_path, base_name + ext)
                     tmap_path = self.get_next_path(tmap_file)
-                    content = self._save_map_content(map_data, var_dict)
                     with open(tmap_path, 'w') as f:
-                        f.write(content)
+                        self.write_map_content(f, i)
                     saved_name = os.path.basename(tmap_path)[:-5]
                     map_names.append(saved_name)
                 import_header = 'import {' + ', '.join(f'"{n}"' for n in map_names) + '}\n'
@@ -3858,9 +5111,12 @@ class MapMaker:
         self.var_dicts = []
         self.canvases = []
         self.zoom_sliders = []
+        for stack in self.undo_stacks + self.redo_stacks:
+            self.undo_history.clear(stack)
         self.undo_stacks = []
         self.redo_stacks = []
         self.tk_imgs = []
+        self.render_states = []
         self.blend_vars = [] # Clear blend vars
         self.arcs = []
         self.arc_list.delete(0, tk.END)
@@ -3875,228 +5131,209 @@ class MapMaker:
             self.ask_save()
         self.load_file()
     def load_file(self):
-        file = filedialog.askopenfilename(initialdir=self.last_dir['file_load'], filetypes=[("All map files", "*.tmap *.mapd *.txt"), ("TMap files", "*.tmap"), ("MapD files", "*.mapd"), ("Text files", "*.txt")])
+        file = filedialog.askopenfilename(initialdir=self.last_dir['file_load'], filetypes=[("All map files", "*.tmap *.pbm *.mapd *.txt"), ("TMap files", "*.tmap"), ("Binary map files", "*.pbm"), ("MapD files", "*.mapd"), ("Text files", "*.txt")])
         if file:
             self.last_dir['file_load'] = os.path.dirname(file)
             if file.endswith('.tmap') or file.endswith('.txt'):
                 self.load_tmap(file)
                 self.last_dir['map_load'] = os.path.dirname(file)
+            elif file.endswith('.pbm'):
+                self.load_pbm(file)
+                self.last_dir['map_load'] = os.path.dirname(file)
             elif file.endswith('.mapd'):
                 self.load_mapd(file)
                 self.last_dir['dict_load'] = os.path.dirname(file)
             self.dirty = False
             self.user_active = 1
-    def load_tmap(self, file):
-        with open(file, 'r') as f:
-            lines = f.readlines()
-        if lines:
-            self.add_map_tab(os.path.basename(file))
-            map_index = len(self.maps) - 1
-            map_data = self.maps[map_index]
-            var_dict = self.var_dicts[map_index]
-            header = lines[0].strip()
-            view_match = re.search(r' view (Y=Z|Z=Z|XY=Z|XYZ=Z)', header)
-            if view_match:
-                map_data['view'] = view_match.group(1)
-                header = header[:view_match.start()].strip() + header[view_match.end():].strip()
-            sunrise_match = re.search(r'sunrise xy\((\d+),(\d+)\); sunset xy\((\d+),(\d+)\)', header)
-            if sunrise_match:
-                map_data['sunrise'] = (int(sunrise_match.group(1)), int(sunrise_match.group(2)))
-                map_data['sunset'] = (int(sunrise_match.group(3)), int(sunrise_match.group(4)))
-                header = header[:sunrise_match.start()].strip()
-            pin_at_match = re.search(r'Pin At\((\d+),(\d+)\)', header)
-            if pin_at_match:
-                map_data['pin_at'] = (int(pin_at_match.group(1)), int(pin_at_match.group(2)))
-                header = header[:pin_at_match.start()].strip()
-            pin_to_match = re.search(r'Pin To\((\d+),(\d+)\)', header)
-            if pin_to_match:
-                map_data['pin_to'] = (int(pin_to_match.group(1)), int(pin_to_match.group(2)))
-                header = header[:pin_to_match.start()].strip()
-            parts = header.split()
-            openings = parts[0]
-            if len(openings) < 7: openings = openings.ljust(7, '0')
-            size = parts[1]
-            width, height = map(int, size.split('x'))
-            map_data['width'] = width
-            map_data['height'] = height
-            var_dict['width_var'].set(width)
-            var_dict['height_var'].set(height)
-            var_dict['openings_var'].set(openings)
-            grid = np.zeros((height, width), dtype=self.dtype)
-            grid['symbol'] = ' '
-            grid['color'] = '#000000'
-            grid['texture'] = ''
-            grid['name'] = ''
-            grid['value'] = 0
-            grid['depth'] = 1
-            grid['height'] = 0
-            grid['3d'] = 0
-            grid['range'] = 0.0
-            grid['sun'] = 'NA'
-            grid['earmark'] = 'Normal'
-            grid['title_card'] = 'OFF'
-            grid['tint_color'] = ''
-            grid['tint_opacity'] = 0.0
-            map_lines = lines[1:1 + height]
-            if len(map_lines) < height:
-                map_lines += ['\n'] * (height - len(map_lines))
-            for y, map_line in enumerate(map_lines):
-                line = map_line.rstrip()
-                if len(line) < width:
-                    line += ' ' * (width - len(line))
-                elif len(line) > width:
-                    line = line[:width]
-                for x, char in enumerate(line):
-                    grid[y, x]['symbol'] = char
-            map_data['grid'] = grid
-            footer_start = 1 + height
-            footer_line = ' '.join([line.strip() for line in lines[footer_start:] if line.strip()])
-            footer_parts = footer_line.split(';')
-            map_type = footer_parts[0].strip() if len(footer_parts) > 0 else 'Safe'
-            map_data['type'] = map_type
-            var_dict['type_var'].set(map_type)
-            name = footer_parts[1].strip() if len(footer_parts) > 1 else 'Loaded Map'
-            map_data['name'] = name
-            var_dict['name_var'].set(name)
-            self.notebook.tab(map_index, text=name)
-            maker = footer_parts[2].strip() if len(footer_parts) > 2 else 'User'
-            map_data['maker'] = maker
-            var_dict['maker_var'].set(maker)
-            system = footer_parts[3].strip() if len(footer_parts) > 3 else 'PB [no-jam] PyEditor'
-            # Parse properties if present
-            props_str = ''
-            arcs_start = 4
-            section_colors_str = ''
-            if len(footer_parts) > 4:
-                rest = ';'.join(footer_parts[4:])
-                section_end = rest.find('section_colors:')
-                if section_end != -1:
-                    section_colors_str = rest[section_end + 15:].strip()
-                    rest = rest[:section_end].strip()
-                if 'arcs::' in rest:
-                    props_end = rest.find(';arcs::')
-                    if props_end != -1:
-                        props_str = rest[:props_end].strip()
-                        arcs_str = rest[props_end + 7:].strip()
-                    else:
-                        props_str = rest.strip()
-                else:
-                    props_str = rest.strip()
-                if props_str.startswith('mapc[!] '):
-                    props_str = props_str[8:].strip()
-                props = self.parse_props(props_str)
-                for sym, color, name_, texture, sun, x, threed, y, d, h, r, t_str, o_str, val, earmark, title_card in props:
-                    x = int(x)
-                    y = int(y)
-                    r = float(r) if r else 0.0
-                    sun = sun if sun else 'NA'
-                    earmark = earmark if earmark else 'Normal'
-                    title_card = 'ON' if '&' in title_card else 'OFF'
-                    if 0 <= x < width and 0 <= y < height:
-                        cell = grid[y, x]
-                        cell['symbol'] = sym
-                        cell['color'] = color if color else '#000000'
-                        cell['name'] = name_
-                        cell['texture'] = texture
-                        cell['3d'] = int(threed)
-                        cell['depth'] = int(d)
-                        cell['height'] = int(h)
-                        cell['value'] = int(val)
-                        cell['range'] = r
-                        cell['sun'] = sun
-                        cell['earmark'] = earmark
-                        cell['title_card'] = title_card
-                if section_colors_str:
-                    if section_colors_str.endswith('[end-section]'):
-                        section_colors_str = section_colors_str[:-13].strip()
-                    section_colors = section_colors_str.split('; ')
-                    for sc in section_colors:
-                        match = re.match(r'([^,]+),([^[]+)\[(\d+),(\d+)\]', sc)
-                        if match:
-                            item = match.group(1)
-                            opacity = float(match.group(2))
-                            xx = int(match.group(3))
-                            yy = int(match.group(4))
-                            if 0 <= xx < width and 0 <= yy < height:
-                                if item.startswith('#'):
-                                    tint_color = item
-                                else:
-                                    name = item
-                                    if name in map_data['named_colors']:
-                                        tint_color, _ = map_data['named_colors'][name]
-                                        map_data['cell_tints'][(xx, yy)] = name
-                                    else:
-                                        tint_color = '#000000'
-                                        opacity = 0.0
-                                grid[yy, xx]['tint_color'] = tint_color
-                                grid[yy, xx]['tint_opacity'] = opacity
-                if 'arcs_str' in locals():
-                    arc_lines = arcs_str.split(';')
-                    for arc_line in arc_lines:
-                        if arc_line:
-                            parts = arc_line.split('||')
-                            if len(parts) == 7:
-                                start_msg = parts[3].strip("***") if parts[3] != "" else "Start Message"
-                                confirm_msg = parts[6].strip("***") if parts[6] != "" else "Confirm Message"
-                                arc = {
-                                    'name': parts[0],
-                                    'estimated': parts[1],
-                                    'zone_type': parts[2],
-                                    'start_msg': start_msg,
-                                    'map': parts[4],
-                                    'arc_data': parts[5],
-                                    'confirm_msg': confirm_msg
-                                }
-                                map_data['attached_arcs'].append(arc)
-                                found = False
-                                for existing in self.arcs:
-                                    if existing['name'].lower() == arc['name'].lower():
-                                        found = True
-                                        break
-                                if not found:
-                                    self.arcs.append(copy.deepcopy(arc))
-                                    self.arc_list.insert(tk.END, arc['name'])
-            if map_data['sunrise']:
-                sx, sy = map_data['sunrise']
-                grid[sy, sx]['sun'] = 'SR'
-            if map_data['sunset']:
-                sx, sy = map_data['sunset']
-                grid[sy, sx]['sun'] = 'SS'
+    def tmap_parser(self):
+        return TmapParser(self.dtype, self.cell_defaults, self.chunked_cells, self.named_colors)
+    def load_tmap(self, file, show=True):
+        loaded = self.tmap_parser()(file)
+        if loaded:
+            self.attach_loaded_map(file, loaded, show)
+    def attach_loaded_map(self, file, loaded, show=True):
+        # Opens a tab for a map read by TmapParser or load_pbm. Unless show, the tab is lazy and
+        # gets its widgets the first time it is selected.
+        self.add_map_tab(os.path.basename(file), lazy=not show)
+        map_index = len(self.maps) - 1
+        map_data = self.maps[map_index]
+        var_dict = self.var_dicts[map_index]
+        arcs = loaded.pop('arcs')
+        map_data.update(loaded)
+        var_dict['width_var'].set(map_data['width'])
+        var_dict['height_var'].set(map_data['height'])
+        for key in ('openings', 'type', 'name', 'maker'):
+            var_dict[key + '_var'].set(map_data[key])
+        self.notebook.tab(map_index, text=map_data['name'])
+        for arc in arcs:
+            self.attach_loaded_arc(map_data, arc)
+        if show:
+            self.show_loaded_map(map_index)
+    def attach_loaded_arc(self, map_data, arc):
+        map_data['attached_arcs'].append(arc)
+        found = False
+        for existing in self.arcs:
+            if existing['name'].lower() == arc['name'].lower():
+                found = True
+                break
+        if not found:
+            self.arcs.append(copy.deepcopy(arc))
+            self.arc_list.insert(tk.END, arc['name'])
+    def show_loaded_map(self, map_index):
+        if self.canvases[map_index] is None:
+            self.build_tab(map_index)
+        else:
             self.redraw_canvas(map_index)
             self.draw_attached_dots(map_index)
             self.center_canvas(map_index)
-            self.notebook.select(map_index)
-            self.minimap_generated = False
-            if self.minimap_open:
-                self.generate_minimap()
-            self.update_arc_list()
-    def parse_props(self, props_str):
-        props = []
-        blocks = re.split(r'\]', props_str)
-        for block in blocks:
-            if not block.strip():
+        self.notebook.select(map_index)
+        self.minimap_generated = False
+        if self.minimap_open:
+            self.generate_minimap()
+        self.update_arc_list()
+    def save_pbm(self, path, index):
+        # Binary map: one zlib block per grid field in MapMaker.dtype order (text fields as int32 ids),
+        # or one zlib block per stored chunk for chunked grids. Maps of at least pbm_raw_cells cells
+        # write those blocks raw and 64-byte aligned instead, so they can be mapped back in. Then a JSON header with the map's settings, arcs,
+        # cell tints, the string table of every text field and where each block lies, then the
+        # header's offset and the magic again, so readers find the header from the end and can read
+        # only the fields they need.
+        map_data = self.maps[index]
+        var_dict = self.var_dicts[index]
+        grid = map_data['grid']
+        columns = []
+        strings = {}
+        raw = map_data['width'] * map_data['height'] >= self.pbm_raw_cells
+        self.unmap_file(path)
+        with open(path, 'wb') as f:
+            f.write(self.pbm_magic)
+            for field in self.dtype.names:
+                column = grid.columns[field]
+                table = grid.tables.get(field)
+                if table:
+                    # only the strings still in use are kept, renumbered in table order
+                    used = np.zeros(len(table.strings), dtype=bool)
+                    if isinstance(column, ChunkedColumn):
+                        used[column.fill] = True
+                        for block in column.chunks.values():
+                            used[block] = True
+                    else:
+                        used[column] = True
+                    strings[field] = [value for value, keep in zip(table.strings, used.tolist()) if keep]
+                    renumber = np.cumsum(used, dtype=np.int32) - 1
+                    column = column.translated(renumber) if isinstance(column, ChunkedColumn) else renumber[column]
+                if isinstance(column, ChunkedColumn):
+                    chunks = []
+                    for (cy, cx), block in sorted(column.chunks.items()):
+                        data = np.ascontiguousarray(block).tobytes() if raw else zlib.compress(block.tobytes(), 1)
+                        if raw:
+                            f.write(bytes(-f.tell() % 64))
+                        chunks.append([cy, cx, f.tell(), len(data)])
+                        f.write(data)
+                    columns.append({'field': field, 'dtype': column.dtype.str, 'fill': column.fill.item(), 'chunk': column.SIZE, 'chunks': chunks, 'compression': 'none' if raw else 'zlib'})
+                    continue
+                if raw:
+                    f.write(bytes(-f.tell() % 64))
+                    columns.append({'field': field, 'dtype': column.dtype.str, 'offset': f.tell(), 'length': column.nbytes, 'compression': 'none'})
+                    np.ascontiguousarray(column).tofile(f)
+                    continue
+                data = zlib.compress(np.ascontiguousarray(column).tobytes(), 1)
+                columns.append({'field': field, 'dtype': column.dtype.str, 'offset': f.tell(), 'length': len(data), 'compression': 'zlib'})
+                f.write(data)
+            header = {
+                'openings': var_dict['openings_var'].get().ljust(7, '0'),
+                'width': map_data['width'],
+                'height': map_data['height'],
+                'view': map_data.get('view', 'Z=Z'),
+                'sunrise': map_data['sunrise'],
+                'sunset': map_data['sunset'],
+                'pin_at': map_data['pin_at'],
+                'pin_to': map_data['pin_to'],
+                'type': var_dict['type_var'].get(),
+                'name': var_dict['name_var'].get(),
+                'maker': var_dict['maker_var'].get(),
+                'system': map_data['system'],
+                'attached_arcs': map_data['attached_arcs'],
+                'cell_tints': [[x, y, name] for (x, y), name in map_data['cell_tints'].items()],
+                'columns': columns,
+                'strings': strings,
+            }
+            offset = f.tell()
+            f.write(json.dumps(header).encode('utf-8'))
+            f.write(struct.pack('<Q', offset) + self.pbm_magic)
+    def unmap_file(self, path):
+        # Grids read from raw .pbm blocks stay memory-mapped on the file, and truncating it under them
+        # ends the process with SIGBUS, so their columns are read into memory before it is rewritten
+        path = os.path.realpath(path)
+        for map_data in self.maps:
+            columns = map_data['grid'].columns
+            for name, column in columns.items():
+                if isinstance(column, np.memmap) and column.filename and os.path.realpath(column.filename) == path:
+                    columns[name] = np.array(column)
+                elif isinstance(column, ChunkedColumn):
+                    for key, block in column.chunks.items():
+                        if isinstance(block, np.memmap) and block.filename and os.path.realpath(block.filename) == path:
+                            column.chunks[key] = np.array(block)
+    def read_pbm_header(self, f):
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        f.seek(0)
+        if end < 2 * len(self.pbm_magic) + 8 or f.read(len(self.pbm_magic)) != self.pbm_magic:
+            raise ValueError("Not a .pbm map file")
+        f.seek(end - len(self.pbm_magic) - 8)
+        offset, magic = struct.unpack('<Q', f.read(8))[0], f.read(len(self.pbm_magic))
+        if magic != self.pbm_magic:
+            raise ValueError("Incomplete .pbm map file")
+        f.seek(offset)
+        return json.loads(f.read(end - len(self.pbm_magic) - 8 - offset).decode('utf-8'))
+    def read_pbm_grid(self, f, header):
+        width, height = header['width'], header['height']
+        columns = {}
+        tables = {}
+        mapped = None
+        for column in header['columns']:
+            if 'chunks' in column:
+                chunks = {}
+                size = column['chunk']
+                if column['compression'] == 'none' and column['chunks'] and mapped is None:
+                    # one copy-on-write mapping of the file shared by every raw chunk, not one per chunk
+                    mapped = np.memmap(f, dtype=np.uint8, mode='c')
+                for cy, cx, offset, length in column['chunks']:
+                    if column['compression'] == 'none':
+                        chunks[(cy, cx)] = mapped[offset:offset + length].view(column['dtype']).reshape(size, size)
+                        continue
+                    f.seek(offset)
+                    chunks[(cy, cx)] = np.frombuffer(zlib.decompress(f.read(length)), dtype=column['dtype']).reshape(size, size).copy()
+                columns[column['field']] = ChunkedColumn(column['dtype'], column['fill'], (height, width), chunks)
                 continue
-            match = re.match(r'(.)\["([^"]*)";"([^"]*)";"([^"]*)";([A-Z]{2})?\((\d+),(\d+),(\d+),(\d+),(\d+),?(\d*\.?\d*)?\)(?:(\+t\(\d+,\d+\))?(\+o\(\d+,\d+\))?(\d*))(?:;earmark=([^;]*))?(.*)', block.strip())
-            if match:
-                sym = match.group(1)
-                color = match.group(2) or '#000000'
-                name_ = match.group(3) or ''
-                texture = match.group(4) or ''
-                sun = match.group(5) or 'NA'
-                x = match.group(6)
-                threed = match.group(7)
-                y = match.group(8)
-                d = match.group(9)
-                h = match.group(10)
-                r = match.group(11) or '0.0'
-                t_str = match.group(12) or ''
-                o_str = match.group(13) or ''
-                val = match.group(14) or '0'
-                earmark = match.group(15) or 'Normal'
-                extra = match.group(16) or ''
-                title_card = 'ON' if '&' in extra else 'OFF'
-                props.append((sym, color, name_, texture, sun, x, threed, y, d, h, r, t_str, o_str, val, earmark, title_card))
-        return props
+            if column['compression'] == 'none':
+                # mapped copy-on-write: cells are paged in as they are read and edits never reach the file
+                columns[column['field']] = np.memmap(f, dtype=column['dtype'], mode='c', offset=column['offset'], shape=(height, width))
+                continue
+            f.seek(column['offset'])
+            data = zlib.decompress(f.read(column['length']))
+            columns[column['field']] = np.frombuffer(data, dtype=column['dtype']).reshape(height, width).copy()
+        for field in self.dtype.names:
+            if self.dtype.fields[field][0].kind == 'U':
+                tables[field] = StringTable.from_strings(self.dtype.fields[field][0].itemsize // 4, header['strings'][field])
+                if not isinstance(columns[field], ChunkedColumn):
+                    columns[field] = columns[field].astype(np.int32, copy=False)
+        return MapGrid(columns, tables)
+    def load_pbm(self, file, show=True):
+        try:
+            with open(file, 'rb') as f:
+                header = self.read_pbm_header(f)
+                grid = self.read_pbm_grid(f, header)
+        except (OSError, ValueError, KeyError, zlib.error) as e:
+            messagebox.showerror("Load Error", f"Could not load {os.path.basename(file)}: {e}", parent=self.root)
+            return
+        loaded = {'width': header['width'], 'height': header['height'], 'grid': grid, 'view': header['view'], 'arcs': header['attached_arcs']}
+        for key in ('sunrise', 'sunset', 'pin_at', 'pin_to'):
+            loaded[key] = tuple(header[key]) if header[key] else None
+        for key in ('openings', 'type', 'name', 'maker', 'system'):
+            loaded[key] = header[key]
+        loaded['cell_tints'] = {(x, y): name for x, y, name in header['cell_tints']}
+        self.attach_loaded_map(file, loaded, show)
     def load_mapd(self, file):
         with open(file, 'r') as f:
             lines = f.readlines()
@@ -4106,14 +5343,37 @@ class MapMaker:
                 names = re.findall(r'"(.*?)"', import_line)
                 dir_path = os.path.dirname(file)
                 map_dir = os.path.join(os.getcwd(), 'map')
+                map_files = []
                 for n in names:
-                    tmap_file = os.path.join(dir_path, n + '.tmap')
-                    if not os.path.exists(tmap_file):
-                        tmap_file = os.path.join(map_dir, n + '.tmap')
-                    if not os.path.exists(tmap_file):
-                        tmap_file = os.path.join(os.getcwd(), n + '.tmap')
-                    if os.path.exists(tmap_file):
-                        self.load_tmap(tmap_file)
+                    for folder in (dir_path, map_dir, os.getcwd()):
+                        # a .pbm next to the .tmap is used when it is at least as new, as it opens without parsing
+                        found = [os.path.join(folder, n + ext) for ext in ('.pbm', '.tmap') if os.path.exists(os.path.join(folder, n + ext))]
+                        if found:
+                            map_files.append(max(found, key=os.path.getmtime))
+                            break
+                # .tmap files are parsed side by side in worker processes, then every map gets a lazy
+                # tab here in import order; only the last one is built and drawn now
+                tmap_files = sorted({f for f in map_files if f.endswith('.tmap')})
+                parser = self.tmap_parser()
+                if len(tmap_files) > 1:
+                    with ProcessPoolExecutor(min(len(tmap_files), os.cpu_count() or 1)) as pool:
+                        parsed = dict(zip(tmap_files, pool.map(parser, tmap_files)))
+                else:
+                    parsed = {f: parser(f) for f in tmap_files}
+                shown = len(self.maps)
+                for map_file in map_files:
+                    if map_file.endswith('.pbm'):
+                        self.load_pbm(map_file, show=False)
+                    elif map_file in parsed:
+                        loaded = parsed.pop(map_file)
+                        if loaded:
+                            self.attach_loaded_map(map_file, loaded, show=False)
+                    else:
+                        # imported twice, so it gets a grid of its own
+                        self.load_tmap(map_file, show=False)
+                if len(self.maps) > shown:
+                    self.update_blending_sliders()
+                    self.show_loaded_map(len(self.maps) - 1)
             arc_lines = []
             connections_str = ''
             for line in lines[1:]:
@@ -4186,14 +5446,12 @@ class MapMaker:
             dir_path = os.getcwd()
             map_names = []
             for i, map_data in enumerate(self.maps):
-                var_dict = self.var_dicts[i]
                 base_name = map_data['name']
                 ext = '.tmap'
                 tmap_file = os.path.join(dir_path, base_name + ext)
                 tmap_path = self.get_next_path(tmap_file)
-                content = self._save_map_content(map_data, var_dict)
                 with open(tmap_path, 'w') as f:
-                    f.write(content)
+                    self.write_map_content(f, i)
                 saved_name = os.path.basename(tmap_path)[:-5]
                 map_names.append(saved_name)
             import_header = 'import {' + ', '.join(f'"{n}"' for n in map_names) + '}\n'
@@ -4223,151 +5481,276 @@ class MapMaker:
         self.on_close()
     def exit_without_save(self):
         self.root.destroy()
-    def redraw_canvas(self, index):
+    def redraw_canvas(self, index, affected=None, changed=True):
+        # affected: set of (y, x) cells changed since the last redraw; only their tiles get re-rasterized
+        # changed: False when only the view changed (zoom, colours, blend slider). Edits journal
+        # themselves with record_change; any other change is journalled here as it is redrawn.
+        state = self.render_states[index]
+        if changed and (state is None or state['version'] == self.map_version(self.maps[index])):
+            self.record_change(self.maps[index], affected)
+        self.invalidate_title_layout(self.maps[index], affected)
+        # tabs without widgets are drawn by build_tab when they are next shown
+        if self.canvases[index] is None:
+            return
+        if affected is not None and self.redraw_dirty_tiles(index, affected):
+            self.render_states[index]['version'] = self.maps[index]['version']
+            return
         canvas = self.canvases[index]
         map_data = self.maps[index]
         w = map_data['width']
         h = map_data['height']
         canvas.delete("all")
-        # Check if blending
-        blended_img = self.get_blended_image(index)
-        buf = BytesIO()
-        blended_img.save(buf, 'PNG')
-        buf.seek(0)
-        tk_img = tk.PhotoImage(data=buf.getvalue())
-        self.tk_imgs[index] = tk_img
-        canvas.create_image(0,0, image=tk_img, anchor='nw')
-        canvas.config(width=blended_img.width, height=blended_img.height + 40)
+        old_tiles = self.tk_imgs[index] or {}
+        state = self.make_render_state(map_data)
+        # Check if blending; a blended image is composited once and cut into tiles from there
+        if self.is_blended(index):
+            state['blended'] = self.get_blended_image(index)
+            state['image_size'] = state['blended'].size
+        else:
+            state['image_size'] = (w * self.cell_size + 2, h * self.cell_size + 2)
+        self.render_states[index] = state
+        self.tk_imgs[index] = {}
+        self.update_visible_tiles(index, {tile: tk_img for tile, (tk_img, item) in old_tiles.items()})
+        canvas.config(width=state['image_size'][0], height=state['image_size'][1] + 40)
         self.draw_attached_dots(index)
         # Re-draw selection if exists
-        if self.selected_regions and self.current_index == index:
-            self.selected_rects = []
-            for minx, miny, maxx, maxy in self.selected_regions:
-                for yy in range(miny, maxy):
-                    for xx in range(minx, maxx):
-                        rect_id = canvas.create_rectangle(xx * self.cell_size, yy * self.cell_size, (xx + 1) * self.cell_size, (yy + 1) * self.cell_size, outline=self.multi_selected_color, width=3, stipple='gray25')
-                        self.selected_rects.append(rect_id)
-    def get_map_image(self, index, opacity=1.0):
+        if self.selection and self.current_index == index:
+            self.draw_selection(canvas)
+    def on_canvas_view(self, canvas, scrollbar, first, last):
+        # scroll command of the map canvases: fires on every scroll, zoom and resize of the view
+        scrollbar.set(first, last)
+        if canvas in self.canvases:
+            self.update_visible_tiles(self.canvases.index(canvas))
+    def update_visible_tiles(self, index, reuse=None):
+        # Creates the view tiles that intersect the viewport, plus one tile around it, and drops
+        # those that have scrolled more than three tiles away, so redraw time and memory follow
+        # the window size instead of the map size. reuse: {(tx, ty): PhotoImage} to repaint in place
+        tiles = self.tk_imgs[index]
+        state = self.render_states[index]
+        if tiles is None or state is None:
+            return
+        canvas = self.canvases[index]
+        view_w = canvas.winfo_width() if canvas.winfo_width() > 1 else canvas.winfo_reqwidth()
+        view_h = canvas.winfo_height() if canvas.winfo_height() > 1 else canvas.winfo_reqheight()
+        left = canvas.canvasx(0)
+        top = canvas.canvasy(0)
+        span = self.view_tile_size * self.cell_size
+        img_w, img_h = state['image_size']
+        cols = max(1, (img_w - 2 + span - 1) // span)
+        rows = max(1, (img_h - 2 + span - 1) // span)
+        tx0, tx1 = int(left // span), int((left + view_w) // span)
+        ty0, ty1 = int(top // span), int((top + view_h) // span)
+        for tx, ty in list(tiles):
+            if not (tx0 - 3 <= tx <= tx1 + 3 and ty0 - 3 <= ty <= ty1 + 3):
+                canvas.delete(tiles.pop((tx, ty))[1])
+        for ty in range(max(0, ty0 - 1), min(rows, ty1 + 2)):
+            for tx in range(max(0, tx0 - 1), min(cols, tx1 + 2)):
+                if (tx, ty) not in tiles:
+                    tk_img = self.make_photo_image(self.render_view_tile(index, tx, ty), (reuse or {}).get((tx, ty)))
+                    item = canvas.create_image(tx * span, ty * span, image=tk_img, anchor='nw', tags='map_tile')
+                    # keep tiles under the dots, selection and hover outlines drawn on top of the map
+                    canvas.tag_lower(item)
+                    tiles[(tx, ty)] = (tk_img, item)
+    def render_view_tile(self, index, tx, ty):
+        # Tiles overlap their right/bottom neighbours by the 2px the map image is wider than its cells
+        state = self.render_states[index]
+        map_data = self.maps[index]
+        tile = self.view_tile_size
+        if 'blended' in state:
+            img_w, img_h = state['image_size']
+            span = tile * self.cell_size
+            return state['blended'].crop((tx * span, ty * span, min((tx + 1) * span + 2, img_w), min((ty + 1) * span + 2, img_h)))
+        x0, y0 = tx * tile, ty * tile
+        x1, y1 = min(x0 + tile, map_data['width']), min(y0 + tile, map_data['height'])
+        return self.render_map_region(map_data, x0, y0, x1, y1, state['diff_edges'])
+    def make_photo_image(self, img, photo=None):
+        # Hands raw pixels to Tk through ImageTk instead of a PNG encode/decode; a PhotoImage of the
+        # same size is overwritten in place
+        if photo is not None and (photo.width(), photo.height()) == img.size:
+            photo.paste(img)
+            return photo
+        return ImageTk.PhotoImage(img)
+    def make_render_state(self, map_data):
+        # tile_edges keeps the height edges of each dirty tile, so an edit recounts the tiles it
+        # touched instead of the map or a copy of its heights
+        tile_edges = self.tile_height_edges(map_data['grid'].columns['height'], self.dirty_tile_size)
+        return {
+            'version': self.map_version(map_data),
+            'cell_size': self.cell_size,
+            'size': (map_data['width'], map_data['height']),
+            'title_cards_hidden': self.title_cards_hidden,
+            'tile_edges': tile_edges,
+            'diff_edges': int(tile_edges.sum()),
+            'titles': self.get_title_layout(map_data),
+        }
+    def redraw_dirty_tiles(self, index, affected):
+        # Returns False when the change can't be patched in place and a full redraw is needed.
+        # View tiles that haven't been created yet need nothing; they render from the map later.
+        view_tiles = self.tk_imgs[index]
+        state = self.render_states[index]
         map_data = self.maps[index]
         w = map_data['width']
         h = map_data['height']
-        img = Image.new('RGBA', (w * self.cell_size + 2, h * self.cell_size + 2), (255, 255, 255, 0))
-        draw = ImageDraw.Draw(img)
-        # draw grid
-        line_width = 1
-        for i in range(w + 1):
-            draw.line([(i * self.cell_size + 1, 1), (i * self.cell_size + 1, h * self.cell_size + 1)], fill='gray', width=line_width)
-        for j in range(h + 1):
-            draw.line([(1, j * self.cell_size + 1), (w * self.cell_size + 1, j * self.cell_size + 1)], fill='gray', width=line_width)
-        # draw symbols
-        font_path = font_manager.findfont(font_manager.FontProperties(family='monospace'))
-        base_size = 12
-        if 11 <= self.cell_size <= 25:
-            font_size = base_size
-        else:
-            font_size = int(base_size * (self.cell_size / 20.0))
-        font = ImageFont.truetype(font_path, font_size)
-        for y in range(h):
-            for x in range(w):
-                cell = map_data['grid'][y, x]
-                color = cell['color'] if cell['color'] and cell['color'] != '' else '#000000'
-                # Apply tint
-                if cell['tint_color'] and cell['tint_color'] != '#000000':
-                    tint_img = Image.new('RGBA', (self.cell_size, self.cell_size), cell['tint_color'])
-                    tint_img.putalpha(int(cell['tint_opacity'] * 255))
-                    img.paste(tint_img, (x * self.cell_size + 1, y * self.cell_size + 1), tint_img)
-                # Draw symbol without white border
-                draw.text((x * self.cell_size + self.cell_size/2 + 1, y * self.cell_size + self.cell_size/2 + 1), cell['symbol'], fill=color, font=font, anchor="mm")
-        # sun and pin rects
-        if map_data['sunrise']:
-            rx, ry = map_data['sunrise']
-            draw.rectangle((rx * self.cell_size + 1, ry * self.cell_size + 1, (rx + 1) * self.cell_size + 1, (ry + 1) * self.cell_size + 1), outline='orange', width=2)
-        if map_data['sunset']:
-            sx, sy = map_data['sunset']
-            draw.rectangle((sx * self.cell_size + 1, sy * self.cell_size + 1, (sx + 1) * self.cell_size + 1, (sy + 1) * self.cell_size + 1), outline='red', width=2)
-        if map_data['pin_at']:
-            px, py = map_data['pin_at']
-            draw.rectangle((px * self.cell_size + 1, py * self.cell_size + 1, (px + 1) * self.cell_size + 1, (py + 1) * self.cell_size + 1), outline='blue', width=2)
-        if map_data['pin_to']:
-            px, py = map_data['pin_to']
-            draw.rectangle((px * self.cell_size + 1, py * self.cell_size + 1, (px + 1) * self.cell_size + 1, (py + 1) * self.cell_size + 1), outline='brown', width=2)
-        # title cards
-        self.draw_title_cards(draw, map_data, font)
-        # Height visualization and dither
-        self.draw_height_borders_and_dither(draw, map_data)
+        if view_tiles is None or state is None:
+            return False
+        if state['cell_size'] != self.cell_size or state['size'] != (w, h) or state['title_cards_hidden'] != self.title_cards_hidden:
+            return False
+        # Blending composites other maps
+        if self.is_blended(index):
+            return False
+        # Title boxes reach over many tiles, so any change to where they sit needs the whole image
+        if state['titles'] != self.get_title_layout(map_data):
+            return False
+        grid = map_data['grid']
+        tile = self.dirty_tile_size
+        tiles = set()
+        for y, x in affected:
+            if 0 <= x < w and 0 <= y < h:
+                tiles.add((x // tile, y // tile))
+        if not tiles:
+            return True
+        # Height edges are owned by the cell on their left/top, so tiles left of and above a
+        # dirty tile own edges that may have changed too
+        heights = grid.columns['height']
+        tile_edges = state['tile_edges']
+        edge_tiles = set(tiles)
+        for tx, ty in tiles:
+            if tx > 0:
+                edge_tiles.add((tx - 1, ty))
+            if ty > 0:
+                edge_tiles.add((tx, ty - 1))
+        delta = 0
+        for tx, ty in edge_tiles:
+            x0, y0 = tx * tile, ty * tile
+            count = self.count_height_edges(heights, x0, y0, min(x0 + tile, w), min(y0 + tile, h))
+            delta += count - int(tile_edges[ty, tx])
+            tile_edges[ty, tx] = count
+        # Border widths are whole pixels (at most 6), so the overcrowd factor only matters once it
+        # changes a rounded width; then every border on the map changes
+        old_factor = self.get_overcrowd_factor(w, h, state['diff_edges'])
+        state['diff_edges'] += delta
+        new_factor = self.get_overcrowd_factor(w, h, state['diff_edges'])
+        if any(int(t * old_factor) != int(t * new_factor) for t in range(1, 7)):
+            return False
+        for tx, ty in tiles:
+            x0, y0 = tx * tile, ty * tile
+            x1, y1 = min(x0 + tile, w), min(y0 + tile, h)
+            if not self.view_tiles_in(index, x0 * self.cell_size, y0 * self.cell_size, (x1 - x0) * self.cell_size + 2, (y1 - y0) * self.cell_size + 2):
+                continue
+            img = self.render_map_region(map_data, x0, y0, x1, y1, state['diff_edges'])
+            for tk_img, px, py, box in self.view_tiles_in(index, x0 * self.cell_size, y0 * self.cell_size, img.width, img.height):
+                self.blit_image(tk_img, img.crop(box), px, py)
+        return True
+    def view_tiles_in(self, index, x, y, width, height):
+        # Created view tiles overlapping the map-pixel rect (x, y, width, height), as
+        # (PhotoImage, x, y inside the tile, crop box of the rect) for each
+        tiles = self.tk_imgs[index]
+        img_w, img_h = self.render_states[index]['image_size']
+        span = self.view_tile_size * self.cell_size
+        found = []
+        for ty in range(max(0, y // span - 1), (y + height - 1) // span + 1):
+            for tx in range(max(0, x // span - 1), (x + width - 1) // span + 1):
+                if (tx, ty) not in tiles:
+                    continue
+                left, top = max(x, tx * span), max(y, ty * span)
+                right, bottom = min(x + width, (tx + 1) * span + 2, img_w), min(y + height, (ty + 1) * span + 2, img_h)
+                if left < right and top < bottom:
+                    found.append((tiles[(tx, ty)][0], left - tx * span, top - ty * span, (left - x, top - y, right - x, bottom - y)))
+        return found
+    def blit_image(self, tk_img, img, x, y):
+        patch = ImageTk.PhotoImage(img)
+        self.root.tk.call(str(tk_img), 'copy', str(patch), '-to', x, y, '-compositingrule', 'set')
+    def bump_version(self, map_data):
+        self.version_serial += 1
+        map_data['version'] = self.version_serial
+    def map_version(self, map_data):
+        if 'version' not in map_data:
+            self.bump_version(map_data)
+        return map_data['version']
+    def record_change(self, map_data, cells=None, fields=None):
+        # Bumps the map's version and journals the change as (version, previous version, cells,
+        # fields); cells is a set of (y, x) and fields a tuple of grid fields, None meaning all
+        previous = self.map_version(map_data)
+        self.bump_version(map_data)
+        if 'journal' not in map_data:
+            map_data['journal'] = deque(maxlen=self.journal_length)
+        map_data['journal'].append((map_data['version'], previous, frozenset(cells) if cells is not None else None, tuple(fields) if fields is not None else None))
+    def changes_since(self, map_data, version):
+        # Cells and fields changed after version, as (cells, fields) with None meaning all of them,
+        # or None when the journal no longer reaches back to version and a full pass is needed
+        if version == map_data.get('version'):
+            return set(), set()
+        cells, fields = set(), set()
+        for entry_version, previous, entry_cells, entry_fields in reversed(map_data.get('journal', ())):
+            if cells is not None:
+                cells = None if entry_cells is None else cells | entry_cells
+            if fields is not None:
+                fields = None if entry_fields is None else fields | set(entry_fields)
+            if previous == version:
+                return cells, fields
+        return None
+    def prune_render_caches(self):
+        live_maps = {id(m) for m in self.maps}
+        live_versions = {m.get('version') for m in self.maps}
+        for key in [k for k in self.layer_cache if k not in live_maps]:
+            del self.layer_cache[key]
+        for key in [k for k in self.blend_cache if k not in live_versions]:
+            del self.blend_cache[key]
+    def get_layer_image(self, index):
+        # Full-opacity image of a map for blending, cached until the zoom or the title-card
+        # visibility changes and patched from the journal after edits. The image is shared, so
+        # callers must not draw on it.
+        map_data = self.maps[index]
+        version = self.map_version(map_data)
+        key = (self.cell_size, self.title_cards_hidden, map_data['width'], map_data['height'])
+        cached = self.layer_cache.get(id(map_data))
+        if cached is None or cached['key'] != key or (cached['version'] != version and not self.patch_layer_image(map_data, cached)):
+            cached = {
+                'key': key,
+                'version': version,
+                'image': self.get_map_image(index),
+                'diff_edges': self.count_height_edges(map_data['grid']['height']),
+                'titles': self.get_title_layout(map_data),
+            }
+            self.layer_cache[id(map_data)] = cached
+            self.prune_render_caches()
+        return cached['image']
+    def patch_layer_image(self, map_data, cached):
+        # Re-renders the tiles of a cached layer that changed since it was rendered. Returns False
+        # when a full render is needed, on the same grounds as redraw_dirty_tiles
+        changes = self.changes_since(map_data, cached['version'])
+        if changes is None:
+            return False
+        cells, fields = changes
+        if fields is not None and not fields & self.render_fields:
+            cached['version'] = map_data['version']
+            return True
+        if cells is None:
+            return False
+        w = map_data['width']
+        h = map_data['height']
+        titles = self.get_title_layout(map_data)
+        diff_edges = self.count_height_edges(map_data['grid']['height'])
+        old_factor = self.get_overcrowd_factor(w, h, cached['diff_edges'])
+        new_factor = self.get_overcrowd_factor(w, h, diff_edges)
+        if titles != cached['titles'] or any(int(t * old_factor) != int(t * new_factor) for t in range(1, 7)):
+            return False
+        tile = self.dirty_tile_size
+        for tx, ty in {(x // tile, y // tile) for y, x in cells if 0 <= x < w and 0 <= y < h}:
+            x0, y0 = tx * tile, ty * tile
+            img = self.render_map_region(map_data, x0, y0, min(x0 + tile, w), min(y0 + tile, h), diff_edges)
+            cached['image'].paste(img, (x0 * self.cell_size, y0 * self.cell_size))
+        cached['version'] = map_data['version']
+        cached['diff_edges'] = diff_edges
+        return True
+    def get_map_image(self, index, opacity=1.0):
+        map_data = self.maps[index]
+        img = self.render_map_region(map_data, 0, 0, map_data['width'], map_data['height'])
         # apply opacity
         if opacity < 1.0:
             alpha = Image.new('L', img.size, int(255 * opacity))
             img.putalpha(alpha)
         return img
-    def draw_height_borders_and_dither(self, draw, map_data):
-        h = map_data['height']
-        w = map_data['width']
-        cell_size = self.cell_size
-        # Count number of diff edges for overcrowding
-        num_diff_edges = 0
-        for y in range(h):
-            for x in range(w):
-                if x + 1 < w and map_data['grid'][y, x]['height'] != map_data['grid'][y, x+1]['height']:
-                    num_diff_edges += 1
-                if y + 1 < h and map_data['grid'][y, x]['height'] != map_data['grid'][y+1, x]['height']:
-                    num_diff_edges += 1
-        # Calculate overcrowding factor
-        default_size = 48 * 24
-        default_limit = 9
-        limit = max(1, int((w * h / default_size) * default_limit))
-        if num_diff_edges > limit:
-            overcrowd_factor = limit / num_diff_edges * 0.8 # Reduce to 80% at max overcrowd
-        else:
-            overcrowd_factor = 1.0
-        # Draw lines between different heights
-        for y in range(h):
-            for x in range(w):
-                # Right neighbor
-                if x + 1 < w:
-                    h1 = map_data['grid'][y, x]['height']
-                    h2 = map_data['grid'][y, x+1]['height']
-                    if h1 != h2:
-                        diff = abs(h1 - h2)
-                        thickness, color = self.get_border_style(diff)
-                        thickness = int(thickness * overcrowd_factor)
-                        draw.line((((x+1) * cell_size + 1, y * cell_size + 1), ((x+1) * cell_size + 1, (y+1) * cell_size + 1)), fill=color, width=thickness)
-                # Bottom neighbor
-                if y + 1 < h:
-                    h1 = map_data['grid'][y, x]['height']
-                    h2 = map_data['grid'][y+1, x]['height']
-                    if h1 != h2:
-                        diff = abs(h1 - h2)
-                        thickness, color = self.get_border_style(diff)
-                        thickness = int(thickness * overcrowd_factor)
-                        draw.line(((x * cell_size + 1, (y+1) * cell_size + 1), ((x + 1) * cell_size + 1, (y+1) * cell_size + 1)), fill=color, width=thickness)
-    def get_border_style(self, diff):
-        # Adjusted based on user description
-        # Thinner for larger diff, thicker for smaller
-        # Base thickness from 1.6 for small diff, down to 1.1 for large
-        base_thick = 6 # max pixel thickness
-        min_thick_factor = 1.1
-        max_thick_factor = 1.6
-        # Normalize diff, assume max reasonable diff is 100 or something
-        norm_diff = min(diff / 100, 1.0)
-        # Thicker for small diff (low norm_diff), thinner for large
-        thick_factor = max_thick_factor - (max_thick_factor - min_thick_factor) * norm_diff
-        thickness = int(base_thick * thick_factor)
-        thickness = max(1, min(thickness, base_thick))
-        # Colors as per
-        if diff < 5:
-            color = 'purple' # jumpable
-        elif diff < 10:
-            color = 'blue' # double jump
-        elif diff < 20:
-            color = 'darkblue' # not jumpable
-        elif diff < 33:
-            color = 'orange' # injury possible
-        elif diff < 50:
-            color = 'brown' # death may happen
-        else:
-            color = 'red' # death will happen
-        return thickness, color
     def flood_fill_height(self, map_data, x, y, height, visited):
         h = map_data['height']
         w = map_data['width']
@@ -4397,56 +5780,29 @@ class MapMaker:
                 if map_data['grid'][ny, nx]['height'] != height1:
                     return True
         return False
-    def draw_title_cards(self, draw, map_data, font):
-        h = map_data['height']
-        w = map_data['width']
-        cell_size = self.cell_size
-        title_positions = []
-        for y in range(h):
-            for x in range(w):
-                cell = map_data['grid'][y, x]
-                if cell['title_card'] == 'ON':
-                    title_positions.append((x, y, cell['name']))
-        if not title_positions:
-            return
-        # Sort by x (left to right)
-        title_positions.sort(key=lambda p: p[0])
-        # Track bboxes
-        title_bboxes = []
-        margin = 2
-        title_font = ImageFont.truetype(font_manager.findfont(font_manager.FontProperties(family='serif')), int(cell_size * 0.6))
-        for x, y, name in title_positions:
-            if not name or self.title_cards_hidden:
-                # Purple outline
-                draw.rectangle((x * cell_size + 1, y * cell_size + 1, (x + 1) * cell_size + 1, (y + 1) * self.cell_size + 1), outline='purple', width=2)
-                continue
-            # Calculate initial position above cell
-            text_bbox = draw.textbbox((0,0), name, font=title_font)
-            text_w = text_bbox[2] - text_bbox[0]
-            text_h = text_bbox[3] - text_bbox[1]
-            title_x = x * cell_size + cell_size / 2 - text_w / 2 + 1
-            title_y = y * cell_size - text_h - margin + 1
-            proposed_bbox = (title_x, title_y, title_x + text_w, title_y + text_h)
-            # Check overlaps with previous titles and symbols
-            while (any(self.bboxes_overlap(proposed_bbox, (sx * cell_size + 1, sy * cell_size + 1, (sx + 1) * cell_size + 1, (sy + 1) * self.cell_size + 1)) for sx in range(w) for sy in range(h) if map_data['grid'][sy, sx]['symbol'] != ' ') or
-                any(self.bboxes_overlap(proposed_bbox, prev_bbox) for prev_bbox in title_bboxes)):
-                title_y -= text_h + margin
-                proposed_bbox = (title_x, title_y, title_x + text_w, title_y + text_h)
-            # Draw background box for pop-out
-            box_padding = 2
-            draw.rectangle((title_x - box_padding, title_y - box_padding, title_x + text_w + box_padding, title_y + text_h + box_padding), fill='white', outline='black')
-            # Draw text
-            draw.text((title_x, title_y), name, fill='black', font=title_font)
-            title_bboxes.append(proposed_bbox)
-    def bboxes_overlap(self, bbox1, bbox2):
-        return not (bbox1[2] < bbox2[0] or bbox1[0] > bbox2[2] or bbox1[3] < bbox2[1] or bbox1[1] > bbox2[3])
+    def is_blended(self, index):
+        # Blending composites whole-map images of this map and every map below it, so it is off while
+        # any of them is over chunked_cells cells
+        return index > 0 and self.blend_vars[index].get() > 0 and all(m['width'] * m['height'] <= self.chunked_cells for m in self.maps[:index + 1])
+    def on_blend_release(self, index):
+        if index > 0 and self.blend_vars[index].get() > 0 and not self.is_blended(index):
+            messagebox.showwarning("Map Too Large", f"Blending renders whole maps as one image, so it is off while this map or one below it has over {self.chunked_cells} cells.", parent=self.root)
+        self.redraw_canvas(index, changed=False)
     def get_blended_image(self, index):
-        if index == 0 or self.blend_vars[index].get() == 0:
-            return self.get_map_image(index, 1.0)
+        if not self.is_blended(index):
+            return self.get_layer_image(index)
+        # The stack up to each index is cached too; an edit to map k changes the key of every
+        # stack that includes it, i.e. indices >= k, and a slider move only re-alphas its layer
+        key = (self.cell_size, self.title_cards_hidden) + tuple((self.map_version(m), self.blend_vars[i].get(), m['pin_at'], m['pin_to']) for i, m in enumerate(self.maps[:index + 1]))
+        version = self.map_version(self.maps[index])
+        cached = self.blend_cache.get(version)
+        if cached and cached[0] == key:
+            return cached[1]
         value = self.blend_vars[index].get() / 100.0
         upper_opacity = 1 - value
         lower = self.get_blended_image(index - 1)
-        upper = self.get_map_image(index, upper_opacity)
+        upper = self.get_layer_image(index).copy()
+        upper.putalpha(int(255 * upper_opacity))
         # Align based on pins
         prev_map = self.maps[index - 1]
         curr_map = self.maps[index]
@@ -4462,10 +5818,13 @@ class MapMaker:
         base = Image.new('RGBA', (max_w, max_h), (255,255,255,255))
         base.paste(lower, (0,0), lower)
         base.paste(upper, (offset_x * self.cell_size, offset_y * self.cell_size), upper)
+        self.blend_cache[version] = (key, base)
         return base
     def center_canvas(self, index):
-        self.root.update_idletasks()
         canvas = self.canvases[index]
+        if canvas is None:
+            return
+        self.root.update_idletasks()
         view_w = canvas.winfo_width()
         view_h = canvas.winfo_height()
         if view_w > 1 and view_h > 1:
@@ -4476,52 +5835,64 @@ class MapMaker:
             y_frac = max(0, (total_h - view_h) / 2 / total_h)
             canvas.xview_moveto(x_frac)
             canvas.yview_moveto(y_frac)
-    def push_undo(self, is_full=False, affected=None):
+    def push_undo(self, is_full=False, affected=None, fields=None):
+        # fields: the grid fields the edit is about to change, None for all of them
         index = self.current_index
         grid = self.maps[index]['grid']
+        self.undo_history.clear(self.redo_stacks[index])
         if is_full:
-            self.undo_stacks[index].append(('full', np.copy(grid)))
+            self.undo_history.add(self.undo_stacks[index], ('full', grid.copy()))
+        else:
+            self.undo_history.add(self.undo_stacks[index], self.grid_delta(grid, affected, fields))
+    def grid_delta(self, grid, cells, fields=None):
+        # An undo entry holding the stored values of fields at cells: ('delta', ys, xs, {field: values})
+        # with int32 ys, xs and one array per field, so it is restored by one fancy-index write per
+        # field rather than record by record. cells is a set of (y, x) or a (ys, xs) pair of arrays.
+        if isinstance(cells, tuple):
+            ys, xs = cells
         else:
-            delta = {(y, x): grid[y, x].copy() for y, x in affected}
-            self.undo_stacks[index].append(('delta', delta))
-        if len(self.undo_stacks[index]) > 30:
-            self.undo_stacks[index].pop(0)
-        self.redo_stacks[index].clear()
+            ys, xs = np.array(list(cells), dtype=np.int32).reshape(-1, 2).T
+        return ('delta', ys, xs, {name: grid.columns[name][ys, xs] for name in (grid.columns if fields is None else fields)})
+    def apply_delta(self, index, item, stack):
+        # Writes an undo or redo delta back into map index, after putting the values it overwrites on stack
+        _, ys, xs, values = item
+        grid = self.maps[index]['grid']
+        self.undo_history.add(stack, self.grid_delta(grid, (ys, xs), values))
+        for name, column in values.items():
+            grid.columns[name][ys, xs] = column
+        cells = self.affected_cells(ys, xs)
+        self.record_change(self.maps[index], cells, tuple(values))
+        self.redraw_canvas(index, cells)
     def undo(self):
+        # a stroke still being drawn becomes its undo step first, so history isn't applied under it
+        self.end_stroke()
         index = self.current_index
         if self.undo_stacks[index]:
-            item = self.undo_stacks[index].pop()
+            item = self.undo_history.pop(self.undo_stacks[index])
             grid = self.maps[index]['grid']
             if item[0] == 'full':
-                current = ('full', np.copy(grid))
-                self.redo_stacks[index].append(current)
-                self.maps[index]['grid'] = item[1]
+                current = ('full', grid.copy())
+                self.undo_history.add(self.redo_stacks[index], current)
+                self.set_grid(index, item[1])
+                self.record_change(self.maps[index])
                 self.redraw_canvas(index)
             else:
-                delta = item[1]
-                current_delta = {(y, x): grid[y, x].copy() for y, x in delta}
-                self.redo_stacks[index].append(('delta', current_delta))
-                for (y, x), old in delta.items():
-                    grid[y, x] = old
-                self.redraw_canvas(index)
+                self.apply_delta(index, item, self.redo_stacks[index])
             self.update_edit_menu_states()
     def redo(self):
+        self.end_stroke()
         index = self.current_index
         if self.redo_stacks[index]:
-            item = self.redo_stacks[index].pop()
+            item = self.undo_history.pop(self.redo_stacks[index])
             grid = self.maps[index]['grid']
             if item[0] == 'full':
-                current = ('full', np.copy(grid))
-                self.undo_stacks[index].append(current)
-                self.maps[index]['grid'] = item[1]
+                current = ('full', grid.copy())
+                self.undo_history.add(self.undo_stacks[index], current)
+                self.set_grid(index, item[1])
+                self.record_change(self.maps[index])
                 self.redraw_canvas(index)
             else:
-                delta = item[1]
-                current_delta = {(y, x): grid[y, x].copy() for y, x in delta}
-                self.undo_stacks[index].append(('delta', current_delta))
-                for (y, x), new in delta.items():
-                    grid[y, x] = new
-                self.redraw_canvas(index)
+                self.apply_delta(index, item, self.undo_stacks[index])
             self.update_edit_menu_states()
     def cancel_action(self):
         if self.ongoing_action:
@@ -4563,11 +5934,11 @@ class MapMaker:
         self.update_toolbar_menu_states()
     def hide_title_cards(self):
         self.title_cards_hidden = True
-        self.redraw_canvas(self.current_index)
+        self.redraw_canvas(self.current_index, changed=False)
         self.update_title_menu_states()
     def show_title_cards(self):
         self.title_cards_hidden = False
-        self.redraw_canvas(self.current_index)
+        self.redraw_canvas(self.current_index, changed=False)
         self.update_title_menu_states()
     def map_picker(self):
         file = filedialog.askopenfilename(initialdir=self.last_dir['map_load'], filetypes=[("TMap files", "*.tmap"), ("MapD files", "*.mapd"), ("Text files", "*.txt")])
@@ -4589,18 +5960,43 @@ class MapMaker:
         vbar = tk.Scrollbar(preview_win, orient=tk.VERTICAL, command=canvas.yview)
         vbar.pack(side=tk.RIGHT, fill=tk.Y)
         canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        canvas.config(xscrollcommand=hbar.set, yscrollcommand=vbar.set)
         # Draw grid and symbols
         w = map_data['width']
         h = map_data['height']
-        for i in range(w + 1):
-            canvas.create_line(i * self.cell_size, 0, i * self.cell_size, h * self.cell_size + 40, fill='gray')
-        for j in range(h + 1):
-            canvas.create_line(0, j * self.cell_size, w * self.cell_size, j * self.cell_size, fill='gray')
-        for y in range(h):
-            for x in range(w):
-                cell = map_data['grid'][y, x]
-                canvas.create_text((x + 0.5) * self.cell_size, (y + 0.5) * self.cell_size, text=cell['symbol'], font=("Courier", 12), fill=cell['color'])
+        shown = None
+        view_job = None
+        def draw_view():
+            # grid lines and symbols of the cells in view only, read from the grid as one block, so
+            # big and memory-mapped maps are never read whole; redrawn as the view moves
+            nonlocal shown, view_job
+            view_job = None
+            if not canvas.winfo_exists():
+                return
+            cs = self.cell_size
+            x0 = min(max(int(canvas.canvasx(0) // cs), 0), w)
+            y0 = min(max(int(canvas.canvasy(0) // cs), 0), h)
+            x1 = min(max(int(canvas.canvasx(canvas.winfo_width()) // cs) + 1, 0), w)
+            y1 = min(max(int(canvas.canvasy(canvas.winfo_height()) // cs) + 1, 0), h)
+            if (x0, y0, x1, y1) == shown:
+                return
+            shown = (x0, y0, x1, y1)
+            canvas.delete('cells')
+            for i in range(x0, x1 + 1):
+                canvas.create_line(i * cs, y0 * cs, i * cs, y1 * cs + (40 if y1 == h else 0), fill='gray', tags='cells')
+            for j in range(y0, y1 + 1):
+                canvas.create_line(x0 * cs, j * cs, x1 * cs, j * cs, fill='gray', tags='cells')
+            block = map_data['grid'][y0:y1, x0:x1]
+            for k, (symbol, color) in enumerate(zip(block['symbol'].ravel().tolist(), block['color'].ravel().tolist())):
+                if symbol != ' ':
+                    y, x = divmod(k, x1 - x0)
+                    canvas.create_text((x0 + x + 0.5) * cs, (y0 + y + 0.5) * cs, text=symbol, font=("Courier", 12), fill=color, tags='cells')
+            canvas.tag_lower('cells')
+        def on_view(bar, first, last):
+            nonlocal view_job
+            bar.set(first, last)
+            if view_job is None:
+                view_job = preview_win.after_idle(draw_view)
+        canvas.config(xscrollcommand=lambda first, last: on_view(hbar, first, last), yscrollcommand=lambda first, last: on_view(vbar, first, last))
         # Simulate player
         player_id = canvas.create_oval(395, 295, 405, 305, fill='green') # Center dot
         direction = None
@@ -4716,16 +6112,18 @@ class MapMaker:
         # Calculate total size
         max_x = max(p[0] + self.maps[m]['width'] for m, p in positions.items())
         max_y = max(p[1] + self.maps[m]['height'] for m, p in positions.items())
+        if max_x * max_y > self.chunked_cells:
+            preview_win.destroy()
+            messagebox.showwarning("Map Too Large", f"The connected maps span {max_x}x{max_y} cells, over the {self.chunked_cells} that can be previewed as one image.", parent=self.root)
+            return
         # Create large image
         large_img = Image.new('RGBA', (max_x * self.cell_size, max_y * self.cell_size), (255,255,255,255))
         for m, (px, py, pz) in positions.items():
             map_img = self.get_map_image(m)
             large_img.paste(map_img, (px * self.cell_size, py * self.cell_size))
         # Display on canvas
-        buf = BytesIO()
-        large_img.save(buf, 'PNG')
-        buf.seek(0)
-        tk_img = tk.PhotoImage(data=buf.getvalue())
+        tk_img = ImageTk.PhotoImage(large_img)
+        canvas.image = tk_img # keep a reference, Tk drops the image once it's garbage collected
         canvas.create_image(0,0, image=tk_img, anchor='nw')
         canvas.config(scrollregion=(0,0, large_img.width, large_img.height))
         # Simulate player
@@ -4990,6 +6388,7 @@ class MapMaker:
         self.maps[self.current_index]['dirty'] = True
         self.redraw_canvas(self.current_index)
     def close_tab(self, index):
+        self.end_stroke()
         if len(self.maps) == 1:
             self.add_map_tab("Unnamed")
         map_data = self.maps[index]
@@ -4997,7 +6396,8 @@ class MapMaker:
             if messagebox.askyesno(f"Close {map_data['name']}", f"Save changes before closing, {self.user_name or 'User'}?", parent=self.root):
                 self.save_single_map(index)
         var_values = {k: v.get() for k, v in self.var_dicts[index].items()}
-        self.deleted_maps.append((index, copy.deepcopy(map_data), var_values, copy.deepcopy(self.undo_stacks[index]), copy.deepcopy(self.redo_stacks[index])))
+        self.deleted_maps.append((index, copy.deepcopy(map_data), var_values, self.undo_stacks[index], self.redo_stacks[index]))
+        self.release_tab(index)
         self.notebook.forget(index)
         del self.maps[index]
         del self.var_dicts[index]
@@ -5006,6 +6406,7 @@ class MapMaker:
         del self.undo_stacks[index]
         del self.redo_stacks[index]
         del self.tk_imgs[index]
+        del self.render_states[index]
         del self.blend_vars[index] # Remove the blend var for the deleted map
         if self.current_index >= len(self.maps):
             self.current_index -= 1
@@ -5021,13 +6422,11 @@ class MapMaker:
             self.generate_minimap()
     def save_single_map(self, index):
         map_data = self.maps[index]
-        var_dict = self.var_dicts[index]
         base_name = map_data['name']
         file = f"auto_close_{base_name}_{self.user_uuid or ''}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.tmap"
         path = self.get_next_path(file)
-        content = self._save_map_content(map_data, var_dict)
         with open(path, 'w') as f:
-            f.write(content)
+            self.write_map_content(f, index)
         map_data['dirty'] = False
     def undo_map_delete(self):
         if self.deleted_maps:
@@ -5037,111 +6436,14 @@ class MapMaker:
             self.redo_stacks.insert(pos, redo_stack)
             frame = tk.Frame(self.notebook)
             self.notebook.insert(pos, frame, text=map_data['name'])
-            # Rebuild header
-            header_frame = tk.Frame(frame)
-            header_frame.pack(fill=tk.X)
-            close_btn = tk.Button(header_frame, text='X', command=lambda f=frame: self.close_tab(self.notebook.index(f)))
-            close_btn.pack(side=tk.RIGHT)
-            openings_var = tk.StringVar(value=var_values['openings_var'])
-            openings_label = tk.Label(header_frame, text="Openings:")
-            openings_label.pack(side=tk.LEFT)
-            openings_entry = tk.Entry(header_frame, textvariable=openings_var, width=10)
-            openings_entry.pack(side=tk.LEFT)
-            openings_entry.bind("<FocusIn>", self.handle_entry_focus)
-            def show_openings_info():
-                messagebox.showinfo("Map Door & Openings", "Top, Right, Bottom, Left, inside1, inside2, inside3\n\n0 = N/A, 1 = opening, 2 = door, 3 = rope/hole/ladder, 4 = non-interactive door, 5 = waypoint", parent=self.root)
-            openings_label.bind("<Button-3>", lambda e: show_openings_info())
-            openings_entry.bind("<Button-3>", lambda e: show_openings_info())
-            def validate_openings(P):
-                return len(P) <=7 and all(c in '012345' for c in P)
-            vcmd_open = self.root.register(validate_openings)
-            openings_entry.config(validate='key', validatecommand=(vcmd_open, '%P'))
-            openings_entry.bind("<FocusIn>", lambda e: self.select_all(e))
-            openings_entry.bind("<FocusOut>", lambda e: self.on_openings_change(pos))
-            width_var = tk.IntVar(value=var_values['width_var'])
-            tk.Label(header_frame, text="Width:").pack(side=tk.LEFT)
-            width_entry = tk.Entry(header_frame, textvariable=width_var, width=5)
-            width_entry.pack(side=tk.LEFT)
-            def validate_size(P):
-                if P == '':
-                    return True
-                try:
-                    v = int(P)
-                    return 0 <= v <= 1080
-                except:
-                    return False
-            vcmd_size = self.root.register(validate_size)
-            width_entry.config(validate='key', validatecommand=(vcmd_size, '%P'))
-            width_entry.bind("<FocusIn>", self.handle_entry_focus)
-            height_var = tk.IntVar(value=var_values['height_var'])
-            tk.Label(header_frame, text="Height:").pack(side=tk.LEFT)
-            height_entry = tk.Entry(header_frame, textvariable=height_var, width=5)
-            height_entry.pack(side=tk.LEFT)
-            height_entry.config(validate='key', validatecommand=(vcmd_size, '%P'))
-            height_entry.bind("<FocusIn>", self.handle_entry_focus)
-            tk.Button(header_frame, text="Apply Size", command=lambda i=pos: self.apply_size(i)).pack(side=tk.LEFT)
-            type_var = tk.StringVar(value=var_values['type_var'])
-            tk.Label(header_frame, text="Type:").pack(side=tk.LEFT)
-            type_combo = ttk.Combobox(header_frame, textvariable=type_var, values=['Safe (S)', 'Crawl (C)', 'Fight (F)', 'Mix0 (C+C)', 'Mix1 (C+F)', 'Mix2 (S+F)', 'Mix3 (C+S)', 'Mixed (ANY)'], state='readonly', width=10)
-            type_combo.pack(side=tk.LEFT)
-            name_var = tk.StringVar(value=var_values['name_var'])
-            tk.Label(header_frame, text="Name:").pack(side=tk.LEFT)
-            name_entry = tk.Entry(header_frame, textvariable=name_var, width=15)
-            name_entry.pack(side=tk.LEFT)
-            def validate_len_28(P): return len(P) <= 28 or P == ''
-            vcmd_28 = self.root.register(validate_len_28)
-            name_entry.config(validate='key', validatecommand=(vcmd_28, '%P'))
-            name_entry.bind("<FocusIn>", self.handle_entry_focus)
-            name_entry.bind("<FocusOut>", lambda e: self.update_map_name(pos))
-            maker_var = tk.StringVar(value=var_values['maker_var'])
-            tk.Label(header_frame, text="Maker:").pack(side=tk.LEFT)
-            maker_entry = tk.Entry(header_frame, textvariable=maker_var, width=15)
-            maker_entry.pack(side=tk.LEFT)
-            def validate_len_21(P): return len(P) <= 21 or P == ''
-            vcmd_21 = self.root.register(validate_len_21)
-            maker_entry.config(validate='key', validatecommand=(vcmd_21, '%P'))
-            maker_entry.bind("<FocusIn>", self.handle_entry_focus)
-            tk.Label(header_frame, text=" " + map_data['system'] + " ").pack(side=tk.LEFT)
-            canvas_frame = tk.Frame(frame)
-            canvas_frame.pack(fill=tk.BOTH, expand=True)
-            canvas = tk.Canvas(canvas_frame, width=map_data['width'] * self.cell_size, height=map_data['height'] * self.cell_size + 40)
-            hbar = tk.Scrollbar(canvas_frame, orient=tk.HORIZONTAL, command=canvas.xview)
-            hbar.pack(side=tk.BOTTOM, fill=tk.X)
-            vbar = tk.Scrollbar(canvas_frame, orient=tk.VERTICAL, command=canvas.yview)
-            vbar.pack(side=tk.RIGHT, fill=tk.Y)
-            zoom_slider = tk.Scale(canvas_frame, orient=tk.VERTICAL, from_=5, to=50, resolution=1, command=self.on_zoom)
-            zoom_slider.set(self.cell_size)
-            zoom_slider.pack(side=tk.RIGHT, fill=tk.Y)
-            canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-            canvas.config(xscrollcommand=hbar.set, yscrollcommand=vbar.set)
-            self.canvases.insert(pos, canvas)
+            self.canvases.insert(pos, None)
             self.tk_imgs.insert(pos, None)
-            self.zoom_sliders.insert(pos, zoom_slider)
-            canvas.bind("<Button-1>", self.on_canvas_click)
-            canvas.bind("<B1-Motion>", self.on_canvas_motion)
-            canvas.bind("<ButtonRelease-1>", self.on_canvas_release)
-            canvas.bind("<Button-3>", self.handle_right_click)
-            canvas.bind("<Control-Return>", self.handle_keyboard_right_click)
-            canvas.bind("<Enter>", lambda e: canvas.focus_set())
-            canvas.bind("<Motion>", self.on_canvas_motion_hover)
-            self.bind_scrolls(canvas)
-            self.focusable_sections.insert(pos, canvas)
+            self.render_states.insert(pos, None)
+            self.zoom_sliders.insert(pos, None)
+            self.var_dicts.insert(pos, {key: (tk.IntVar if key in ('width_var', 'height_var') else tk.StringVar)(value=value) for key, value in var_values.items()})
             self.blend_vars.insert(pos, tk.IntVar(value=0)) # Insert new blend var at position
             self.update_blending_sliders()
-            self.redraw_canvas(pos)
-            self.draw_attached_dots(pos)
-            self.center_canvas(pos)
-            self.apply_fg_to_widget(header_frame)
-            self.apply_fg_to_widget(canvas_frame)
-            self.apply_fg_to_widget(zoom_slider)
-            self.var_dicts.insert(pos, {
-                'openings_var': openings_var,
-                'width_var': width_var,
-                'height_var': height_var,
-                'type_var': type_var,
-                'name_var': name_var,
-                'maker_var': maker_var
-            })
+            self.build_tab(pos)
             self.update_edit_menu_states()
             self.set_dirty()
     def set_dirty(self):
@@ -5152,17 +6454,22 @@ class MapMaker:
         if file:
             filename = os.path.basename(file)
             self.prop_texture_var.set(filename)
+    def imageable_maps(self, indices, action):
+        # The maps of indices small enough to render as one image; the others are named in a warning
+        # and left out of action
+        too_big = [i for i in indices if self.maps[i]['width'] * self.maps[i]['height'] > self.chunked_cells]
+        if too_big:
+            names = ', '.join(self.maps[i]['name'] for i in too_big)
+            messagebox.showwarning("Map Too Large", f"{action} skips maps of over {self.chunked_cells} cells, which are too big to render as one image: {names}", parent=self.root)
+        return [i for i in indices if i not in too_big]
     def export_all_maps_png(self):
-        self.root.config(cursor='watch')
-        try:
-            for i in range(len(self.maps)):
-                map_data = self.maps[i]
-                file = map_data['name'] + '.png'
-                path = self.get_next_path(file)
-                self.export_map_png(i, path)
-        finally:
-            self.root.config(cursor='')
+        for index, data in self.rendered_pngs(self.imageable_maps(range(len(self.maps)), "PNG export"), "Exporting PNGs"):
+            path = self.get_next_path(self.maps[index]['name'] + '.png')
+            with open(path, 'wb') as f:
+                f.write(data)
     def export_current_map_png(self):
+        if not self.imageable_maps([self.current_index], "PNG export"):
+            return
         self.root.config(cursor='watch')
         try:
             map_data = self.maps[self.current_index]
@@ -5172,36 +6479,58 @@ class MapMaker:
         finally:
             self.root.config(cursor='')
     def export_map_png(self, index, path_or_buf):
-        img = self.get_map_image(index)
-        # Add footer
-        footer_height = 30
-        new_img = Image.new('RGBA', (img.width, img.height + footer_height), (255,255,255,255))
-        new_img.paste(img, (0,0))
-        draw = ImageDraw.Draw(new_img)
-        font = ImageFont.truetype(font_manager.findfont(font_manager.FontProperties(family='serif')), 12)
-        map_data = self.maps[index]
-        title = map_data['name']
-        date_code = datetime.now().strftime('%d%m%Y-%H%M%S')
-        arcs_count = len(map_data['attached_arcs'])
-        arcs_text = f"Connected Arcs: {arcs_count}" if arcs_count > 0 else ""
-        # Bottom-left: Title
-        draw.text((10, img.height + 5), title, fill='black', font=font)
-        # Center: Date Code
-        text_width = draw.textbbox((0,0), date_code, font=font)[2]
-        draw.text(( (new_img.width - text_width) / 2, img.height + 5), date_code, fill='black', font=font)
-        # Bottom-right: Arcs
-        if arcs_text:
-            text_width = draw.textbbox((0,0), arcs_text, font=font)[2]
-            draw.text((new_img.width - text_width - 10, img.height + 5), arcs_text, fill='black', font=font)
+        data = self.render_png(self.maps[index], datetime.now().strftime('%d%m%Y-%H%M%S'))
         if isinstance(path_or_buf, str):
-            new_img.save(path_or_buf)
+            with open(path_or_buf, 'wb') as f:
+                f.write(data)
         else:
-            new_img.save(path_or_buf, 'PNG')
+            path_or_buf.write(data)
+    def export_png_job(self, index):
+        # The part of a map render_png reads, to be pickled for a worker process
+        map_data = self.maps[index]
+        return {key: map_data[key] for key in ('name', 'width', 'height', 'grid', 'sunrise', 'sunset', 'pin_at', 'pin_to', 'attached_arcs')}
+    def rendered_pngs(self, indices, title):
+        # Yields (index, PNG bytes) for the maps in indices as worker processes finish them, in
+        # whatever order that is. A progress window with a Cancel button stays up meanwhile; after
+        # a cancel the remaining maps are dropped, so callers see fewer than len(indices) results.
+        indices = list(indices)
+        if not indices:
+            return
+        renderer = MapRenderer(self.symbols, self.cell_size, self.title_cards_hidden)
+        date_code = datetime.now().strftime('%d%m%Y-%H%M%S')
+        cancelled = []
+        win = tk.Toplevel(self.root)
+        win.title(title)
+        win.transient(self.root)
+        label = tk.Label(win, text=f"Rendered 0 of {len(indices)} maps")
+        label.pack(padx=20, pady=(20, 5))
+        progress = ttk.Progressbar(win, maximum=len(indices), length=240)
+        progress.pack(padx=20, pady=5)
+        tk.Button(win, text="Cancel", command=lambda: cancelled.append(True)).pack(pady=(5, 20))
+        win.protocol("WM_DELETE_WINDOW", lambda: cancelled.append(True))
+        self.apply_fg_to_widget(win)
+        win.grab_set()
+        pool = ProcessPoolExecutor(min(len(indices), os.cpu_count() or 1))
+        try:
+            pending = {pool.submit(renderer.render_png, self.export_png_job(i), date_code): i for i in indices}
+            while pending and not cancelled:
+                done, _ = wait(pending, timeout=0.05, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = pending.pop(future)
+                    yield index, future.result()
+                    progress['value'] = len(indices) - len(pending)
+                    label.config(text=f"Rendered {len(indices) - len(pending)} of {len(indices)} maps")
+                    if cancelled:
+                        break
+                self.root.update()
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+            win.grab_release()
+            win.destroy()
     def export_separated_txt(self):
         self.root.config(cursor='watch')
         try:
             map_data = self.maps[self.current_index]
-            var_dict = self.var_dicts[self.current_index]
             base_name = map_data['name']
             grid_file = f"ptxt_{base_name}.txt"
             hf_file = f"{base_name}.txt"
@@ -5212,55 +6541,12 @@ class MapMaker:
                 grid_path = f"ptxt_{base_name}{i}.txt"
                 hf_path = f"{base_name}{i}.txt"
                 i += 1
-            openings = var_dict['openings_var'].get().ljust(7, '0')
-            map_type = var_dict['type_var'].get()
-            name = var_dict['name_var'].get()
-            maker = var_dict['maker_var'].get()
-            system = map_data['system']
-            header = f"{openings} {map_data['width']}x{map_data['height']}"
-            sunrise_str = ''
-            if map_data['sunrise'] and map_data['sunset']:
-                sunrise_str = f" sunrise xy({map_data['sunrise'][0]},{map_data['sunrise'][1]}); sunset xy({map_data['sunset'][0]},{map_data['sunset'][1]})"
-            pin_str = ''
-            if map_data['pin_at']:
-                pin_str += f" Pin At({map_data['pin_at'][0]},{map_data['pin_at'][1]})"
-            if map_data['pin_to']:
-                pin_str += f" Pin To({map_data['pin_to'][0]},{map_data['pin_to'][1]})"
-            header += sunrise_str + pin_str
-            map_str = '\n'.join(''.join(cell['symbol'] for cell in row) for row in map_data['grid'])
-            footer = f"{map_type}; {name}; {maker}; {system}"
-            props = [
-                f'{cell["symbol"]}[\"{cell["color"]}\";\"{cell["name"]}\";\"{cell["texture"]}\";{cell["sun"] if cell["sun"] != "NA" else ""}({x},{cell["3d"]},{y},{cell["depth"]},{cell["height"]},{cell["range"]}){t_str}{o_str}{cell["value"]}{ear_str}{title_str}]'
-                for y in range(map_data['height'])
-                for x in range(map_data['width'])
-                for cell in [map_data['grid'][y, x]]
-                for t_str in [ '+t({},{})'.format(x, y) if (x, y) == map_data['pin_at'] else '' ]
-                for o_str in [ '+o({},{})'.format(x, y) if (x, y) == map_data['pin_to'] else '' ]
-                for ear_str in [ f';earmark={cell["earmark"]}' if cell["earmark"] != "Normal" else '' ]
-                for title_str in [ '&' if cell["title_card"] == "ON" else '' ]
-                if not (cell['symbol'] == ' ' and cell['color'] == '#000000' and cell['texture'] == '' and cell['name'] == '' and cell['value'] == 0 and cell['depth'] == 1 and cell['height'] == 0 and cell['3d'] == 0 and cell['range'] == 0.0 and cell['sun'] == 'NA' and cell['earmark'] == 'Normal' and cell['title_card'] == 'OFF' and t_str == '' and o_str == '')
-            ]
-            props_str = ' mapc[!] ' + ' '.join(props) if props else ''
-            arcs_str = ''
-            if map_data['attached_arcs']:
-                for a in map_data['attached_arcs']:
-                    a['start_msg'] = "***" + a['start_msg'] + "***" if a['start_msg'] != "Start Message" else ""
-                    a['confirm_msg'] = "***" + a['confirm_msg'] + "***" if a['confirm_msg'] != "Confirm Message" else ""
-                arc_lines = ['||'.join([a[k] for k in ['name', 'estimated', 'zone_type', 'start_msg', 'map', 'arc_data', 'confirm_msg']]) for a in map_data['attached_arcs']]
-                arcs_str = ';arcs::' + ';'.join(arc_lines)
-            # section_colors
-            section_colors = []
-            for y in range(map_data['height']):
-                for x in range(map_data['width']):
-                    cell = map_data['grid'][y, x]
-                    if cell['tint_color']:
-                        tint_str = map_data['cell_tints'][(x, y)] if (x, y) in map_data['cell_tints'] else cell['tint_color']
-                        section_colors.append(f"{tint_str},{cell['tint_opacity']}[{x},{y}]")
-            section_colors_str = 'section_colors:' + '; '.join(section_colors) + ' [end-section]' if section_colors else ''
+            encoding = self.encode_map(self.current_index)
             with open(grid_path, 'w') as f:
-                f.write(map_str)
+                f.writelines(encoding['rows'])
             with open(hf_path, 'w') as f:
-                f.write(header + '\n\n' + footer + props_str + arcs_str + section_colors_str)
+                f.write(encoding['size'] + encoding['position'] + '\n\n')
+                f.writelines(encoding['footer'])
         finally:
             self.root.config(cursor='')
     def export_all_arcs_csv(self):
@@ -5305,80 +6591,35 @@ class MapMaker:
         if not hasattr(path_or_buf, 'write'):
             f.close()
     def export_full_dict(self):
-        self.root.config(cursor='watch')
-        try:
-            unique = datetime.now().strftime('%Y%m%d%H%M%S%f')[:-3]
-            zip_file = f'PB_dict_{unique}.zip'
-            path = self.get_next_path(zip_file)
-            with zipfile.ZipFile(path, 'w') as zf:
-                for i, map_data in enumerate(self.maps):
-                    base_name = map_data['name']
-                    png_buf = BytesIO()
-                    self.export_map_png(i, png_buf)
-                    png_buf.seek(0)
-                    zf.writestr(f'map/{base_name}.png', png_buf.read())
-                    var_dict = self.var_dicts[i]
-                    openings = var_dict['openings_var'].get().ljust(7, '0')
-                    map_type = var_dict['type_var'].get()
-                    name = var_dict['name_var'].get()
-                    maker = var_dict['maker_var'].get()
-                    system = map_data['system']
-                    header = f"{openings} {map_data['width']}x{map_data['height']}"
-                    sunrise_str = ''
-                    if map_data['sunrise'] and map_data['sunset']:
-                        sunrise_str = f" sunrise xy({map_data['sunrise'][0]},{map_data['sunrise'][1]}); sunset xy({map_data['sunset'][0]},{map_data['sunset'][1]})"
-                    pin_str = ''
-                    if map_data['pin_at']:
-                        pin_str += f" Pin At({map_data['pin_at'][0]},{map_data['pin_at'][1]})"
-                    if map_data['pin_to']:
-                        pin_str += f" Pin To({map_data['pin_to'][0]},{map_data['pin_to'][1]})"
-                    header += sunrise_str + pin_str
-                    footer = f"{map_type}; {name}; {maker}; {system}"
-                    props = [
-                        f'{cell["symbol"]}[\"{cell["color"]}\";\"{cell["name"]}\";\"{cell["texture"]}\";{cell["sun"] if cell["sun"] != "NA" else ""}({x},{cell["3d"]},{y},{cell["depth"]},{cell["height"]},{cell["range"]}){t_str}{o_str}{cell["value"]}{ear_str}{title_str}]'
-                        for y in range(map_data['height'])
-                        for x in range(map_data['width'])
-                        for cell in [map_data['grid'][y, x]]
-                        for t_str in [ '+t({},{})'.format(x, y) if (x, y) == map_data['pin_at'] else '' ]
-                        for o_str in [ '+o({},{})'.format(x, y) if (x, y) == map_data['pin_to'] else '' ]
-                        for ear_str in [ f';earmark={cell["earmark"]}' if cell["earmark"] != "Normal" else '' ]
-                        for title_str in [ '&' if cell["title_card"] == "ON" else '' ]
-                        if not (cell['symbol'] == ' ' and cell['color'] == '#000000' and cell['texture'] == '' and cell['name'] == '' and cell['value'] == 0 and cell['depth'] == 1 and cell['height'] == 0 and cell['3d'] == 0 and cell['range'] == 0.0 and cell['sun'] == 'NA' and cell['earmark'] == 'Normal' and cell['title_card'] == 'OFF' and t_str == '' and o_str == '')
-                    ]
-                    props_str = ' mapc[!] ' + ' '.join(props) if props else ''
-                    arcs_str = ''
-                    if map_data['attached_arcs']:
-                        arc_lines = []
-                        for a in map_data['attached_arcs']:
-                            a_copy = copy.deepcopy(a)
-                            a_copy['start_msg'] = "***" + a_copy['start_msg'] + "***" if a_copy['start_msg'] != "Start Message" else ""
-                            a_copy['confirm_msg'] = "***" + a_copy['confirm_msg'] + "***" if a_copy['confirm_msg'] != "Confirm Message" else ""
-                            arc_line = '||'.join([a_copy[k] for k in ['name', 'estimated', 'zone_type', 'start_msg', 'map', 'arc_data', 'confirm_msg']])
-                            arc_lines.append(arc_line)
-                        arcs_str = ';arcs::' + ';'.join(arc_lines)
-                    # section_colors
-                    section_colors = []
-                    for y in range(map_data['height']):
-                        for x in range(map_data['width']):
-                            cell = map_data['grid'][y, x]
-                            if cell['tint_color']:
-                                tint_str = map_data['cell_tints'][(x, y)] if (x, y) in map_data['cell_tints'] else cell['tint_color']
-                                section_colors.append(f"{tint_str},{cell['tint_opacity']}[{x},{y}]")
-                    section_colors_str = 'section_colors:' + '; '.join(section_colors) + ' [end-section]' if section_colors else ''
-                    txt_content = header + '\n' + footer + props_str + arcs_str + section_colors_str
-                    zf.writestr(f'map/{base_name}.txt', txt_content)
-                csv_buf = StringIO()
-                fields = ['name', 'estimated', 'zone_type', 'start_msg', 'map', 'arc_data', 'confirm_msg']
-                writer = csv.writer(csv_buf)
-                writer.writerow(fields)
-                for arc in self.arcs:
-                    arc['start_msg'] = "***" + arc['start_msg'] + "***" if arc['start_msg'] != "Start Message" else ""
-                    arc['confirm_msg'] = "***" + arc['confirm_msg'] + "***" if arc['confirm_msg'] != "Confirm Message" else ""
-                    writer.writerow([arc[k] for k in fields])
-                csv_buf.seek(0)
-                zf.writestr('arc/arcs.csv', csv_buf.getvalue())
-        finally:
-            self.root.config(cursor='')
+        unique = datetime.now().strftime('%Y%m%d%H%M%S%f')[:-3]
+        zip_file = f'PB_dict_{unique}.zip'
+        path = self.get_next_path(zip_file)
+        with zipfile.ZipFile(path, 'w') as zf:
+            # each map goes into the zip as soon as its PNG is rendered
+            written = 0
+            indices = self.imageable_maps(range(len(self.maps)), "Dictionary export")
+            for i, png in self.rendered_pngs(indices, "Exporting Dictionary"):
+                written += 1
+                base_name = self.maps[i]['name']
+                zf.writestr(f'map/{base_name}.png', png)
+                encoding = self.encode_map(i)
+                with zf.open(f'map/{base_name}.txt', 'w') as txt:
+                    txt.write((encoding['size'] + encoding['position'] + '\n').encode('utf-8'))
+                    for chunk in encoding['footer']:
+                        txt.write(chunk.encode('utf-8'))
+            csv_buf = StringIO()
+            fields = ['name', 'estimated', 'zone_type', 'start_msg', 'map', 'arc_data', 'confirm_msg']
+            writer = csv.writer(csv_buf)
+            writer.writerow(fields)
+            for arc in self.arcs:
+                arc['start_msg'] = "***" + arc['start_msg'] + "***" if arc['start_msg'] != "Start Message" else ""
+                arc['confirm_msg'] = "***" + arc['confirm_msg'] + "***" if arc['confirm_msg'] != "Confirm Message" else ""
+                writer.writerow([arc[k] for k in fields])
+            csv_buf.seek(0)
+            zf.writestr('arc/arcs.csv', csv_buf.getvalue())
+        # a cancelled export leaves no partial zip behind
+        if written < len(indices):
+            os.remove(path)
     def update_blending_sliders(self):
         for widget in self.blending_frame.winfo_children():
             widget.destroy()
@@ -5386,7 +6627,7 @@ class MapMaker:
         for i in range(len(self.maps)):
             slider = tk.Scale(self.blending_frame, orient=tk.HORIZONTAL, from_=0, to=97, resolution=1, label=f"Blend Map {i+1}", length=50, variable=self.blend_vars[i])
             slider.pack(side=tk.LEFT)
-            slider.bind("<ButtonRelease-1>", lambda e, idx=i: self.redraw_canvas(idx))
+            slider.bind("<ButtonRelease-1>", lambda e, idx=i: self.on_blend_release(idx))
             self.blending_sliders.append(slider)
         self.apply_fg_to_widget(self.blending_frame)
     def update_map_name(self, index):
@@ -5435,7 +6676,7 @@ class MapMaker:
             self.paint_canvas.pack_forget()
             self.drawers_frame.update_idletasks()
             self.right_frame.update_idletasks()
-            if self.selected_x is not None or self.selected_regions:
+            if self.selected_x is not None or self.selection:
                 self.color_vscroll.pack_forget()
                 self.color_canvas.pack_forget()
                 self.property_vscroll.pack(side=tk.LEFT, fill=tk.Y)
@@ -5479,19 +6720,17 @@ class MapMaker:
         self.paint_decolor_var.set(False)
         self.update_paint_preview()
     def update_paint_preview(self, *args):
-        if self.selected_regions:
+        if self.selection:
             if self.paint_decolor_var.get():
                 color = '#000000'
                 opacity = 0.0
             else:
                 color = f'#{self.paint_r_var.get():02x}{self.paint_g_var.get():02x}{self.paint_b_var.get():02x}'
                 opacity = self.paint_opacity_var.get() / 100.0
-            for minx, miny, maxx, maxy in self.selected_regions:
-                for y in range(miny, maxy):
-                    for x in range(minx, maxx):
-                        self.maps[self.current_index]['grid'][y, x]['tint_color'] = color
-                        self.maps[self.current_index]['grid'][y, x]['tint_opacity'] = opacity
-            self.redraw_canvas(self.current_index)
+            ys, xs, affected = self.selection_cells()
+            self.maps[self.current_index]['grid'].fill((ys, xs), {'tint_color': color, 'tint_opacity': opacity})
+            self.record_change(self.maps[self.current_index], affected, ('tint_color', 'tint_opacity'))
+            self.redraw_canvas(self.current_index, affected)
     def store_color_name(self):
         name = self.paint_name_var.get()
         if not name:
@@ -5529,12 +6768,10 @@ class MapMaker:
             self.paint_opacity_var.set(int(opacity * 100))
             self.update_paint_preview()
     def apply_paint_tint(self):
-        if self.selected_regions:
-            affected = set()
+        if self.selection:
             map_data = self.maps[self.current_index]
-            for minx, miny, maxx, maxy in self.selected_regions:
-                affected.update({(y, x) for y in range(miny, maxy) for x in range(minx, maxx)})
-            self.push_undo(False, affected)
+            ys, xs, affected = self.selection_cells()
+            self.push_undo(False, (ys, xs), ('tint_color', 'tint_opacity'))
             name = self.paint_name_var.get()
             if not name:
                 name = f"unnamed {self.paint_unnamed_count}"
@@ -5545,16 +6782,18 @@ class MapMaker:
                 messagebox.showwarning("Duplicate Name", "Color name already exists. Choose a different name.", parent=self.root)
                 return
             self.named_colors[name] = (color, opacity)
-            for minx, miny, maxx, maxy in self.selected_regions:
-                for y in range(miny, maxy):
-                    for x in range(minx, maxx):
-                        map_data['grid'][y, x]['tint_color'] = color
-                        map_data['grid'][y, x]['tint_opacity'] = opacity
-                        map_data['cell_tints'][(x, y)] = name
-            self.redraw_canvas(self.current_index)
+            map_data['grid'].fill((ys, xs), {'tint_color': color, 'tint_opacity': opacity})
+            self.name_cell_tints(map_data, ys, xs, name)
+            self.record_change(map_data, affected, ('tint_color', 'tint_opacity'))
+            self.redraw_canvas(self.current_index, affected)
             self.set_dirty()
             map_data['dirty'] = True
             self.update_paint_list()
+    def name_cell_tints(self, map_data, ys, xs, name):
+        # Gives the tints of cells (ys, xs) a name in the map's cell_tints, which the section_colors
+        # footer writes in place of the colour; counted so encode_map's cache sees the edit
+        map_data['cell_tints'].update(dict.fromkeys(zip(xs.tolist(), ys.tolist()), name))
+        map_data['cell_tints_version'] = map_data.get('cell_tints_version', 0) + 1
     def load_named_colors(self):
         # Load from udata
         pass # Already loaded in __init__